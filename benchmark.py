@@ -0,0 +1,1364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks de rendimiento para mapa_interactivo.py
+Uso: python benchmark.py [--tamaños 2000 50000 500000]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import folium
+from folium.plugins import FastMarkerCluster, MarkerCluster
+import numpy as np
+import pandas as pd
+import requests
+
+import mapa_interactivo as mi
+
+# Bytes máximos por punto permitidos en el modo de salida "geojson"
+PRESUPUESTO_BYTES_POR_PUNTO = 250
+
+
+def generar_terremotos(n, semilla=42):
+    """
+    Genera un DataFrame sintético con el mismo esquema que obtener_datos_api("terremotos").
+    """
+    rng = np.random.default_rng(semilla)
+    inicio = pd.Timestamp('2025-11-04')
+    minutos = np.sort(rng.integers(0, 30 * 24 * 60, n))
+    
+    # La sismicidad se concentra en zonas activas: 80% alrededor de 40 focos, 20% dispersa
+    focos_lat, focos_lon = rng.uniform(-55, 60, 40), rng.uniform(-180, 180, 40)
+    foco = rng.integers(0, 40, n)
+    agrupado = rng.random(n) < 0.8
+    lat = np.where(agrupado, focos_lat[foco] + rng.normal(0, 1.5, n), rng.uniform(-60, 60, n))
+    lon = np.where(agrupado, focos_lon[foco] + rng.normal(0, 1.5, n), rng.uniform(-180, 180, n))
+    lat, lon = np.clip(lat, -89.9, 89.9), (lon + 180) % 360 - 180
+    
+    return pd.DataFrame({
+        'magnitud': np.round(np.clip(rng.gamma(2.0, 0.8, n) + 2.0, 2.0, 9.5), 2),
+        'lugar': [f"{k} km W of Lugar {k % 97}" for k in rng.integers(1, 200, n)],
+        'lat': lat,
+        'lon': lon,
+        'profundidad': np.round(rng.exponential(30, n), 2),
+        'fecha': (inicio + pd.to_timedelta(minutos, unit='m')).strftime('%Y-%m-%d %H:%M'),
+        'tipo': 'Terremoto'
+    })
+
+
+def escribir_feed_usgs(n, destino, semilla=42, bloque=10000):
+    """
+    Escribe en el archivo binario destino un GeoJSON sintético con la estructura completa
+    del feed all_month de USGS. Se serializa por bloques para poder generar feeds de
+    millones de eventos sin tenerlos todos en memoria como dicts.
+    """
+    df = generar_terremotos(n, semilla)
+    rng = np.random.default_rng(semilla)
+    tiempos = ((pd.to_datetime(df['fecha']) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).to_numpy()
+    # Una parte de los eventos sin magnitud o por debajo del umbral, como en el feed real
+    magnitudes = np.where(rng.random(n) < 0.6, np.round(rng.uniform(-0.5, 2.0, n), 2), df['magnitud'])
+    
+    destino.write(json.dumps({
+        'type': 'FeatureCollection',
+        'metadata': {'generated': 0, 'url': 'sintetico', 'title': 'USGS All Earthquakes, Past Month',
+                     'status': 200, 'api': '1.14.1', 'count': n}
+    }, separators=(',', ':'))[:-1].encode('utf-8') + b',"features":[')
+    
+    for desde in range(0, n, bloque):
+        features = []
+        for i, fila in enumerate(df.iloc[desde:desde + bloque].itertuples(), start=desde):
+            mag = None if i % 50 == 0 else float(magnitudes[i])
+            features.append({
+                'type': 'Feature',
+                'properties': {
+                    'mag': mag, 'place': fila.lugar, 'time': int(tiempos[i]), 'updated': int(tiempos[i]) + 60000,
+                    'tz': None, 'url': f"https://earthquake.usgs.gov/earthquakes/eventpage/us{i:08d}",
+                    'detail': f"https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/us{i:08d}.geojson",
+                    'felt': None, 'cdi': None, 'mmi': None, 'alert': None, 'status': 'automatic',
+                    'tsunami': 0, 'sig': 50, 'net': 'us', 'code': f"{i:08d}", 'ids': f",us{i:08d},",
+                    'sources': ',us,', 'types': ',origin,phase-data,', 'nst': 20, 'dmin': 0.1, 'rms': 0.5,
+                    'gap': 80, 'magType': 'ml', 'type': 'earthquake', 'title': f"M {mag} - {fila.lugar}"
+                },
+                'geometry': {'type': 'Point', 'coordinates': [fila.lon, fila.lat, fila.profundidad]},
+                'id': f"us{i:08d}"
+            })
+        separador = b',' if desde else b''
+        destino.write(separador + json.dumps(features, separators=(',', ':'))[1:-1].encode('utf-8'))
+    
+    destino.write(b'],"bbox":[-180,-60,0,180,60,700]}')
+
+
+def generar_feed_usgs(n, semilla=42):
+    """
+    Igual que escribir_feed_usgs, pero retorna los bytes del documento.
+    """
+    destino = io.BytesIO()
+    escribir_feed_usgs(n, destino, semilla)
+    return destino.getvalue()
+
+
+# Descripciones de OpenWeatherMap en español (lang=es)
+DESCRIPCIONES_CLIMA = ['cielo claro', 'algo de nubes', 'nubes dispersas', 'muy nuboso', 'nubes',
+                       'lluvia ligera', 'lluvia moderada', 'niebla', 'bruma', 'nevada ligera']
+
+
+def generar_clima(n, semilla=42):
+    """
+    Genera un DataFrame sintético con el mismo esquema que obtener_datos_api("clima"):
+    las ciudades de CIUDADES_CHILE seguidas de estaciones repartidas por Chile, con una
+    temperatura que baja hacia el sur.
+    """
+    rng = np.random.default_rng(semilla)
+    ciudades = [c for c, _, _ in mi.CIUDADES_CHILE][:n]
+    lat = np.array([la for _, la, _ in mi.CIUDADES_CHILE][:n] + list(rng.uniform(-55, -17.5, n - len(ciudades))))
+    lon = np.array([lo for _, _, lo in mi.CIUDADES_CHILE][:n] + list(rng.uniform(-75.5, -67, n - len(ciudades))))
+    ciudades += [f"Estación {k}" for k in range(len(ciudades), n)]
+    minutos = np.sort(rng.integers(0, 24 * 60, n))
+    
+    return pd.DataFrame({
+        'ciudad': ciudades,
+        'temperatura': np.round(32 + (lat + 17.5) * 0.55 + rng.normal(0, 4, n), 2),
+        'humedad': rng.integers(15, 101, n),
+        'viento': np.round(rng.gamma(2.0, 2.0, n), 2),
+        'descripcion': rng.choice(DESCRIPCIONES_CLIMA, n),
+        'lat': np.round(lat, 4),
+        'lon': np.round(lon, 4),
+        'fecha': (pd.Timestamp('2025-11-04') + pd.to_timedelta(minutos, unit='m')).strftime('%Y-%m-%d %H:%M'),
+        'tipo': 'Clima'
+    })
+
+
+def generar_incendios_firms(n, semilla=42):
+    """
+    Genera un DataFrame sintético con las columnas del CSV VIIRS de NASA FIRMS
+    (lo que lee leer_csv_firms), con focos repartidos por Chile.
+    """
+    rng = np.random.default_rng(semilla)
+    minutos = np.sort(rng.integers(0, 2 * 24 * 60, n))
+    momento = pd.Timestamp('2025-11-03') + pd.to_timedelta(minutos, unit='m')
+    
+    return pd.DataFrame({
+        'latitude': np.round(rng.uniform(-45, -18, n), 5),
+        'longitude': np.round(rng.uniform(-74, -68, n), 5),
+        'bright_ti4': np.round(rng.uniform(300, 367, n), 2),
+        'scan': np.round(rng.uniform(0.3, 0.8, n), 2),
+        'track': np.round(rng.uniform(0.3, 0.8, n), 2),
+        'acq_date': momento.strftime('%Y-%m-%d'),
+        'acq_time': momento.hour * 100 + momento.minute,
+        'satellite': rng.choice(['N', '1'], n),
+        'instrument': 'VIIRS',
+        'confidence': rng.choice(['l', 'n', 'h'], n, p=[0.2, 0.6, 0.2]),
+        'version': '2.0NRT',
+        'bright_ti5': np.round(rng.uniform(280, 310, n), 2),
+        'frp': np.round(rng.lognormal(2.0, 1.2, n), 2),
+        'daynight': rng.choice(['D', 'N'], n)
+    })
+
+
+def ingesta_completa(ruta):
+    """
+    Implementación original: json completo en memoria, un dict por evento y luego DataFrame.
+    """
+    with open(ruta, 'rb') as f:
+        datos = json.loads(f.read())
+    
+    datos_procesados = []
+    for feature in datos['features']:
+        props = feature['properties']
+        coords = feature['geometry']['coordinates']
+        if props['mag'] is not None and props['mag'] >= 2.0:
+            datos_procesados.append({
+                'magnitud': props['mag'],
+                'lugar': props['place'],
+                'lat': coords[1],
+                'lon': coords[0],
+                'profundidad': coords[2],
+                'fecha': datetime.fromtimestamp(props['time']/1000).strftime('%Y-%m-%d %H:%M'),
+                'tipo': 'Terremoto'
+            })
+    return pd.DataFrame(datos_procesados)
+
+
+def ingesta_streaming(ruta):
+    """
+    Lectura incremental usada por obtener_datos_api.
+    """
+    return mi.leer_terremotos_streaming(mi.leer_trozos(ruta), magnitud_minima=2.0)
+
+
+def benchmark_ingesta(tamaños):
+    """
+    Compara tiempo y pico de memoria de la lectura completa frente a la lectura streaming.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: LECTURA DEL FEED USGS")
+    print("=" * 60)
+    print(f"{'eventos':>8} | {'feed':>8} | {'método':<10} | {'tiempo':>7} | {'pico memoria':>12} | filas")
+    print("-" * 60)
+    
+    for n in tamaños:
+        with tempfile.NamedTemporaryFile(suffix='.geojson', delete=False) as f:
+            f.write(generar_feed_usgs(n))
+            ruta = f.name
+        tamaño_mb = os.path.getsize(ruta) / 1e6
+        
+        for nombre, funcion in [("completa", ingesta_completa), ("streaming", ingesta_streaming)]:
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            df = funcion(ruta)
+            segundos = time.perf_counter() - inicio
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{n:>8} | {tamaño_mb:>6.1f}MB | {nombre:<10} | {segundos:>6.2f}s | "
+                  f"{pico / 1e6:>10.1f}MB | {len(df)}")
+        
+        os.unlink(ruta)
+
+
+def heatmap_iterrows(df):
+    """
+    Implementación original del heatmap: un [lat, lon, peso] por fila con df.iterrows().
+    """
+    datos_heatmap = []
+    for _, row in df.iterrows():
+        peso = float(row['magnitud']) / 5.0 if row['magnitud'] > 0 else 0.1
+        datos_heatmap.append([row['lat'], row['lon'], peso])
+    return datos_heatmap
+
+
+def benchmark_heatmap(tamaños, limite_iterrows):
+    """
+    Compara el heatmap original con el agrupado por celdas: tiempo y bytes incrustados.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: HEATMAP")
+    print("=" * 60)
+    print(f"{'filas':>8} | {'método':<14} | {'tiempo':>7} | {'entradas':>9} | {'bytes JSON':>11}")
+    print("-" * 60)
+    
+    for n in tamaños:
+        df = generar_terremotos(n)
+        metodos = [
+            ("sin agrupar", lambda d: mi.construir_datos_heatmap(d, "terremotos", 0)),
+            (f"celda {mi.TAMAÑO_CELDA_HEATMAP}°", lambda d: mi.construir_datos_heatmap(d, "terremotos"))
+        ]
+        if n <= limite_iterrows:
+            metodos.insert(0, ("iterrows", heatmap_iterrows))
+        
+        for nombre, funcion in metodos:
+            inicio = time.perf_counter()
+            datos = funcion(df)
+            segundos = time.perf_counter() - inicio
+            tamaño = len(json.dumps(datos))
+            print(f"{n:>8} | {nombre:<14} | {segundos:>6.2f}s | {len(datos):>9} | {tamaño:>11,}")
+
+
+def bytes_duplicados(df, periodo, ventana):
+    """
+    Bytes de la alternativa directa (una lista de features por cuadro, como en
+    TimestampedGeoJson o HeatMapWithTime): cada evento se repite en cada cuadro de su
+    ventana. Se calcula sin construir las listas: bytes del feature × cuadros en que se ve.
+    """
+    features = mi.construir_geojson_compacto(df, "terremotos")['features']
+    largos = np.array([len(mi.a_json_compacto(f)) + 1 for f in features])
+    indices, inicios, _ = mi.construir_cuadros(df['fecha'], periodo)
+    total = len(inicios) - 1
+    cuadro = np.repeat(np.arange(total), np.diff(inicios))
+    return int((largos[indices] * np.minimum(ventana, total - cuadro)).sum())
+
+
+def benchmark_reproduccion(tamaños):
+    """
+    Bytes y tiempo de la capa de reproducción (puntos una vez + tramos de índices) para
+    cuadros diarios, por hora y de 10 minutos, frente a repetir los puntos en cada cuadro.
+    """
+    print("=" * 60)
+    print(f"       BENCHMARK: REPRODUCCIÓN TEMPORAL (ventana de {mi.CUADROS_VISIBLES} cuadros)")
+    print("=" * 60)
+    print(f"{'filas':>8} | {'cuadro':>6} | {'cuadros':>7} | {'tiempo':>7} | {'bytes capa':>12} | {'repetidos':>13}")
+    print("-" * 60)
+    
+    for n in tamaños:
+        df = generar_terremotos(n)
+        for periodo in ('D', 'h', '10min'):
+            with contextlib.redirect_stdout(io.StringIO()):
+                tamaño, segundos = tamaño_html(
+                    lambda mapa, d, tipo: mi.agregar_capa_reproduccion(mapa, d, tipo, periodo), df)
+            cuadros = len(mi.construir_cuadros(df['fecha'], periodo)[2])
+            repetidos = bytes_duplicados(df, periodo, mi.CUADROS_VISIBLES)
+            print(f"{n:>8} | {periodo:>6} | {cuadros:>7} | {segundos:>6.2f}s | {tamaño:>12,} | {repetidos:>13,}")
+    print()
+
+
+def refresco_simulado(df, horas=1, semilla=7):
+    """
+    Siguiente versión de los datos en un refresco: sale el primer día de la ventana y
+    entran 'horas' de eventos nuevos después del último.
+    """
+    fechas = pd.to_datetime(df['fecha'])
+    nuevos = generar_terremotos(max(1, len(df) * horas // (30 * 24)), semilla)
+    minutos = np.sort(np.random.default_rng(semilla).integers(1, horas * 60 + 1, len(nuevos)))
+    nuevos['fecha'] = (fechas.max() + pd.to_timedelta(minutos, unit='m')).strftime(mi.FORMATO_FECHA)
+    conservados = df[fechas >= fechas.min().floor('D') + pd.Timedelta(days=1)]
+    return pd.concat([conservados, nuevos], ignore_index=True)
+
+
+def benchmark_cache_capas(tamaños):
+    """
+    Tiempo de crear y renderizar el mapa sin caché de capas, con la caché vacía, sin
+    cambios en los datos y tras un refresco (sale un día, entra una hora).
+    """
+    print("=" * 60)
+    print("       BENCHMARK: CACHÉ DE CAPAS (mapa + render del HTML)")
+    print("=" * 60)
+    print(f"{'filas':>8} | {'escenario':<16} | {'tiempo':>7} | {'fragmentos reutilizados':>24}")
+    print("-" * 60)
+    mi.API_ELEGIDA = "terremotos"
+    
+    def crear(df):
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            inicio = time.perf_counter()
+            mi.crear_mapa_interactivo(df).get_root().render()
+            segundos = time.perf_counter() - inicio
+        reutilizados = [l for l in salida.getvalue().splitlines() if 'Caché de capas' in l]
+        return segundos, reutilizados[0].split(': ')[1].split(' fragmentos')[0] if reutilizados else '-'
+    
+    for n in tamaños:
+        df = generar_terremotos(n)
+        refrescado = refresco_simulado(df)
+        if mi.ESQUEMA_COMPACTO:
+            with contextlib.redirect_stdout(io.StringIO()):
+                df, refrescado = mi.aplicar_esquema(df), mi.aplicar_esquema(refrescado)
+        
+        with tempfile.TemporaryDirectory() as directorio:
+            mi.DIRECTORIO_CACHE_CAPAS = directorio
+            mi.CACHE_CAPAS = False
+            escenarios = [("sin caché", df), ("caché vacía", df), ("sin cambios", df), ("refresco", refrescado)]
+            for nombre, datos in escenarios:
+                segundos, reutilizados = crear(datos)
+                print(f"{n:>8} | {nombre:<16} | {segundos:>6.2f}s | {reutilizados:>24}")
+                mi.CACHE_CAPAS = True
+        mi.CACHE_CAPAS = False
+    print()
+
+
+def benchmark_indice(tamaños, consultas=100):
+    """
+    Compara IndiceEspacial con un recorrido completo (fuerza bruta) en consultas por
+    bbox, por radio de 200 km y de 10 vecinos más cercanos.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: ÍNDICE ESPACIAL")
+    print("=" * 60)
+    print(f"{'puntos':>8} | {'consulta':<10} | {'fuerza bruta':>12} | {'índice':>8} | {'aceleración':>11}")
+    print("-" * 60)
+    rng = np.random.default_rng(7)
+    
+    for n in tamaños:
+        df = generar_terremotos(n)
+        lat, lon = df['lat'].to_numpy(), df['lon'].to_numpy()
+        inicio = time.perf_counter()
+        indice = mi.IndiceEspacial(lat, lon)
+        indice.actualizar_orden()
+        print(f"{n:>8} | {'creación':<10} | {'':>12} | {time.perf_counter() - inicio:>7.3f}s |")
+        
+        centros = np.column_stack([rng.uniform(-55, 60, consultas), rng.uniform(-180, 180, consultas)])
+        pruebas = {
+            'bbox': (
+                lambda la, lo: np.flatnonzero((lat >= la - 5) & (lat <= la + 5) & (lon >= lo - 5) & (lon <= lo + 5)),
+                lambda la, lo: indice.consultar_bbox(la - 5, la + 5, lo - 5, lo + 5)
+            ),
+            'radio': (
+                lambda la, lo: np.flatnonzero(mi.distancia_haversine(la, lo, lat, lon) <= 200),
+                lambda la, lo: indice.consultar_radio(la, lo, 200)
+            ),
+            'k=10': (
+                lambda la, lo: np.argpartition(mi.distancia_haversine(la, lo, lat, lon), 10)[:10],
+                lambda la, lo: indice.vecinos_cercanos(la, lo, 10)
+            )
+        }
+        
+        for nombre, (fuerza_bruta, con_indice) in pruebas.items():
+            tiempos = []
+            for funcion in (fuerza_bruta, con_indice):
+                inicio = time.perf_counter()
+                for la, lo in centros:
+                    funcion(la, lo)
+                tiempos.append(time.perf_counter() - inicio)
+            print(f"{n:>8} | {nombre:<10} | {tiempos[0]:>11.3f}s | {tiempos[1]:>7.3f}s | "
+                  f"{tiempos[0] / tiempos[1]:>10.1f}x")
+
+
+def tamaño_directorio(ruta):
+    """
+    Bytes totales de los archivos bajo un directorio.
+    """
+    return sum(os.path.getsize(os.path.join(raiz, nombre))
+               for raiz, _, nombres in os.walk(ruta) for nombre in nombres)
+
+
+def benchmark_exportacion(tamaños):
+    """
+    Compara el CSV completo original con el archivo histórico en cada formato: tiempo de
+    escritura, de relectura, tamaño en disco y tiempo de una segunda exportación sin filas
+    nuevas (el caso habitual en el refresco periódico).
+    """
+    print("=" * 60)
+    print("       BENCHMARK: EXPORTACIÓN")
+    print("=" * 60)
+    print(f"{'filas':>8} | {'formato':<8} | {'escritura':>9} | {'lectura':>8} | {'bytes':>12} | {'repetida':>8}")
+    print("-" * 60)
+    
+    for n in tamaños:
+        df = generar_terremotos(n)
+        df['id'] = [f"ev{i}" for i in range(n)]
+        df['actualizado'] = 0
+        directorio = tempfile.mkdtemp(prefix='exportacion_benchmark_')
+        
+        ruta_csv = os.path.join(directorio, 'datos_exportados.csv')
+        inicio = time.perf_counter()
+        df.to_csv(ruta_csv, index=False, encoding='utf-8')
+        escritura = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        pd.read_csv(ruta_csv, encoding='utf-8')
+        lectura = time.perf_counter() - inicio
+        print(f"{n:>8} | {'original':<8} | {escritura:>8.2f}s | {lectura:>7.2f}s | "
+              f"{os.path.getsize(ruta_csv):>12,} | {escritura:>7.2f}s")
+        
+        for formato, (_, modulo, _, _, _) in mi.FORMATOS_DISPONIBLES.items():
+            if modulo and importlib.util.find_spec(modulo) is None:
+                print(f"{n:>8} | {formato:<8} | omitido (falta '{modulo}')")
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                mi.exportar_incremental(df, formato, directorio)
+                escritura = time.perf_counter() - inicio
+                inicio = time.perf_counter()
+                mi.exportar_incremental(df, formato, directorio)
+                repetida = time.perf_counter() - inicio
+            inicio = time.perf_counter()
+            mi.leer_exportacion(formato, directorio)
+            lectura = time.perf_counter() - inicio
+            bytes_formato = tamaño_directorio(os.path.join(directorio, formato))
+            print(f"{n:>8} | {formato:<8} | {escritura:>8.2f}s | {lectura:>7.2f}s | "
+                  f"{bytes_formato:>12,} | {repetida:>7.2f}s")
+        
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def benchmark_fragmentos(tamaños, procesos):
+    """
+    Mide crear_mapa_interactivo + render con los puntos y el heatmap construidos en
+    1, 2, 4 y 8 procesos (PROCESOS_RENDER), en ambos modos de salida.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: RENDER EN VARIOS PROCESOS")
+    print("=" * 60)
+    print(f"CPUs disponibles: {os.cpu_count()}")
+    print(f"{'filas':>8} | {'modo':<11} | {'procesos':>8} | {'tiempo':>7} | {'aceleración':>11}")
+    print("-" * 60)
+    mi.API_ELEGIDA = "terremotos"
+    mi.FILAS_MINIMAS_FRAGMENTOS = 0
+    
+    for n in tamaños:
+        df = generar_terremotos(n)
+        for modo in ("geojson", "marcadores"):
+            mi.MODO_SALIDA = modo
+            referencia = None
+            for cantidad in procesos:
+                mi.PROCESOS_RENDER = cantidad
+                with contextlib.redirect_stdout(io.StringIO()):
+                    inicio = time.perf_counter()
+                    mi.crear_mapa_interactivo(df).get_root().render()
+                    segundos = time.perf_counter() - inicio
+                referencia = referencia or segundos
+                print(f"{n:>8} | {modo:<11} | {cantidad:>8} | {segundos:>6.2f}s | {referencia / segundos:>10.2f}x")
+    
+    mi.PROCESOS_RENDER = 1
+
+
+def benchmark_esquema(tamaños):
+    """
+    Memoria del DataFrame (memory_usage profundo) antes y después de aplicar_esquema,
+    y tiempo de construir los marcadores con cada uno.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: ESQUEMA COMPACTO")
+    print("=" * 60)
+    print(f"{'filas':>8} | {'fuente':<11} | {'antes':>9} | {'después':>9} | {'conversión':>10} | "
+          f"{'marcadores antes/después':>24}")
+    print("-" * 60)
+    
+    for n in tamaños:
+        for fuente, generar in (("terremotos", generar_terremotos), ("clima", generar_clima)):
+            df = generar(n)
+            with contextlib.redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                compacto = mi.aplicar_esquema(df)
+                conversion = time.perf_counter() - inicio
+            tiempos = []
+            for datos in (df, compacto):
+                inicio = time.perf_counter()
+                mi.construir_datos_marcadores(datos, fuente)
+                tiempos.append(time.perf_counter() - inicio)
+            antes, despues = (d.memory_usage(deep=True).sum() / 1e6 for d in (df, compacto))
+            print(f"{n:>8} | {fuente:<11} | {antes:>7.1f}MB | {despues:>7.1f}MB | {conversion:>9.2f}s | "
+                  f"{tiempos[0]:>10.2f}s / {tiempos[1]:.2f}s")
+
+
+def marcadores_iterrows(df, mapa):
+    """
+    Implementación original: un CircleMarker con Popup por fila usando df.iterrows().
+    Se mantiene solo como referencia para comparar.
+    """
+    marker_cluster = MarkerCluster(name="Marcadores").add_to(mapa)
+    
+    for idx, row in df.iterrows():
+        lat = float(row.get('lat', 0))
+        lon = float(row.get('lon', 0))
+        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+            continue
+        
+        color = mi.asignar_color_marcador(row.get('magnitud', 0), "terremotos")
+        tooltip_text = f"{row.get('lugar', 'Lugar desconocido')} - M{row.get('magnitud', 'N/A')}"
+        tamaño = min(30, max(10, row.get('magnitud', 1) * 5))
+        popup_html = mi.PLANTILLAS_POPUP["terremotos"].format(
+            color=color,
+            lugar=row.get('lugar', 'N/A'),
+            magnitud=row.get('magnitud', 'N/A'),
+            profundidad=row.get('profundidad', 'N/A'),
+            fecha=row.get('fecha', 'N/A')
+        )
+        
+        folium.CircleMarker(
+            location=[lat, lon],
+            radius=tamaño,
+            popup=folium.Popup(popup_html, max_width=300),
+            tooltip=tooltip_text,
+            color=color,
+            fill=True,
+            fill_color=color,
+            fill_opacity=0.7,
+            weight=2
+        ).add_to(marker_cluster)
+
+
+def marcadores_vectorizado(df, mapa):
+    """
+    Implementación vectorizada usada por crear_mapa_interactivo.
+    """
+    datos = mi.construir_datos_marcadores(df, "terremotos")
+    capa = FastMarkerCluster([], callback=mi.CALLBACK_MARCADOR_JS, name="Marcadores")
+    capa.data = datos.values.tolist()
+    capa.add_to(mapa)
+
+
+def medir(funcion, df):
+    """
+    Construye los marcadores y serializa el mapa. Retorna (segundos_construccion, segundos_render).
+    """
+    mapa = folium.Map(location=mi.CENTER_COORDS, zoom_start=mi.ZOOM_INICIAL)
+    
+    inicio = time.perf_counter()
+    funcion(df, mapa)
+    construccion = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    mapa.get_root().render()
+    render = time.perf_counter() - inicio
+    
+    return construccion, render
+
+
+def benchmark_marcadores(tamaños, limite_iterrows):
+    """
+    Compara el bucle iterrows original con el constructor vectorizado.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: CONSTRUCCIÓN DE MARCADORES")
+    print("=" * 60)
+    print(f"{'filas':>8} | {'método':<12} | {'construcción':>12} | {'render':>8}")
+    print("-" * 60)
+    
+    for n in tamaños:
+        df = generar_terremotos(n)
+        metodos = [("vectorizado", marcadores_vectorizado)]
+        if n <= limite_iterrows:
+            metodos.insert(0, ("iterrows", marcadores_iterrows))
+        
+        for nombre, funcion in metodos:
+            construccion, render = medir(funcion, df)
+            print(f"{n:>8} | {nombre:<12} | {construccion:>11.2f}s | {render:>7.2f}s")
+        
+        if n > limite_iterrows:
+            print(f"{n:>8} | {'iterrows':<12} | {'omitido (> --limite-iterrows)':>23}")
+
+
+def tamaño_html(agregar_capa, df):
+    """
+    Bytes que aporta una capa de puntos al HTML renderizado.
+    """
+    base = folium.Map(location=mi.CENTER_COORDS, zoom_start=mi.ZOOM_INICIAL)
+    tamaño_base = len(base.get_root().render().encode('utf-8'))
+    
+    mapa = folium.Map(location=mi.CENTER_COORDS, zoom_start=mi.ZOOM_INICIAL)
+    inicio = time.perf_counter()
+    agregar_capa(mapa, df, "terremotos")
+    html = mapa.get_root().render()
+    segundos = time.perf_counter() - inicio
+    
+    return len(html.encode('utf-8')) - tamaño_base, segundos
+
+
+def benchmark_salida(tamaños):
+    """
+    Compara el tamaño del HTML entre el modo "marcadores", el modo "geojson" y el modo
+    "geojson" con los detalles de popups en un archivo aparte (cuyo tamaño se muestra
+    entre paréntesis). Retorna False si el modo geojson supera PRESUPUESTO_BYTES_POR_PUNTO.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: TAMAÑO DE SALIDA HTML")
+    print("=" * 60)
+    print(f"{'filas':>8} | {'modo':<11} | {'bytes':>11} | {'bytes/punto':>11} | {'tiempo':>7}")
+    print("-" * 60)
+    
+    archivo_detalles = os.path.join(tempfile.mkdtemp(prefix='detalles_benchmark_'), 'detalles.json')
+    con_detalles = lambda mapa, df, tipo: mi.agregar_capa_geojson(mapa, df, tipo, archivo_detalles=archivo_detalles)
+    
+    dentro_presupuesto = True
+    for n in tamaños:
+        df = generar_terremotos(n)
+        df['id'] = [f"ev{i}" for i in range(n)]
+        for modo, agregar_capa in [("marcadores", mi.agregar_capa_marcadores),
+                                   ("geojson", mi.agregar_capa_geojson),
+                                   ("detalles", con_detalles)]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                bytes_capa, segundos = tamaño_html(agregar_capa, df)
+            por_punto = bytes_capa / n
+            aparte = f" (+{os.path.getsize(archivo_detalles):,})" if modo == "detalles" else ""
+            print(f"{n:>8} | {modo:<11} | {bytes_capa:>11,} | {por_punto:>11.1f} | {segundos:>6.2f}s{aparte}")
+            
+            if modo == "geojson" and por_punto > PRESUPUESTO_BYTES_POR_PUNTO:
+                print(f"✗ geojson supera el presupuesto de {PRESUPUESTO_BYTES_POR_PUNTO} bytes/punto")
+                dentro_presupuesto = False
+    
+    return dentro_presupuesto
+
+
+class ManejadorSimulado(BaseHTTPRequestHandler):
+    """
+    Responde como OpenWeatherMap con un retardo fijo por petición.
+    """
+    protocol_version = 'HTTP/1.1'
+    retardo = 0.05
+    
+    def do_GET(self):
+        time.sleep(self.retardo)
+        cuerpo = json.dumps({
+            'main': {'temp': 18.5, 'humidity': 60},
+            'wind': {'speed': 3.2},
+            'weather': [{'description': 'cielo claro'}]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+    
+    def log_message(self, formato, *args):
+        pass
+
+
+def iniciar_servidor_simulado(manejador=ManejadorSimulado):
+    """
+    Inicia un servidor HTTP local en un hilo. Retorna (servidor, url_base).
+    """
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+
+def clima_secuencial(ciudades):
+    """
+    Implementación original: una petición requests.get sin sesión por ciudad.
+    """
+    resultados = []
+    for ciudad, lat, lon in ciudades:
+        url = f"{mi.URL_OPENWEATHER}?lat={lat}&lon={lon}&appid={mi.API_KEY_OPENWEATHER}&units=metric&lang=es"
+        respuesta = requests.get(url, timeout=10)
+        if respuesta.status_code == 200:
+            resultados.append(respuesta.json())
+    return resultados
+
+
+def benchmark_clima(estaciones, concurrencias):
+    """
+    Compara la descarga secuencial de clima con la concurrente contra un servidor simulado.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: DESCARGA DE CLIMA (SERVIDOR SIMULADO)")
+    print("=" * 60)
+    servidor, url_base = iniciar_servidor_simulado()
+    mi.URL_OPENWEATHER = f"{url_base}/data/2.5/weather"
+    # Sin TTL: cada ejecución consulta al servidor en lugar de leer la caché
+    mi.TTL_CACHE = {}
+    mi.DIRECTORIO_CACHE = tempfile.mkdtemp(prefix='cache_benchmark_')
+    ciudades = [(f"Estación {i}", -33.0 - i * 0.01, -70.0) for i in range(estaciones)]
+    print(f"{estaciones} estaciones, retardo simulado {ManejadorSimulado.retardo * 1000:.0f} ms")
+    print("-" * 60)
+    
+    inicio = time.perf_counter()
+    clima_secuencial(ciudades)
+    print(f"{'secuencial':<16} | {time.perf_counter() - inicio:>7.2f}s")
+    
+    for concurrencia in concurrencias:
+        inicio = time.perf_counter()
+        resultados = mi.obtener_clima_concurrente(ciudades, concurrencia, peticiones_por_segundo=0)
+        print(f"{f'concurrente x{concurrencia}':<16} | {time.perf_counter() - inicio:>7.2f}s"
+              f" | {len(resultados)} resultados")
+    
+    servidor.shutdown()
+
+
+class ManejadorArchivo(BaseHTTPRequestHandler):
+    """
+    Sirve el archivo indicado en 'ruta' para cualquier GET (feed USGS simulado), tras
+    esperar 'retardo' segundos.
+    """
+    protocol_version = 'HTTP/1.1'
+    ruta = None
+    retardo = 0
+    
+    def do_GET(self):
+        time.sleep(self.retardo)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(os.path.getsize(self.ruta)))
+        self.end_headers()
+        with open(self.ruta, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, 1024 * 1024)
+    
+    def log_message(self, formato, *args):
+        pass
+
+
+def medir_minimo(funcion, repeticiones):
+    """
+    Ejecuta funcion() varias veces sin mostrar su salida.
+    Retorna (mejor tiempo en segundos, resultado de la última ejecución).
+    """
+    mejor, resultado = float('inf'), None
+    for _ in range(repeticiones):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def preparar_fuente_simulada(fuente, n, directorio, estaciones):
+    """
+    Apunta mapa_interactivo a un servidor local que simula la API de la fuente:
+    un feed USGS de n eventos o OpenWeatherMap para min(n, estaciones) estaciones.
+    Retorna el servidor y el DataFrame sintético de n filas para las demás etapas.
+    """
+    mi.API_ELEGIDA = fuente
+    if fuente == "terremotos":
+        ManejadorArchivo.ruta = os.path.join(directorio, f"feed_{n}.geojson")
+        with open(ManejadorArchivo.ruta, 'wb') as f:
+            escribir_feed_usgs(n, f)
+        servidor, url_base = iniciar_servidor_simulado(ManejadorArchivo)
+        mi.FEEDS_USGS = {clave: f"{url_base}/{clave}.geojson" for clave in mi.FEEDS_USGS}
+        return servidor, generar_terremotos(n)
+    
+    df = generar_clima(n)
+    servidor, url_base = iniciar_servidor_simulado()
+    mi.URL_OPENWEATHER = f"{url_base}/data/2.5/weather"
+    mi.CIUDADES_CHILE = list(df[['ciudad', 'lat', 'lon']].head(estaciones).itertuples(index=False, name=None))
+    mi.PETICIONES_POR_SEGUNDO_HOST = 0
+    return servidor, df
+
+
+def ejecutar_suite(fuentes, tamaños, repeticiones, estaciones):
+    """
+    Para cada fuente y tamaño mide descarga + lectura contra el servidor simulado,
+    construcción del mapa, serialización del HTML y exportación CSV.
+    Retorna una lista de resultados {fuente, filas, etapa, segundos, bytes}.
+    """
+    print("=" * 60)
+    print("       SUITE DE BENCHMARKS (DATOS SINTÉTICOS)")
+    print("=" * 60)
+    print(f"{'fuente':<11} | {'filas':>8} | {'etapa':<11} | {'tiempo':>8} | {'bytes':>13}")
+    print("-" * 60)
+    # Sin TTL ni modo incremental: cada repetición descarga y lee el feed completo
+    mi.TTL_CACHE = {}
+    mi.MODO_INCREMENTAL = False
+    mi.FORMATOS_EXPORTACION = []
+    resultados = []
+    
+    for fuente in fuentes:
+        for n in tamaños:
+            directorio = tempfile.mkdtemp(prefix='suite_benchmark_')
+            mi.DIRECTORIO_CACHE = os.path.join(directorio, 'cache')
+            servidor, df = preparar_fuente_simulada(fuente, n, directorio, estaciones)
+            if mi.ESQUEMA_COMPACTO:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    df = mi.aplicar_esquema(df)
+            ruta_html = os.path.join(directorio, 'mapa.html')
+            ruta_csv = os.path.join(directorio, 'datos.csv')
+            
+            def descargar():
+                mi.reiniciar_metricas()
+                return mi.obtener_datos()
+            
+            segundos, _ = medir_minimo(descargar, repeticiones)
+            medidas = [('fetch_parse', segundos, sum(p['bytes'] for p in mi.METRICAS_PETICIONES))]
+            segundos, mapa = medir_minimo(lambda: mi.crear_mapa_interactivo(df), repeticiones)
+            medidas.append(('mapa', segundos, None))
+            segundos, _ = medir_minimo(lambda: mi.guardar_mapa_atomico(mapa, ruta_html), repeticiones)
+            medidas.append(('html', segundos, os.path.getsize(ruta_html)))
+            segundos, _ = medir_minimo(lambda: df.to_csv(ruta_csv, index=False, encoding='utf-8'), repeticiones)
+            medidas.append(('csv', segundos, os.path.getsize(ruta_csv)))
+            
+            for etapa, segundos, bytes_etapa in medidas:
+                resultados.append({'fuente': fuente, 'filas': n, 'etapa': etapa,
+                                   'segundos': round(segundos, 6), 'bytes': bytes_etapa})
+                texto_bytes = f"{bytes_etapa:>13,}" if bytes_etapa is not None else f"{'':>13}"
+                print(f"{fuente:<11} | {n:>8} | {etapa:<11} | {segundos:>7.3f}s | {texto_bytes}")
+            
+            servidor.shutdown()
+            shutil.rmtree(directorio, ignore_errors=True)
+    
+    return resultados
+
+
+def guardar_resultados(resultados, ruta, repeticiones):
+    """
+    Guarda los resultados de la suite en JSON junto con la descripción del entorno.
+    """
+    documento = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': sys.version.split()[0],
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'folium': folium.__version__
+        },
+        'configuracion': {'repeticiones': repeticiones, 'modo_salida': mi.MODO_SALIDA},
+        'resultados': resultados
+    }
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(documento, f, indent=2, ensure_ascii=False)
+    print(f"✓ Resultados guardados como: {ruta}")
+
+
+def comparar_con_referencia(resultados, ruta_referencia, tolerancia):
+    """
+    Compara los tiempos con una ejecución de referencia guardada.
+    Retorna False si alguna etapa es más lenta que la referencia más la tolerancia.
+    """
+    with open(ruta_referencia, 'r', encoding='utf-8') as f:
+        referencia = {(r['fuente'], r['filas'], r['etapa']): r for r in json.load(f)['resultados']}
+    
+    print("=" * 60)
+    print(f"       COMPARACIÓN CON {os.path.basename(ruta_referencia)} (tolerancia {tolerancia:.0%})")
+    print("=" * 60)
+    print(f"{'fuente':<11} | {'filas':>8} | {'etapa':<11} | {'referencia':>10} | {'actual':>8} | {'cambio':>7}")
+    print("-" * 60)
+    
+    sin_regresiones = True
+    for r in resultados:
+        anterior = referencia.get((r['fuente'], r['filas'], r['etapa']))
+        if anterior is None:
+            continue
+        cambio = r['segundos'] / anterior['segundos'] - 1 if anterior['segundos'] else 0.0
+        marca = ""
+        if cambio > tolerancia:
+            marca = "  ✗ regresión"
+            sin_regresiones = False
+        print(f"{r['fuente']:<11} | {r['filas']:>8} | {r['etapa']:<11} | {anterior['segundos']:>9.3f}s | "
+              f"{r['segundos']:>7.3f}s | {cambio:>+6.0%}{marca}")
+    
+    return sin_regresiones
+
+
+# Latencia simulada de las APIs que entregan un solo archivo (segundos)
+RETARDO_FUENTES = {"terremotos": 0.5, "incendios": 0.5}
+
+
+def servir_archivo(ruta, retardo):
+    """
+    Servidor local que entrega siempre el mismo archivo. Retorna (servidor, url_base).
+    server_close() espera a las respuestas en curso (p. ej. las de una fuente abandonada
+    por timeout) para no borrar el archivo mientras se envía.
+    """
+    manejador = type('ManejadorFuente', (ManejadorArchivo,), {'ruta': ruta, 'retardo': retardo})
+    servidor, url_base = iniciar_servidor_simulado(manejador)
+    servidor.daemon_threads = False
+    return servidor, url_base
+
+
+def benchmark_fuentes(tamaños, estaciones, retardo_lento, repeticiones):
+    """
+    Mapa de terremotos, clima e incendios de principio a fin (descarga, lectura, capas y
+    HTML): fuentes una tras otra frente a obtener_fuentes_concurrente, contra servidores
+    simulados. En el segundo escenario FIRMS tarda retardo_lento segundos y
+    TIMEOUT_FUENTES es menor, para comprobar que una fuente lenta no retrasa a las demás.
+    """
+    print("=" * 60)
+    print("       MAPA DE VARIAS FUENTES: SECUENCIAL VS CONCURRENTE")
+    print("=" * 60)
+    fuentes = ["terremotos", "clima", "incendios"]
+    
+    def secuencial():
+        datos = {fuente: mi.obtener_fuente(fuente) for fuente in fuentes}
+        datos = {fuente: df for fuente, df in datos.items() if df is not None}
+        mi.crear_mapa_multicapa(datos).get_root().render()
+        return len(datos)
+    
+    def concurrente():
+        datos = mi.obtener_fuentes_concurrente(fuentes)
+        mi.crear_mapa_multicapa(datos).get_root().render()
+        return len(datos)
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        mi.DIRECTORIO_CACHE = os.path.join(directorio, 'cache')
+        mi.TTL_CACHE = {}
+        mi.MODO_INCREMENTAL = False
+        mi.PETICIONES_POR_SEGUNDO_HOST = 0
+        mi.ARCHIVO_FIRMS = os.path.join(directorio, 'no_existe.csv')
+        mi.API_KEY_FIRMS = 'simulada'
+        servidor_clima, url_clima = iniciar_servidor_simulado()
+        mi.URL_OPENWEATHER = f"{url_clima}/data/2.5/weather"
+        mi.CIUDADES_CHILE = list(generar_clima(estaciones)[['ciudad', 'lat', 'lon']].itertuples(index=False, name=None))
+        
+        print(f"Clima: {estaciones} estaciones ({ManejadorSimulado.retardo * 1000:.0f} ms por petición); "
+              f"USGS y FIRMS: {RETARDO_FUENTES['terremotos']} s de latencia")
+        print(f"{'filas':>8} | {'escenario':<14} | {'secuencial':>10} | {'concurrente':>11} | {'capas':>5} | {'mejora':>6}")
+        print("-" * 60)
+        
+        for n in tamaños:
+            ruta_feed = os.path.join(directorio, f"feed_{n}.geojson")
+            with open(ruta_feed, 'wb') as f:
+                escribir_feed_usgs(n, f)
+            ruta_firms = os.path.join(directorio, f"firms_{n}.csv")
+            generar_incendios_firms(n).to_csv(ruta_firms, index=False)
+            servidor_usgs, url_usgs = servir_archivo(ruta_feed, RETARDO_FUENTES['terremotos'])
+            mi.FEEDS_USGS = {clave: f"{url_usgs}/{clave}.geojson" for clave in mi.FEEDS_USGS}
+            
+            for escenario, retardo_firms in (("normal", RETARDO_FUENTES['incendios']), ("FIRMS lenta", retardo_lento)):
+                servidor_firms, url_firms = servir_archivo(ruta_firms, retardo_firms)
+                mi.URL_FIRMS = f"{url_firms}/api/area/csv/{{clave}}/VIIRS_SNPP_NRT/{{area}}/{{dias}}"
+                mi.TIMEOUT_FUENTES = retardo_lento / 2 if escenario == "FIRMS lenta" else 30
+                
+                t_secuencial, _ = medir_minimo(secuencial, repeticiones)
+                t_concurrente, capas = medir_minimo(concurrente, repeticiones)
+                print(f"{n:>8} | {escenario:<14} | {t_secuencial:>9.2f}s | {t_concurrente:>10.2f}s | "
+                      f"{capas:>5} | {t_secuencial / t_concurrente:>5.1f}x")
+                # La descarga abandonada por timeout termina aquí; su salida no es parte de la tabla
+                with contextlib.redirect_stdout(io.StringIO()):
+                    servidor_firms.shutdown()
+                    servidor_firms.server_close()
+                    time.sleep(0.5)
+            servidor_usgs.shutdown()
+            servidor_usgs.server_close()
+        servidor_clima.shutdown()
+    
+    mi.TIMEOUT_FUENTES = 30
+    print(f"\nCon FIRMS lenta, TIMEOUT_FUENTES = {retardo_lento / 2:.1f} s: el mapa concurrente se entrega sin esa capa.")
+    print()
+
+
+class ManejadorConFallos(ManejadorArchivo):
+    """
+    Feed USGS simulado que falla a propósito: cada GET responde 503, se cuelga
+    'colgado' segundos antes de responder, cierra la conexión sin respuesta o la corta
+    tras enviar 'bytes_truncado' bytes del cuerpo con las probabilidades de 'fallos';
+    el resto se sirve bien. Con 'caido' todas las peticiones reciben 503 (una caída de
+    varios ciclos).
+    """
+    fallos = {'error': 0.15, 'colgado': 0.10, 'cortado': 0.05, 'truncado': 0.05}
+    bytes_truncado = 20 * 1024
+    colgado = 12
+    caido = False
+    azar = random.Random(42)
+    candado = threading.Lock()
+    
+    def do_GET(self):
+        with self.candado:
+            tirada = self.azar.random()
+        modo, acumulado = 'ok', 0.0
+        for nombre, probabilidad in self.fallos.items():
+            acumulado += probabilidad
+            if tirada < acumulado:
+                modo = nombre
+                break
+        try:
+            if self.caido or modo == 'error':
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif modo == 'cortado':
+                self.close_connection = True
+            elif modo == 'truncado':
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(os.path.getsize(self.ruta)))
+                self.end_headers()
+                with open(self.ruta, 'rb') as f:
+                    self.wfile.write(f.read(self.bytes_truncado))
+                self.close_connection = True
+            else:
+                if modo == 'colgado':
+                    time.sleep(self.colgado)
+                super().do_GET()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+# Políticas de descarga comparadas en benchmark_resiliencia
+POLITICAS_DESCARGA = {
+    "original": {'REINTENTOS_MAXIMOS': 0, 'TIMEOUT_CONEXION': 10, 'TIMEOUT_LECTURA': 10,
+                 'FALLOS_PARA_ABRIR_CIRCUITO': 10 ** 9, 'EDAD_MAXIMA_OBSOLETO': 0, 'SERVIR_OBSOLETO': False},
+    "reintentos": {'REINTENTOS_MAXIMOS': 3, 'TIMEOUT_CONEXION': 1, 'TIMEOUT_LECTURA': 2,
+                   'FALLOS_PARA_ABRIR_CIRCUITO': 5, 'EDAD_MAXIMA_OBSOLETO': 24 * 3600, 'SERVIR_OBSOLETO': False},
+    "obsoleto+refresco": {'REINTENTOS_MAXIMOS': 3, 'TIMEOUT_CONEXION': 1, 'TIMEOUT_LECTURA': 2,
+                          'FALLOS_PARA_ABRIR_CIRCUITO': 5, 'EDAD_MAXIMA_OBSOLETO': 24 * 3600, 'SERVIR_OBSOLETO': True},
+}
+
+
+def benchmark_resiliencia(ciclos, caida=(10, 18), intervalo=0.1):
+    """
+    Ciclos de refresco del mapa de terremotos contra un feed que falla a propósito
+    (ManejadorConFallos), con la política original (sin reintentos, timeout de 10 s y
+    datos de ejemplo ante cualquier error) y con la nueva (reintentos con jitter,
+    timeouts de conexión/lectura, circuito y copia obsoleta como respaldo), con y sin
+    stale-while-revalidate. Durante los ciclos del rango 'caida' el feed responde
+    siempre 503. Los ciclos se separan 'intervalo' segundos y el circuito se abre
+    durante 5 intervalos. Se mide la latencia de cada ciclo hasta tener los datos y de
+    dónde salieron.
+    """
+    print("=" * 60)
+    print("       RESILIENCIA: FEED CON FALLOS, LATENCIA POR CICLO")
+    print("=" * 60)
+    fallos = ', '.join(f"{nombre} {p:.0%}" for nombre, p in ManejadorConFallos.fallos.items())
+    print(f"{ciclos} ciclos; fallos: {fallos} (colgado = {ManejadorConFallos.colgado} s); "
+          f"caída total en los ciclos {caida[0]}-{caida[1] - 1}")
+    print(f"{'política':<18} | {'p50':>6} | {'p95':>6} | {'máx':>6} | {'reales':>6} | {'obsoletos':>9} | {'ejemplo':>7}")
+    print("-" * 60)
+    originales = {nombre: getattr(mi, nombre) for nombre in POLITICAS_DESCARGA["original"]}
+    originales['SEGUNDOS_CIRCUITO_ABIERTO'] = mi.SEGUNDOS_CIRCUITO_ABIERTO
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_feed = os.path.join(directorio, "feed.geojson")
+        with open(ruta_feed, 'wb') as f:
+            escribir_feed_usgs(2000, f)
+        manejador = type('ManejadorFeedConFallos', (ManejadorConFallos,), {'ruta': ruta_feed})
+        servidor, url_base = iniciar_servidor_simulado(manejador)
+        mi.FEEDS_USGS = {clave: f"{url_base}/{clave}.geojson" for clave in mi.FEEDS_USGS}
+        mi.TTL_CACHE = {}
+        mi.MODO_INCREMENTAL = False
+        mi.ARCHIVO_JSON_FALLBACK = os.path.join(directorio, "ejemplo.json")
+        mi.SEGUNDOS_CIRCUITO_ABIERTO = 5 * intervalo
+        filas_reales = len(mi.leer_terremotos_streaming(mi.leer_trozos(ruta_feed), mi.MAGNITUD_MINIMA))
+        
+        for nombre, politica in POLITICAS_DESCARGA.items():
+            for clave, valor in politica.items():
+                setattr(mi, clave, valor)
+            mi.DIRECTORIO_CACHE = os.path.join(directorio, f"cache_{nombre}")
+            mi.CIRCUITOS.clear()
+            manejador.azar.seed(42)
+            # Una primera descarga buena deja la copia que sirve de respaldo
+            manejador.fallos = {}
+            with contextlib.redirect_stdout(io.StringIO()):
+                mi.obtener_datos_api("terremotos")
+            manejador.fallos = ManejadorConFallos.fallos
+            
+            latencias, origenes = [], {'reales': 0, 'obsoletos': 0, 'ejemplo': 0}
+            # Las revalidaciones en segundo plano también escriben; se silencia todo el bloque
+            with contextlib.redirect_stdout(io.StringIO()):
+                for ciclo in range(ciclos):
+                    manejador.caido = caida[0] <= ciclo < caida[1]
+                    mi.ESTADISTICAS_CACHE.clear()
+                    inicio = time.perf_counter()
+                    df = mi.obtener_datos_api("terremotos")
+                    latencias.append(time.perf_counter() - inicio)
+                    if len(df) != filas_reales:
+                        origenes['ejemplo'] += 1
+                    elif mi.ESTADISTICAS_CACHE.get('terremotos', {}).get('obsoletos'):
+                        origenes['obsoletos'] += 1
+                    else:
+                        origenes['reales'] += 1
+                    time.sleep(intervalo)
+                mi.esperar_revalidaciones()
+            
+            p50, p95, maximo = np.percentile(latencias, 50), np.percentile(latencias, 95), max(latencias)
+            print(f"{nombre:<18} | {p50:>5.2f}s | {p95:>5.2f}s | {maximo:>5.2f}s | {origenes['reales']:>6} | "
+                  f"{origenes['obsoletos']:>9} | {origenes['ejemplo']:>7}")
+        servidor.shutdown()
+        servidor.server_close()
+    
+    for clave, valor in originales.items():
+        setattr(mi, clave, valor)
+    print("\nobsoletos: copia anterior servida (por error de la red o, con refresco, sin esperarla); "
+          "ejemplo: datos de ejemplo publicados.")
+    print()
+
+
+# Regiones y rangos de magnitud de las vistas de benchmark_lote (bbox: lat_min, lat_max, lon_min, lon_max)
+REGIONES_LOTE = {
+    "chile": ([-33.45, -70.67], 5, [-56.0, -17.0, -76.0, -66.0]),
+    "japon": ([36.2, 138.25], 5, [24.0, 46.0, 122.0, 146.0]),
+    "california": ([37.0, -119.5], 6, [32.0, 42.5, -125.0, -114.0]),
+    "mundo": ([0, 0], 2, None),
+}
+RANGOS_MAGNITUD_LOTE = [(None, None), (2.0, 4.0), (4.0, 6.0), (6.0, None)]
+
+
+def vistas_lote(directorio):
+    """
+    Una vista por región y rango de magnitud, con su archivo de salida en directorio.
+    """
+    vistas = []
+    for region, (centro, zoom, bbox) in REGIONES_LOTE.items():
+        for minima, maxima in RANGOS_MAGNITUD_LOTE:
+            nombre = f"{region}_m{minima or 'todas'}_{maxima or ''}".rstrip('_')
+            vistas.append({'nombre': nombre, 'centro': centro, 'zoom': zoom, 'bbox': bbox,
+                           'magnitud_minima': minima, 'magnitud_maxima': maxima,
+                           'salida': os.path.join(directorio, f"{nombre}.html")})
+    return vistas
+
+
+def mapa_por_ejecucion(vista):
+    """
+    Lo que hacía una ejecución del script por vista: descargar el feed, filtrarlo con
+    pandas, crear el mapa y guardarlo.
+    """
+    df = mi.obtener_datos("terremotos")
+    if vista['bbox']:
+        lat_min, lat_max, lon_min, lon_max = vista['bbox']
+        df = df[df['lat'].between(lat_min, lat_max) & df['lon'].between(lon_min, lon_max)]
+    if vista['magnitud_minima'] is not None:
+        df = df[df['magnitud'] >= vista['magnitud_minima']]
+    if vista['magnitud_maxima'] is not None:
+        df = df[df['magnitud'] < vista['magnitud_maxima']]
+    mi.CENTER_COORDS, mi.ZOOM_INICIAL = vista['centro'], vista['zoom']
+    mi.guardar_mapa_atomico(mi.crear_mapa_interactivo(df), vista['salida'])
+
+
+def benchmark_lote(tamaños, procesos):
+    """
+    Mapas por minuto para 16 vistas (4 regiones x 4 rangos de magnitud) sobre un feed
+    USGS simulado con RETARDO_FUENTES de latencia: una ejecución por vista frente al
+    modo lote (una descarga, puntos serializados una vez, índice espacial) con 1 y
+    varios procesos.
+    """
+    print("=" * 60)
+    print("       MODO LOTE: VARIAS VISTAS CON UNA SOLA CARGA")
+    print("=" * 60)
+    centro, zoom = mi.CENTER_COORDS, mi.ZOOM_INICIAL
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        vistas = vistas_lote(os.path.join(directorio, "mapas"))
+        os.makedirs(os.path.join(directorio, "mapas"))
+        ruta_vistas = os.path.join(directorio, "vistas.json")
+        with open(ruta_vistas, 'w', encoding='utf-8') as f:
+            json.dump({'fuente': 'terremotos', 'vistas': vistas}, f)
+        mi.DIRECTORIO_CACHE = os.path.join(directorio, 'cache')
+        mi.TTL_CACHE = {}
+        mi.MODO_INCREMENTAL = False
+        
+        print(f"{len(vistas)} vistas; feed con {RETARDO_FUENTES['terremotos']} s de latencia; {os.cpu_count()} CPU")
+        print(f"{'filas':>8} | {'modo':<23} | {'tiempo':>7} | {'mapas/min':>9} | {'mejora':>6}")
+        print("-" * 60)
+        for n in tamaños:
+            ruta_feed = os.path.join(directorio, f"feed_{n}.geojson")
+            with open(ruta_feed, 'wb') as f:
+                escribir_feed_usgs(n, f)
+            servidor, url_base = servir_archivo(ruta_feed, RETARDO_FUENTES['terremotos'])
+            mi.FEEDS_USGS = {clave: f"{url_base}/{clave}.geojson" for clave in mi.FEEDS_USGS}
+            
+            modos = [("una ejecución por vista", lambda: [mapa_por_ejecucion(vista) for vista in vistas])]
+            modos += [(f"lote, {p} proceso{'s' if p > 1 else ''}",
+                       lambda p=p: mi.generar_lote(ruta_vistas, procesos=p)) for p in procesos]
+            referencia = None
+            for nombre, funcion in modos:
+                segundos, _ = medir_minimo(funcion, 1)
+                referencia = referencia or segundos
+                print(f"{n:>8} | {nombre:<23} | {segundos:>6.2f}s | {len(vistas) / segundos * 60:>9.0f} | "
+                      f"{referencia / segundos:>5.1f}x")
+            servidor.shutdown()
+            servidor.server_close()
+    
+    mi.CENTER_COORDS, mi.ZOOM_INICIAL = centro, zoom
+    print()
+
+
+# Programa que ejecuta un subcomando de mapa_interactivo contra el feed simulado
+PROGRAMA_ARRANQUE = """
+import sys, webbrowser
+sys.path.insert(0, {repositorio!r})
+webbrowser.open = lambda *args, **kwargs: None
+import mapa_interactivo as mi
+mi.API_ELEGIDA = "terremotos"
+mi.FEEDS_USGS = {feeds!r}
+mi.TTL_CACHE = {{}}
+mi.ejecutar_comando(sys.argv[1:])
+"""
+
+
+def tiempo_de_imports(salida_importtime):
+    """
+    Suma los tiempos propios de todos los imports en la salida de -X importtime.
+    Retorna (milisegundos, módulos importados).
+    """
+    total, modulos = 0, set()
+    for linea in salida_importtime.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, _, modulo = linea[len('import time:'):].split('|')
+        total += int(propio)
+        modulos.add(modulo.strip())
+    return total / 1000, modulos
+
+
+def benchmark_arranque(repeticiones):
+    """
+    Imports (python -X importtime) y tiempo total de cada subcomando en un proceso nuevo,
+    contra un feed USGS simulado de 2.000 eventos. Se guarda el mejor de 'repeticiones'.
+    """
+    print("=" * 60)
+    print("       BENCHMARK: ARRANQUE POR SUBCOMANDO (-X importtime)")
+    print("=" * 60)
+    print(f"{'subcomando':<22} | {'imports':>9} | {'total':>7} | {'folium':>6}")
+    print("-" * 60)
+    repositorio = os.path.dirname(os.path.abspath(mi.__file__))
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_feed = os.path.join(directorio, "feed.geojson")
+        with open(ruta_feed, 'wb') as f:
+            escribir_feed_usgs(2000, f)
+        servidor, url_base = servir_archivo(ruta_feed, 0)
+        programa = os.path.join(directorio, "ejecutar.py")
+        with open(programa, 'w', encoding='utf-8') as f:
+            f.write(PROGRAMA_ARRANQUE.format(
+                repositorio=repositorio,
+                feeds={clave: f"{url_base}/{clave}.geojson" for clave in mi.FEEDS_USGS}))
+        
+        comandos = [
+            ("solo import", ['-c', f"import sys; sys.path.insert(0, {repositorio!r}); import mapa_interactivo"]),
+            ("actualizar (fetch)", [programa, 'actualizar']),
+            ("exportar (export)", [programa, 'exportar']),
+            ("mapa", [programa]),
+        ]
+        for nombre, argumentos in comandos:
+            mejor_imports, mejor_total, modulos = float('inf'), float('inf'), set()
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                proceso = subprocess.run([sys.executable, '-X', 'importtime', *argumentos], cwd=directorio,
+                                         capture_output=True, text=True, check=True)
+                total = time.perf_counter() - inicio
+                milisegundos, modulos = tiempo_de_imports(proceso.stderr)
+                mejor_imports, mejor_total = min(mejor_imports, milisegundos), min(mejor_total, total)
+            print(f"{nombre:<22} | {mejor_imports:>7.0f}ms | {mejor_total:>6.2f}s | "
+                  f"{'sí' if 'folium' in modulos else 'no':>6}")
+        servidor.shutdown()
+        servidor.server_close()
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de mapa_interactivo.py")
+    parser.add_argument('--tamaños', type=int, nargs='+', default=None,
+                        help="Filas por prueba (por defecto 2000 50000 500000; en la suite, 1000 a 1000000)")
+    parser.add_argument('--limite-iterrows', type=int, default=50000,
+                        help="No ejecutar el bucle original por encima de este número de filas")
+    parser.add_argument('--estaciones', type=int, default=200,
+                        help="Número de estaciones para el benchmark de clima")
+    parser.add_argument('--procesos', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="Procesos a comparar en el benchmark de fragmentos")
+    parser.add_argument('--retardo-lento', type=float, default=5.0,
+                        help="Segundos que tarda FIRMS en el escenario de fuente lenta")
+    parser.add_argument('--ciclos', type=int, default=40,
+                        help="Ciclos de refresco en el benchmark de resiliencia")
+    parser.add_argument('--solo', choices=['marcadores', 'salida', 'clima', 'ingesta', 'heatmap', 'indice',
+                                           'exportacion', 'fragmentos', 'esquema', 'fuentes', 'reproduccion',
+                                           'cache_capas', 'arranque', 'resiliencia', 'lote',
+                                           'suite'],
+                        help="Ejecutar solo uno de los benchmarks (la suite solo se ejecuta así)")
+    parser.add_argument('--fuentes', nargs='+', choices=['terremotos', 'clima'], default=['terremotos', 'clima'],
+                        help="Fuentes de datos de la suite")
+    parser.add_argument('--repeticiones', type=int, default=3,
+                        help="Repeticiones por etapa en la suite (se guarda el mejor tiempo)")
+    parser.add_argument('--guardar', metavar='ARCHIVO', help="Guardar los resultados de la suite en JSON")
+    parser.add_argument('--comparar', metavar='ARCHIVO',
+                        help="Comparar la suite con resultados guardados; falla si hay regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help="Aumento de tiempo permitido frente a la referencia (0.2 = 20%%)")
+    args = parser.parse_args()
+    
+    if args.solo == 'suite':
+        tamaños = args.tamaños or [1000, 10000, 100000, 1000000]
+        resultados = ejecutar_suite(args.fuentes, tamaños, args.repeticiones, args.estaciones)
+        if args.guardar:
+            guardar_resultados(resultados, args.guardar, args.repeticiones)
+        if args.comparar and not comparar_con_referencia(resultados, args.comparar, args.tolerancia):
+            sys.exit(1)
+        return
+    args.tamaños = args.tamaños or [2000, 50000, 500000]
+    
+    if args.solo in (None, 'marcadores'):
+        benchmark_marcadores(args.tamaños, args.limite_iterrows)
+    if args.solo in (None, 'salida'):
+        if not benchmark_salida(args.tamaños):
+            sys.exit(1)
+    if args.solo in (None, 'clima'):
+        benchmark_clima(args.estaciones, [4, 8, 16])
+    if args.solo in (None, 'ingesta'):
+        benchmark_ingesta(args.tamaños)
+    if args.solo in (None, 'heatmap'):
+        benchmark_heatmap(args.tamaños, args.limite_iterrows)
+    if args.solo in (None, 'indice'):
+        benchmark_indice(args.tamaños)
+    if args.solo in (None, 'exportacion'):
+        benchmark_exportacion(args.tamaños)
+    if args.solo in (None, 'fragmentos'):
+        benchmark_fragmentos(args.tamaños, args.procesos)
+    if args.solo in (None, 'esquema'):
+        benchmark_esquema(args.tamaños)
+    if args.solo in (None, 'reproduccion'):
+        benchmark_reproduccion(args.tamaños)
+    if args.solo in (None, 'cache_capas'):
+        benchmark_cache_capas(args.tamaños)
+    if args.solo in (None, 'arranque'):
+        benchmark_arranque(args.repeticiones)
+    if args.solo in (None, 'fuentes'):
+        benchmark_fuentes(args.tamaños, args.estaciones, args.retardo_lento, args.repeticiones)
+    if args.solo in (None, 'resiliencia'):
+        benchmark_resiliencia(args.ciclos)
+    if args.solo in (None, 'lote'):
+        benchmark_lote([n for n in args.tamaños if n <= 100000], [1, 4])
+
+
+if __name__ == "__main__":
+    main()
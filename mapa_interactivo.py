@@ -7,18 +7,38 @@ Autor: [Andres]
 Fecha: 2025
 """
 
-import warnings
-warnings.filterwarnings('ignore')
-
+import argparse
+import cProfile
+import functools
+import glob
+import hashlib
+import importlib.util
+import io
 import json
 import os
+import pstats
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
 import webbrowser
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
 
-import folium
+import numpy as np
 import pandas as pd
 import requests
-from folium.plugins import MarkerCluster, HeatMap, Fullscreen, MiniMap
+
+# folium (con branca y jinja2) se importa dentro de las funciones que crean el mapa:
+# cuesta unos 200 ms y los subcomandos actualizar/exportar no lo necesitan
 
 # Configuración
 API_ELEGIDA = "clima"  
@@ -27,242 +47,2645 @@ CENTER_COORDS = [-33.4489, -70.6693]
 ZOOM_INICIAL = 6
 ARCHIVO_SALIDA = "mapa_interactivo.html"
 ARCHIVO_JSON_FALLBACK = "datos_ejemplo.json"
+MODO_SALIDA = "geojson"  # "geojson" (compacto, estilo en el navegador) o "marcadores"
+GEOJSON_EXTERNO = False  # True: escribir los puntos en ARCHIVO_GEOJSON (requiere servidor HTTP)
+ARCHIVO_GEOJSON = "mapa_interactivo.geojson"
+DETALLES_EXTERNOS = False  # True: tooltips y popups en ARCHIVO_DETALLES, descargados al abrir el primero (requiere servidor HTTP)
+ARCHIVO_DETALLES = "mapa_interactivo_detalles.json"
+AGREGACION_ESPACIAL = False  # True: mostrar celdas agregadas por zoom; los puntos van a ARCHIVO_GEOJSON (requiere servidor HTTP)
+ZOOM_UMBRAL_MARCADORES = 8  # Desde este zoom se muestran los puntos individuales
+ARCHIVO_NIVELES = "mapa_interactivo_nivel_{zoom}.json"  # Celdas de cada zoom, descargadas al llegar a ese nivel
+FORMATOS_EXPORTACION = []  # Archivo histórico particionado por fecha: "csv.gz", "csv.zst", "parquet", "feather"
+DIRECTORIO_EXPORTACION = "exportaciones"
+CELDAS_POR_TESELA = 4  # Celdas por lado de una tesela de 256 px en cada nivel de zoom
+TAMAÑO_CELDA_HEATMAP = 0.1  # Grados; los pesos se suman por celda (None: un punto por dato)
+HEATMAP_CON_TIEMPO = False  # True: HeatMapWithTime con un cuadro por PERIODO_HEATMAP
+PERIODO_HEATMAP = "D"  # Periodo de cada cuadro ("h" por hora, "D" por día)
+REPRODUCCION_TEMPORAL = False  # True: capa con deslizador de tiempo que reproduce los eventos por cuadros
+PERIODO_REPRODUCCION = "h"  # Duración de cada cuadro ("h" por hora, "D" por día)
+CUADROS_VISIBLES = 6  # Cada cuadro muestra los eventos de los últimos N periodos
+INTERVALO_REPRODUCCION_MS = 300  # Tiempo entre cuadros al reproducir
+PROCESOS_RENDER = 1  # >1: construir las capas en varios procesos, repartiendo los datos en fragmentos
+DIVISION_FRAGMENTOS = "region"  # "region" (franjas de longitud) o "tiempo" (intervalos de fecha)
+FILAS_MINIMAS_FRAGMENTOS = 20000  # Por debajo, el coste de los procesos no compensa
+PAGINAS_POR_FRAGMENTO = False  # True: una página HTML por fragmento y ARCHIVO_SALIDA como índice
+ARCHIVO_VISTAS = "vistas.json"  # Vistas del subcomando lote: centro, zoom, bbox, magnitudes y archivo de salida
+PROCESOS_LOTE = 1  # Procesos que generan a la vez las vistas del lote
+CACHE_CAPAS = False  # True: guardar en disco los fragmentos de capa ya serializados y reutilizar los que no cambian
+DIRECTORIO_CACHE_CAPAS = ".cache_capas"
+TAMAÑO_MAXIMO_CACHE_CAPAS_MB = 200  # Al superarlo se borran los fragmentos usados hace más tiempo
+ANCHO_FRANJA_CACHE = 10  # Grados de longitud por fragmento cuando los datos no tienen 'fecha'
+URL_OPENWEATHER = "http://api.openweathermap.org/data/2.5/weather"
+CONCURRENCIA_MAXIMA = 8  # Peticiones simultáneas a OpenWeatherMap
+PETICIONES_POR_SEGUNDO_HOST = 20  # Límite de ritmo por host
+TIMEOUT_CONEXION = 3.05  # Segundos para abrir la conexión TCP/TLS
+TIMEOUT_LECTURA = 10  # Segundos máximos sin recibir bytes una vez conectado
+REINTENTOS_MAXIMOS = 3  # Reintentos ante errores de red, 429 o 5xx
+ESPERA_BASE_REINTENTO = 0.5  # Segundos; la espera es aleatoria entre 0 y base * 2^intento
+ESPERA_MAXIMA_REINTENTO = 8
+PLAZO_REINTENTOS = 20  # Segundos máximos por petición contando los reintentos
+FALLOS_PARA_ABRIR_CIRCUITO = 5  # Fallos seguidos de una fuente que cortan sus peticiones
+SEGUNDOS_CIRCUITO_ABIERTO = 60  # Pausa antes de dejar pasar una petición de prueba
+SERVIR_OBSOLETO = False  # True: con el TTL vencido, entregar la copia guardada al instante y refrescarla en segundo plano
+EDAD_MAXIMA_OBSOLETO = 24 * 3600  # Segundos; una copia más antigua no se usa ni como respaldo
+FUENTES_MAPA = []  # Varias fuentes en un mismo mapa, una capa por fuente: p. ej. ["terremotos", "clima", "incendios"]
+TIMEOUT_FUENTES = 30  # Segundos máximos de espera por fuente en el mapa de varias fuentes
+API_KEY_FIRMS = ""  # Clave de NASA FIRMS (https://firms.modaps.eosdis.nasa.gov/api/)
+ARCHIVO_FIRMS = "incendios_firms.csv"  # CSV de FIRMS local; si existe se usa en lugar de la API
+URL_FIRMS = "https://firms.modaps.eosdis.nasa.gov/api/area/csv/{clave}/VIIRS_SNPP_NRT/{area}/{dias}"
+AREA_FIRMS = "-76,-56,-66,-17"  # oeste,sur,este,norte (Chile continental)
+DIAS_FIRMS = 2  # Días de detecciones (1 a 10)
+MAGNITUD_MINIMA = 2.0
+ESQUEMA_COMPACTO = True  # float32, fechas datetime64 y textos repetidos como categorías tras obtener los datos
+FORMATO_FECHA = "%Y-%m-%d %H:%M"  # Formato de 'fecha' en popups y CSV
+
+# Feeds de USGS; el modo incremental parte de "mes" y luego consulta "hora" o "dia"
+FEEDS_USGS = {
+    "hora": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_hour.geojson",
+    "dia": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson",
+    "mes": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_month.geojson"
+}
+FILTRO_BBOX = None  # (lat_min, lat_max, lon_min, lon_max) aplicado mientras se lee el feed
+FILTRO_DIAS = None  # Solo eventos de los últimos N días
+FILTRO_RADIO_KM = None  # Solo eventos a menos de N km de CENTER_COORDS
+MODO_INCREMENTAL = False  # True: mantener un almacén local y descargar solo los cambios
+DIRECTORIO_ALMACEN = "almacen_terremotos"
+VENTANA_DIAS = 30
+DIRECTORIO_CACHE = ".cache_http"
+TTL_CACHE = {"terremotos": 5 * 60, "clima": 10 * 60, "incendios": 15 * 60}  # Segundos que una respuesta se usa sin revalidar
+TAMAÑO_TROZO = 64 * 1024  # Bytes leídos por iteración al descargar o leer de la caché
+
+CIUDADES_CHILE = [
+    ("Santiago", -33.4489, -70.6693),
+    ("Valparaíso", -33.0458, -71.6197),
+    ("Concepción", -36.8269, -73.0497),
+    ("Antofagasta", -23.6500, -70.4000),
+    ("Puerto Montt", -41.4718, -72.9396),
+    ("Iquique", -20.2208, -70.1431),
+    ("La Serena", -29.9027, -71.2519)
+]
+
+
+# Segundos acumulados por etapa del ciclo actual (descarga, procesado, render, escritura)
+METRICAS_ETAPAS = {}
+# Detalle por etapa (llamadas y, con tracemalloc activo, memoria) y por petición HTTP
+DETALLE_ETAPAS = {}
+METRICAS_PETICIONES = []
+MEMORIA_PICO = {'bytes': 0}
+
+
+@contextmanager
+def medir_etapa(nombre):
+    """
+    Acumula en METRICAS_ETAPAS el tiempo que tarda el bloque. Si tracemalloc está
+    activo, guarda también en DETALLE_ETAPAS la memoria neta y el pico del bloque
+    (aproximado cuando hay etapas anidadas).
+    """
+    trazando = tracemalloc.is_tracing()
+    if trazando:
+        memoria_inicio, pico = tracemalloc.get_traced_memory()
+        MEMORIA_PICO['bytes'] = max(MEMORIA_PICO['bytes'], pico)
+        tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        METRICAS_ETAPAS[nombre] = METRICAS_ETAPAS.get(nombre, 0.0) + segundos
+        detalle = DETALLE_ETAPAS.setdefault(nombre, {'segundos': 0.0, 'llamadas': 0})
+        detalle['segundos'] += segundos
+        detalle['llamadas'] += 1
+        if trazando:
+            memoria_fin, pico = tracemalloc.get_traced_memory()
+            MEMORIA_PICO['bytes'] = max(MEMORIA_PICO['bytes'], pico)
+            detalle['memoria_neta_bytes'] = detalle.get('memoria_neta_bytes', 0) + memoria_fin - memoria_inicio
+            detalle['memoria_pico_bytes'] = max(detalle.get('memoria_pico_bytes', 0), pico - memoria_inicio)
+
+
+def registrar_peticion(fuente, etiqueta, origen, bytes_recibidos, primer_byte, total):
+    """
+    Guarda las métricas de una petición (o lectura de caché) para el informe de perfil.
+    """
+    METRICAS_PETICIONES.append({
+        'fuente': fuente,
+        'etiqueta': etiqueta,
+        'origen': origen,
+        'bytes': bytes_recibidos,
+        'primer_byte_s': round(primer_byte, 6),
+        'total_s': round(total, 6)
+    })
+
+
+def reiniciar_metricas():
+    """
+    Vacía las métricas del ciclo anterior, también los contadores de la caché HTTP para
+    que se informen por ciclo igual que los tiempos.
+    """
+    METRICAS_ETAPAS.clear()
+    DETALLE_ETAPAS.clear()
+    METRICAS_PETICIONES.clear()
+    with _candado_cache:
+        ESTADISTICAS_CACHE.clear()
+
+
+# Registro de fuentes: nombre → función que obtiene sus datos. Cada función retorna un
+# DataFrame, o None si la fuente no está disponible
+FUENTES_DATOS = {}
+
 
+def registrar_fuente(nombre):
+    """
+    Decorador que registra la función que obtiene los datos de una fuente.
+    """
+    def registrar(funcion):
+        FUENTES_DATOS[nombre] = funcion
+        return funcion
+    return registrar
 
-def obtener_datos_api():
+
+def obtener_datos_api(fuente=None):
     """
     Obtiene datos reales de una API pública según la opción seleccionada.
     Retorna un DataFrame de pandas con los datos procesados.
     """
+    fuente = fuente or API_ELEGIDA
+    if fuente not in FUENTES_DATOS:
+        print("Opción no válida, usando datos de ejemplo...")
+        return usar_datos_ejemplo()
     
-    if API_ELEGIDA == "terremotos":
-        # API de terremotos de USGS (últimos 30 días)
-        url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_month.geojson"
-        print("Obteniendo datos de terremotos recientes (USGS API)...")
+    df = FUENTES_DATOS[fuente]()
+    if df is None:
+        print("Usando datos de ejemplo...")
+        return usar_datos_ejemplo()
+    return df
+
+
+@registrar_fuente("terremotos")
+def obtener_terremotos():
+    """
+    Terremotos de los últimos 30 días (USGS API).
+    """
+    print("Obteniendo datos de terremotos recientes (USGS API)...")
+    
+    try:
+        if MODO_INCREMENTAL:
+            df = actualizar_almacen_terremotos()
+            df = df[df['magnitud'] >= MAGNITUD_MINIMA].reset_index(drop=True)
+        else:
+            # Descarga y lectura van juntas: el feed se filtra mientras llega
+            with medir_etapa('descarga'), crear_sesion_http(1) as sesion:
+                trozos = iterar_con_cache(sesion, FEEDS_USGS['mes'], "terremotos")
+                df = leer_terremotos_streaming(trozos, MAGNITUD_MINIMA, **filtros_terremotos())
+        
+        print(f"✓ {len(df)} terremotos obtenidos de la API")
+        return df
+        
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"✗ Error al obtener datos de terremotos: {e}")
+        return None
+
+
+@registrar_fuente("clima")
+def obtener_clima():
+    """
+    Condiciones actuales en las ciudades de CIUDADES_CHILE (OpenWeatherMap API).
+    """
+    if not API_KEY_OPENWEATHER:
+        print("⚠️  Advertencia: No hay API key para OpenWeatherMap")
+        return None
+    
+    print("Obteniendo datos climáticos (OpenWeatherMap API)...")
+    with medir_etapa('descarga'):
+        datos_procesados = obtener_clima_concurrente(CIUDADES_CHILE)
+    
+    if not datos_procesados:
+        print("✗ No se obtuvieron datos climáticos para ninguna ciudad")
+        return None
+    
+    with medir_etapa('procesado'):
+        df = pd.DataFrame(datos_procesados)
+    print(f"✓ Datos climáticos obtenidos para {len(df)} de {len(CIUDADES_CHILE)} ciudades")
+    return df
+
+
+@registrar_fuente("incendios")
+def obtener_incendios():
+    """
+    Focos de calor activos de NASA FIRMS en CSV: desde ARCHIVO_FIRMS si existe
+    (descarga manual o backend simulado) o desde la API de área con API_KEY_FIRMS.
+    """
+    try:
+        if os.path.exists(ARCHIVO_FIRMS):
+            print(f"Leyendo focos de incendio desde {ARCHIVO_FIRMS} (NASA FIRMS)...")
+            with medir_etapa('procesado'):
+                df = leer_csv_firms(ARCHIVO_FIRMS)
+        elif API_KEY_FIRMS:
+            print("Obteniendo focos de incendio activos (NASA FIRMS API)...")
+            url = URL_FIRMS.format(clave=API_KEY_FIRMS, area=AREA_FIRMS, dias=DIAS_FIRMS)
+            # La clave va en la ruta de la URL: se registra con una etiqueta fija
+            with medir_etapa('descarga'), crear_sesion_http(1) as sesion:
+                contenido = obtener_con_cache(sesion, url, "incendios", etiqueta="FIRMS")
+            with medir_etapa('procesado'):
+                df = leer_csv_firms(io.BytesIO(contenido))
+        else:
+            print("⚠️  API de incendios requiere clave especial (API_KEY_FIRMS) o un CSV en ARCHIVO_FIRMS")
+            return None
+        
+        print(f"✓ {len(df)} focos de incendio obtenidos")
+        return df
         
+    except (requests.exceptions.RequestException, OSError, KeyError, ValueError) as e:
+        print(f"✗ Error al obtener datos de incendios: {e}")
+        return None
+
+
+# Confianza de VIIRS (l/n/h); en MODIS es un porcentaje y se deja tal cual
+CONFIANZA_FIRMS = {'l': 'baja', 'n': 'nominal', 'h': 'alta'}
+
+
+def leer_csv_firms(origen):
+    """
+    Lee un CSV de FIRMS (VIIRS o MODIS) desde una ruta o un buffer y lo normaliza a las
+    columnas lat, lon, brillo, frp, confianza, satelite, fecha y tipo.
+    """
+    crudo = pd.read_csv(origen, dtype={'acq_date': str, 'acq_time': str, 'confidence': str})
+    brillo = crudo['bright_ti4'] if 'bright_ti4' in crudo.columns else crudo['brightness']
+    # acq_time viene como HHMM (UTC), a veces sin ceros a la izquierda
+    hora = crudo['acq_time'].str.zfill(4)
+    
+    return pd.DataFrame({
+        'lat': crudo['latitude'],
+        'lon': crudo['longitude'],
+        'brillo': brillo,
+        'frp': crudo['frp'],
+        'confianza': crudo['confidence'].replace(CONFIANZA_FIRMS),
+        'satelite': crudo['satellite'] if 'satellite' in crudo.columns else 'Desconocido',
+        'fecha': crudo['acq_date'] + ' ' + hora.str[:2] + ':' + hora.str[2:],
+        'tipo': 'Incendio'
+    })
+
+
+def obtener_fuente(fuente):
+    """
+    Obtiene una fuente del registro sin recurrir a datos de ejemplo.
+    Retorna None si la fuente falla o no tiene datos.
+    """
+    df = FUENTES_DATOS[fuente]()
+    if df is None or df.empty:
+        return None
+    return aplicar_esquema(df) if ESQUEMA_COMPACTO else df
+
+
+def obtener_fuentes_concurrente(fuentes, timeout=None):
+    """
+    Obtiene varias fuentes a la vez, cada una en su propio hilo. Las que fallan o no
+    terminan en timeout segundos (TIMEOUT_FUENTES) se omiten sin retrasar al resto.
+    Retorna {fuente: DataFrame} con las fuentes que respondieron, en el orden pedido.
+    """
+    timeout = TIMEOUT_FUENTES if timeout is None else timeout
+    ejecutor = ThreadPoolExecutor(max_workers=len(fuentes))
+    futuros = {ejecutor.submit(obtener_fuente, fuente): fuente for fuente in fuentes}
+    terminados, pendientes = wait(futuros, timeout=timeout)
+    # No se espera a las fuentes lentas: su hilo termina con el timeout de la petición
+    ejecutor.shutdown(wait=False, cancel_futures=True)
+    
+    datos = {}
+    for futuro in terminados:
+        fuente = futuros[futuro]
         try:
-            respuesta = requests.get(url, timeout=10)
-            respuesta.raise_for_status()
-            datos = respuesta.json()
-            
-            # Procesar datos GeoJSON
-            features = datos['features']
-            datos_procesados = []
-            
-            for feature in features:
-                props = feature['properties']
-                coords = feature['geometry']['coordinates']
-                
-                # Filtrar solo terremotos con magnitud significativa
-                if props['mag'] is not None and props['mag'] >= 2.0:
-                    datos_procesados.append({
-                        'magnitud': props['mag'],
-                        'lugar': props['place'],
-                        'lat': coords[1],
-                        'lon': coords[0],
-                        'profundidad': coords[2],
-                        'fecha': datetime.fromtimestamp(props['time']/1000).strftime('%Y-%m-%d %H:%M'),
-                        'tipo': 'Terremoto'
-                    })
-            
-            df = pd.DataFrame(datos_procesados)
-            print(f"✓ {len(df)} terremotos obtenidos de la API")
-            return df
-            
-        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
-            print(f"✗ Error al obtener datos de terremotos: {e}")
-            print("Usando datos de ejemplo...")
-            return usar_datos_ejemplo()
+            df = futuro.result()
+        except Exception as e:
+            print(f"✗ Error en la fuente {fuente}: {e}")
+            continue
+        if df is None:
+            print(f"✗ {fuente}: sin datos, se omite su capa")
+        else:
+            datos[fuente] = df
+    for futuro in pendientes:
+        print(f"✗ {futuros[futuro]}: sin respuesta en {timeout} s, se omite su capa")
     
-    elif API_ELEGIDA == "clima":
-        # API de OpenWeatherMap para ciudades de Chile
-        if not API_KEY_OPENWEATHER:
-            print("⚠️  Advertencia: No hay API key para OpenWeatherMap")
-            print("Usando datos de ejemplo...")
-            return usar_datos_ejemplo()
-        
-        ciudades_chile = [
-            ("Santiago", -33.4489, -70.6693),
-            ("Valparaíso", -33.0458, -71.6197),
-            ("Concepción", -36.8269, -73.0497),
-            ("Antofagasta", -23.6500, -70.4000),
-            ("Puerto Montt", -41.4718, -72.9396),
-            ("Iquique", -20.2208, -70.1431),
-            ("La Serena", -29.9027, -71.2519)
-        ]
+    return {fuente: datos[fuente] for fuente in fuentes if fuente in datos}
+
+
+# Columnas de texto con muchos valores repetidos, guardadas como categorías (cada
+# texto distinto se guarda una vez y las filas solo llevan un código entero)
+COLUMNAS_CATEGORICAS = ('tipo', 'lugar', 'ciudad', 'descripcion', 'confianza', 'satelite')
+COLUMNAS_FLOAT32 = ('lat', 'lon', 'magnitud', 'profundidad', 'temperatura', 'viento', 'brillo', 'frp')
+COLUMNAS_ENTERAS = ('humedad',)
+
+
+def aplicar_esquema(df):
+    """
+    Convierte el DataFrame a tipos compactos: float32 en coordenadas y medidas, enteros
+    del menor tamaño posible, 'fecha' como datetime64 (solo si todas las fechas se
+    pueden leer con FORMATO_FECHA) y textos repetidos como categorías.
+    Muestra la memoria antes y después.
+    """
+    if df.empty:
+        return df
+    
+    antes = df.memory_usage(deep=True).sum()
+    df = df.copy()
+    for columna in COLUMNAS_FLOAT32:
+        if columna in df.columns:
+            df[columna] = pd.to_numeric(df[columna], errors='coerce').astype(np.float32)
+    for columna in COLUMNAS_ENTERAS:
+        if columna in df.columns and pd.api.types.is_integer_dtype(df[columna]):
+            df[columna] = pd.to_numeric(df[columna], downcast='integer')
+    
+    if 'fecha' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['fecha']):
+        fechas = pd.to_datetime(df['fecha'], format=FORMATO_FECHA, errors='coerce')
+        if not (fechas.isna() & df['fecha'].notna()).any():
+            df['fecha'] = fechas
+    
+    for columna in COLUMNAS_CATEGORICAS:
+        if columna in df.columns and not isinstance(df[columna].dtype, pd.CategoricalDtype):
+            df[columna] = df[columna].astype('category')
+    
+    despues = df.memory_usage(deep=True).sum()
+    escala, unidad = (1e6, 'MB') if antes >= 1e6 else (1e3, 'KB')
+    print(f"✓ Esquema compacto: {antes / escala:.2f} {unidad} → {despues / escala:.2f} {unidad}")
+    return df
+
+
+def fechas_como_texto(df):
+    """
+    Copia del DataFrame con las columnas datetime64 como texto en FORMATO_FECHA (vacío
+    si falta), para exportar a CSV igual que antes y más rápido que date_format.
+    """
+    columnas = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+    if not columnas:
+        return df
+    df = df.copy()
+    for columna in columnas:
+        df[columna] = columna_como_texto(df[columna]).where(df[columna].notna(), '')
+    return df
+
+
+def obtener_datos(fuente=None):
+    """
+    Obtiene los datos de la API y, con ESQUEMA_COMPACTO, los convierte a tipos compactos.
+    """
+    df = obtener_datos_api(fuente)
+    return aplicar_esquema(df) if ESQUEMA_COMPACTO else df
+
+
+def columna_como_texto(valores):
+    """
+    Texto de cada valor tal como aparece en popups y tooltips: fechas con FORMATO_FECHA
+    y valores faltantes como en str.format ('nan' en columnas numéricas, 'None' en el resto).
+    """
+    if pd.api.types.is_datetime64_any_dtype(valores):
+        # strftime fila a fila es lento; se formatea cada fecha distinta una sola vez.
+        # factorize marca NaT con -1, que apunta al 'None' añadido al final
+        codigos, unicas = pd.factorize(valores)
+        textos = np.append(np.asarray(unicas.strftime(FORMATO_FECHA), dtype=object), 'None')
+        return pd.Series(textos[codigos], index=valores.index)
+    faltante = 'nan' if pd.api.types.is_float_dtype(valores) else 'None'
+    return valores.astype(str).fillna(faltante)
+
+
+# Inicio del array "features" y de cada feature dentro de él. En los feeds de USGS cada
+# feature empieza con {"type":"Feature", por lo que basta buscar ese marcador
+PATRON_INICIO_FEATURES = re.compile(rb'"features"\s*:\s*\[')
+PATRON_INICIO_FEATURE = re.compile(rb'\{\s*"type"\s*:\s*"Feature"\s*,')
+
+# Campos de cada feature de USGS que se extraen directamente de los bytes
+PATRONES_FEATURE_USGS = {
+    'mag': re.compile(rb'"mag":\s*(-?[0-9.eE+-]+|null)'),
+    'place': re.compile(rb'"place":\s*("(?:[^"\\]|\\.)*"|null)'),
+    'time': re.compile(rb'"time":\s*(-?\d+)'),
+    'updated': re.compile(rb'"updated":\s*(-?\d+)'),
+    'coordinates': re.compile(rb'"coordinates":\s*\[([^\]]*)\]'),
+    'id': re.compile(rb'"id":\s*"((?:[^"\\]|\\.)*)"')
+}
+
+
+def iterar_features_json(trozos):
+    """
+    Recorre un FeatureCollection de USGS que llega en trozos de bytes y entrega los
+    bytes de cada feature a medida que se completan, sin decodificar el JSON.
+    Nunca mantiene en memoria más que el trozo actual y la feature incompleta.
+    """
+    buffer = b''
+    en_features = False
+    
+    for trozo in trozos:
+        buffer += trozo
+        
+        if not en_features:
+            inicio = PATRON_INICIO_FEATURES.search(buffer)
+            if inicio is None:
+                # Conservar el final por si la clave "features" quedó partida entre trozos
+                buffer = buffer[-32:]
+                continue
+            buffer = buffer[inicio.end():]
+            en_features = True
+        
+        # Cada feature termina donde empieza la siguiente; la última puede estar incompleta
+        inicios = [m.start() for m in PATRON_INICIO_FEATURE.finditer(buffer)]
+        for desde, hasta in zip(inicios, inicios[1:]):
+            yield buffer[desde:hasta]
+        if inicios:
+            buffer = buffer[inicios[-1]:]
+    
+    if en_features and PATRON_INICIO_FEATURE.match(buffer):
+        yield buffer
+
+
+def leer_terremotos_streaming(trozos, magnitud_minima=None, bbox=None, desde_ms=None, hasta_ms=None):
+    """
+    Lee un GeoJSON de USGS en trozos y filtra por magnitud, bbox (lat_min, lat_max,
+    lon_min, lon_max) y rango de tiempo mientras se lee. Los eventos sin magnitud,
+    tiempo o coordenadas se omiten. Los valores se escriben
+    directamente en columnas tipadas (float32 para coordenadas, profundidad y magnitud;
+    int64 para tiempos en ms) sin crear un dict por evento.
+    """
+    columnas_f32 = {c: array('f') for c in ('magnitud', 'lat', 'lon', 'profundidad')}
+    columnas_i64 = {c: array('q') for c in ('tiempo', 'actualizado')}
+    ids, lugares = [], []
+    p = PATRONES_FEATURE_USGS
+    
+    for feature in iterar_features_json(trozos):
+        mag = p['mag'].search(feature)
+        if mag is None or mag.group(1) == b'null':
+            continue
+        magnitud = float(mag.group(1))
+        if magnitud_minima is not None and magnitud < magnitud_minima:
+            continue
         
-        datos_procesados = []
-        print("Obteniendo datos climáticos (OpenWeatherMap API)...")
+        tiempo = p['time'].search(feature)
+        if tiempo is None:
+            continue
+        tiempo = int(tiempo.group(1))
+        if (desde_ms is not None and tiempo < desde_ms) or (hasta_ms is not None and tiempo > hasta_ms):
+            continue
         
+        # Sin geometría ("geometry": null) o con coordenadas incompletas se omite el evento
+        coords = p['coordinates'].search(feature)
+        if coords is None:
+            continue
+        coords = coords.group(1).split(b',')
         try:
-            for ciudad, lat, lon in ciudades_chile:
-                url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={API_KEY_OPENWEATHER}&units=metric&lang=es"
-                respuesta = requests.get(url, timeout=10)
-                
-                if respuesta.status_code == 200:
-                    datos = respuesta.json()
-                    datos_procesados.append({
-                        'ciudad': ciudad,
-                        'temperatura': datos['main']['temp'],
-                        'humedad': datos['main']['humidity'],
-                        'viento': datos['wind']['speed'],
-                        'descripcion': datos['weather'][0]['description'],
-                        'lat': lat,
-                        'lon': lon,
-                        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M'),
-                        'tipo': 'Clima'
-                    })
-                    print(f"  ✓ Datos obtenidos para {ciudad}")
-            
-            df = pd.DataFrame(datos_procesados)
-            print(f"✓ Datos climáticos obtenidos para {len(df)} ciudades")
-            return df
-            
-        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
-            print(f"✗ Error al obtener datos climáticos: {e}")
-            print("Usando datos de ejemplo...")
-            return usar_datos_ejemplo()
+            lon, lat = float(coords[0]), float(coords[1])
+        except (IndexError, ValueError):
+            continue
+        if bbox is not None and not (bbox[0] <= lat <= bbox[1] and bbox[2] <= lon <= bbox[3]):
+            continue
+        
+        actualizado = p['updated'].search(feature)
+        lugar = p['place'].search(feature)
+        id_evento = p['id'].search(feature)
+        
+        columnas_f32['magnitud'].append(magnitud)
+        columnas_f32['lat'].append(lat)
+        columnas_f32['lon'].append(lon)
+        columnas_f32['profundidad'].append(float(coords[2]) if len(coords) > 2 and coords[2].strip() != b'null' else float('nan'))
+        columnas_i64['tiempo'].append(tiempo)
+        columnas_i64['actualizado'].append(int(actualizado.group(1)) if actualizado else tiempo)
+        lugares.append(json.loads(lugar.group(1)) if lugar else None)
+        ids.append(id_evento.group(1).decode('utf-8') if id_evento else None)
     
-    elif API_ELEGIDA == "incendios":
-        # NASA FIRMS API para incendios activos (datos de ejemplo)
-        print("⚠️  API de incendios requiere clave especial, usando datos de ejemplo...")
-        return usar_datos_ejemplo()
+    tiempos = np.frombuffer(columnas_i64['tiempo'], dtype=np.int64)
+    return pd.DataFrame({
+        'id': ids,
+        'magnitud': np.frombuffer(columnas_f32['magnitud'], dtype=np.float32),
+        'lugar': lugares,
+        'lat': np.frombuffer(columnas_f32['lat'], dtype=np.float32),
+        'lon': np.frombuffer(columnas_f32['lon'], dtype=np.float32),
+        'profundidad': np.frombuffer(columnas_f32['profundidad'], dtype=np.float32),
+        'fecha': [datetime.fromtimestamp(t / 1000).strftime('%Y-%m-%d %H:%M') for t in tiempos.tolist()],
+        'tipo': 'Terremoto',
+        'tiempo': tiempos,
+        'actualizado': np.frombuffer(columnas_i64['actualizado'], dtype=np.int64)
+    })
+
+
+RADIO_TIERRA_KM = 6371.0088
+
+
+def distancia_haversine(lat1, lon1, lat2, lon2):
+    """
+    Distancia en km sobre la esfera entre puntos (acepta arrays de NumPy).
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class IndiceEspacial:
+    """
+    Índice de grilla sobre lat/lon para consultas por bbox, radio (haversine) y k vecinos
+    más cercanos. Los puntos se ordenan por celda, así que cada fila de celdas de una
+    consulta es un rango contiguo que se encuentra con searchsorted.
+    Las consultas retornan posiciones (0..n-1) en el orden de inserción.
+    """
+    
+    def __init__(self, lat=(), lon=(), tamaño_celda=1.0):
+        self.tamaño_celda = tamaño_celda
+        self.columnas = int(np.ceil(360.0 / tamaño_celda))
+        self.lat = np.empty(0)
+        self.lon = np.empty(0)
+        self.claves = np.empty(0, dtype=np.int64)
+        self.orden = np.empty(0, dtype=np.int64)
+        self.claves_ordenadas = np.empty(0, dtype=np.int64)
+        self.pendientes = 0
+        self.insertar(lat, lon)
+    
+    @classmethod
+    def desde_dataframe(cls, df, tamaño_celda=1.0):
+        return cls(df['lat'].to_numpy(dtype=float), df['lon'].to_numpy(dtype=float), tamaño_celda)
+    
+    def __len__(self):
+        return len(self.lat)
+    
+    def _celdas(self, lat, lon):
+        iy = np.floor((np.clip(lat, -90, 90) + 90.0) / self.tamaño_celda).astype(np.int64)
+        ix = np.floor((np.clip(lon, -180, 180) + 180.0) / self.tamaño_celda).astype(np.int64)
+        return iy, np.minimum(ix, self.columnas - 1)
+    
+    def _claves(self, lat, lon):
+        iy, ix = self._celdas(lat, lon)
+        return iy * self.columnas + ix
+    
+    def insertar(self, lat, lon):
+        """
+        Añade puntos nuevos. El orden por celda se actualiza en la siguiente consulta.
+        """
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        if len(lat) == 0:
+            return
+        self.lat = np.concatenate([self.lat, lat])
+        self.lon = np.concatenate([self.lon, lon])
+        self.claves = np.concatenate([self.claves, self._claves(lat, lon)])
+        self.pendientes += len(lat)
+    
+    def actualizar_orden(self):
+        """
+        Ordena por celda los puntos insertados desde la última consulta.
+        """
+        if not self.pendientes:
+            return
+        # Los puntos ya ordenados siguen en bloques ordenados: el sort estable (timsort)
+        # los fusiona con los nuevos sin reordenar todo desde cero
+        nuevos = np.arange(len(self.claves) - self.pendientes, len(self.claves))
+        candidatos = np.concatenate([self.orden, nuevos[np.argsort(self.claves[nuevos], kind='stable')]])
+        self.orden = candidatos[np.argsort(self.claves[candidatos], kind='stable')]
+        self.claves_ordenadas = self.claves[self.orden]
+        self.pendientes = 0
+    
+    def _candidatos_bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Posiciones en las celdas que tocan el bbox (sin filtrar por coordenadas exactas).
+        """
+        self.actualizar_orden()
+        if lon_min > lon_max:
+            # El bbox cruza el antimeridiano
+            return np.concatenate([self._candidatos_bbox(lat_min, lat_max, lon_min, 180.0),
+                                   self._candidatos_bbox(lat_min, lat_max, -180.0, lon_max)])
+        
+        (fila_min, fila_max), (col_min, col_max) = self._celdas(np.array([lat_min, lat_max]),
+                                                                np.array([lon_min, lon_max]))
+        if fila_min > fila_max:
+            return np.empty(0, dtype=np.int64)
+        
+        filas = np.arange(fila_min, fila_max + 1, dtype=np.int64) * self.columnas
+        inicios = np.searchsorted(self.claves_ordenadas, filas + col_min, side='left')
+        finales = np.searchsorted(self.claves_ordenadas, filas + col_max, side='right')
+        return np.concatenate([self.orden[i:f] for i, f in zip(inicios, finales)])
+    
+    def consultar_bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Posiciones de los puntos dentro del bbox. Si lon_min > lon_max, el bbox cruza el antimeridiano.
+        """
+        candidatos = self._candidatos_bbox(lat_min, lat_max, lon_min, lon_max)
+        lat, lon = self.lat[candidatos], self.lon[candidatos]
+        dentro_lon = (lon >= lon_min) & (lon <= lon_max) if lon_min <= lon_max else (lon >= lon_min) | (lon <= lon_max)
+        return np.sort(candidatos[(lat >= lat_min) & (lat <= lat_max) & dentro_lon])
+    
+    def consultar_radio(self, lat, lon, radio_km):
+        """
+        Posiciones de los puntos a menos de radio_km, ordenadas por distancia, y sus distancias.
+        """
+        dlat = np.degrees(radio_km / RADIO_TIERRA_KM)
+        lat_min, lat_max = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        
+        if lat_min <= -90.0 or lat_max >= 90.0 or dlat >= 90.0:
+            candidatos = self._candidatos_bbox(lat_min, lat_max, -180.0, 180.0)
+        else:
+            dlon = np.degrees(radio_km / (RADIO_TIERRA_KM * np.cos(np.radians(max(abs(lat_min), abs(lat_max))))))
+            if dlon >= 180.0:
+                candidatos = self._candidatos_bbox(lat_min, lat_max, -180.0, 180.0)
+            else:
+                lon_min = (lon - dlon + 180.0) % 360.0 - 180.0
+                lon_max = (lon + dlon + 180.0) % 360.0 - 180.0
+                candidatos = self._candidatos_bbox(lat_min, lat_max, lon_min, lon_max)
+        
+        distancias = distancia_haversine(lat, lon, self.lat[candidatos], self.lon[candidatos])
+        dentro = distancias <= radio_km
+        candidatos, distancias = candidatos[dentro], distancias[dentro]
+        orden = np.argsort(distancias, kind='stable')
+        return candidatos[orden], distancias[orden]
+    
+    def vecinos_cercanos(self, lat, lon, k):
+        """
+        Las k posiciones más cercanas (haversine), ordenadas por distancia, y sus distancias.
+        El radio de búsqueda empieza en una celda y se duplica hasta reunir k puntos.
+        """
+        k = min(k, len(self))
+        radio = self.tamaño_celda * 111.2
+        while True:
+            posiciones, distancias = self.consultar_radio(lat, lon, radio)
+            if len(posiciones) >= k or radio >= np.pi * RADIO_TIERRA_KM:
+                return posiciones[:k], distancias[:k]
+            radio *= 2
+
+
+def filtrar_por_radio(df, centro, radio_km):
+    """
+    Conserva solo las filas a menos de radio_km del centro (lat, lon), usando IndiceEspacial.
+    """
+    indice = IndiceEspacial.desde_dataframe(df)
+    posiciones, _ = indice.consultar_radio(centro[0], centro[1], radio_km)
+    return df.iloc[np.sort(posiciones)].reset_index(drop=True)
+
+
+def filtros_terremotos():
+    """
+    Filtros de bbox y tiempo para leer_terremotos_streaming según la configuración.
+    """
+    filtros = {'bbox': FILTRO_BBOX}
+    if FILTRO_DIAS:
+        filtros['desde_ms'] = int((time.time() - FILTRO_DIAS * 24 * 3600) * 1000)
+    return filtros
+
+
+def guardar_almacen(df, meta, directorio=None):
+    """
+    Guarda el almacén de eventos como un archivo .npy por columna más un meta.json.
+    Los textos se guardan como arrays Unicode de ancho fijo para poder mapearlos en memoria.
+    """
+    directorio = directorio or DIRECTORIO_ALMACEN
+    os.makedirs(directorio, exist_ok=True)
+    
+    for columna in df.columns:
+        valores = df[columna].to_numpy()
+        if valores.dtype == object:
+            valores = valores.astype(str)
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix='.tmp_', suffix='.npy')
+        with os.fdopen(descriptor, 'wb') as f:
+            np.save(f, valores)
+        os.replace(temporal, os.path.join(directorio, f"{columna}.npy"))
+    
+    # El meta.json se escribe al final: solo apunta a columnas ya completas
+    meta = dict(meta, columnas=list(df.columns), filas=len(df))
+    escribir_atomico(os.path.join(directorio, 'meta.json'), json.dumps(meta))
+
+
+def cargar_almacen(directorio=None):
+    """
+    Carga el almacén de eventos mapeando en memoria cada columna.
+    Retorna (DataFrame, meta) o (None, {}) si no existe.
+    """
+    directorio = directorio or DIRECTORIO_ALMACEN
+    ruta_meta = os.path.join(directorio, 'meta.json')
+    if not os.path.exists(ruta_meta):
+        return None, {}
+    
+    with open(ruta_meta, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    
+    columnas = {}
+    for columna in meta['columnas']:
+        valores = np.load(os.path.join(directorio, f"{columna}.npy"), mmap_mode='r')
+        columnas[columna] = valores.astype(object) if valores.dtype.kind == 'U' else valores
+    
+    return pd.DataFrame(columnas, columns=meta['columnas']), meta
+
+
+def fusionar_eventos(almacen, nuevos, ahora_ms, ventana_dias=None):
+    """
+    Inserta o actualiza eventos por id (gana la versión con 'actualizado' más reciente)
+    y descarta los eventos más antiguos que la ventana.
+    """
+    ventana_dias = ventana_dias or VENTANA_DIAS
+    combinado = nuevos if almacen is None else pd.concat([almacen, nuevos], ignore_index=True)
+    
+    combinado = combinado.sort_values('actualizado', kind='stable')
+    combinado = combinado.drop_duplicates('id', keep='last')
+    combinado = combinado[combinado['tiempo'] >= ahora_ms - ventana_dias * 24 * 3600 * 1000]
+    
+    return combinado.sort_values('tiempo', ascending=False).reset_index(drop=True)
+
+
+def actualizar_almacen_terremotos():
+    """
+    Actualiza el almacén local de terremotos descargando solo el feed necesario:
+    "mes" la primera vez y después "hora" o "dia" según el tiempo desde la última consulta.
+    Retorna el DataFrame completo del almacén (sin filtrar por magnitud). Si la descarga
+    falla y ya hay almacén, lo retorna sin cambiar 'ultima_consulta'.
+    """
+    almacen, meta = cargar_almacen()
+    ahora_ms = int(time.time() * 1000)
+    desde_ultima = ahora_ms - meta.get('ultima_consulta', 0)
+    
+    if almacen is None:
+        feed = "mes"
+    elif desde_ultima < 3600 * 1000:
+        feed = "hora"
+    elif desde_ultima < 24 * 3600 * 1000:
+        feed = "dia"
+    else:
+        feed = "mes"
+    
+    # Sin copia obsoleta: con ella se marcaría como consultada una ventana que no llegó
+    # y, si la caída dura más que el feed, sus eventos no entrarían nunca al almacén
+    # Si falla, se entrega el almacén tal como estaba y la ventana se pide en el próximo ciclo
+    try:
+        with medir_etapa('descarga'), crear_sesion_http(1) as sesion:
+            trozos = iterar_con_cache(sesion, FEEDS_USGS[feed], "terremotos", obsoleto=False)
+            nuevos = leer_terremotos_streaming(trozos, **filtros_terremotos())
+    except requests.exceptions.RequestException as e:
+        if almacen is None:
+            raise
+        print(f"⚠️  No se pudo descargar el feed '{feed}' ({e}); se usa el almacén sin actualizar")
+        return almacen
+    
+    with medir_etapa('procesado'):
+        total_antes = 0 if almacen is None else len(almacen)
+        combinado = fusionar_eventos(almacen, nuevos, ahora_ms)
+        guardar_almacen(combinado, {'ultima_consulta': ahora_ms, 'feed': feed})
+    print(f"  ✓ Almacén actualizado con el feed '{feed}': {len(nuevos)} eventos recibidos, "
+          f"{total_antes} → {len(combinado)} en el almacén")
+    
+    return combinado
+
+
+# Contadores de la caché HTTP por fuente: aciertos (TTL vigente), revalidados (304), descargas,
+# obsoletos (copia vencida servida sin esperar a la red) y reintentos
+ESTADISTICAS_CACHE = {}
+_candado_cache = threading.Lock()
+
+
+def registrar_cache(fuente, resultado):
+    """
+    Suma un acierto, revalidación, descarga, copia obsoleta o reintento a las estadísticas de la caché.
+    """
+    with _candado_cache:
+        contadores = ESTADISTICAS_CACHE.setdefault(
+            fuente, {'aciertos': 0, 'revalidados': 0, 'descargas': 0, 'obsoletos': 0, 'reintentos': 0}
+        )
+        contadores[resultado] += 1
+
+
+def rutas_cache(url):
+    """
+    Retorna las rutas (cuerpo, metadatos) de la caché en disco para una URL.
+    """
+    clave = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+    base = os.path.join(DIRECTORIO_CACHE, clave)
+    return base + '.body', base + '.json'
+
+
+def escribir_atomico(ruta, contenido):
+    """
+    Escribe un archivo completo en un temporal y lo renombra, para no dejarlo a medias.
+    """
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    modo = 'wb' if isinstance(contenido, bytes) else 'w'
+    codificacion = None if isinstance(contenido, bytes) else 'utf-8'
+    
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix='.tmp_')
+    try:
+        with os.fdopen(descriptor, modo, encoding=codificacion) as f:
+            f.write(contenido)
+        # mkstemp crea el archivo con permisos 0600; conservar los del archivo original
+        permisos = os.stat(ruta).st_mode & 0o777 if os.path.exists(ruta) else 0o644
+        os.chmod(temporal, permisos)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+def leer_trozos(ruta, tamaño_trozo=TAMAÑO_TROZO):
+    """
+    Lee un archivo en trozos de bytes.
+    """
+    with open(ruta, 'rb') as f:
+        while True:
+            trozo = f.read(tamaño_trozo)
+            if not trozo:
+                return
+            yield trozo
+
+
+class CircuitoAbierto(requests.exceptions.RequestException):
+    """
+    La fuente acumula demasiados fallos seguidos y no se consulta hasta que pase la pausa.
+    """
+
+
+class Circuito:
+    """
+    Circuito de una fuente: tras FALLOS_PARA_ABRIR_CIRCUITO fallos seguidos corta sus
+    peticiones durante SEGUNDOS_CIRCUITO_ABIERTO; después deja pasar una sola petición
+    de prueba y se cierra si funciona. Es seguro para usar desde varios hilos.
+    """
+    
+    def __init__(self):
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self.probando = False
+        self.candado = threading.Lock()
+    
+    def permitir(self):
+        with self.candado:
+            if self.fallos < FALLOS_PARA_ABRIR_CIRCUITO:
+                return True
+            if self.probando or time.monotonic() < self.abierto_hasta:
+                return False
+            self.probando = True
+            return True
+    
+    def exito(self):
+        with self.candado:
+            self.fallos = 0
+            self.probando = False
+    
+    def fallo(self):
+        with self.candado:
+            self.fallos += 1
+            self.probando = False
+            if self.fallos >= FALLOS_PARA_ABRIR_CIRCUITO:
+                self.abierto_hasta = time.monotonic() + SEGUNDOS_CIRCUITO_ABIERTO
+
+
+# Un circuito por fuente, compartido por todas las sesiones del proceso
+CIRCUITOS = {}
+_candado_circuitos = threading.Lock()
+
+
+def obtener_circuito(fuente):
+    """
+    Retorna el circuito de una fuente, creándolo la primera vez.
+    """
+    with _candado_circuitos:
+        return CIRCUITOS.setdefault(fuente, Circuito())
+
+
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+# Errores de red que se reintentan, también a mitad del cuerpo (IncompleteRead llega
+# como ChunkedEncodingError y un timeout de lectura en iter_content como ConnectionError)
+ERRORES_REINTENTABLES = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                         requests.exceptions.ChunkedEncodingError)
+
+
+def error_sin_url(error, url_completa, etiqueta):
+    """
+    Copia de un error de requests con la URL cambiada por la etiqueta. La URL puede
+    llevar la clave de la API (appid en clima, la ruta en FIRMS) y el mensaje termina
+    en los logs.
+    """
+    partes = urlparse(url_completa)
+    texto = str(error)
+    for fragmento in (url_completa, f"{partes.path}?{partes.query}", partes.path):
+        if len(fragmento) > 1:
+            texto = texto.replace(fragmento, etiqueta)
+    return type(error)(texto, response=getattr(error, 'response', None))
+
+
+def pedir_con_reintentos(sesion, url, fuente, parametros=None, cabeceras=None, limitador=None, destino=None,
+                         etiqueta=None):
+    """
+    GET en streaming con timeouts de conexión y lectura separados, reintentos y el
+    circuito de la fuente. Los errores de red, timeouts, 429 y 5xx se reintentan con
+    espera exponencial aleatoria (jitter completo, o Retry-After si es mayor) mientras
+    no se supere PLAZO_REINTENTOS; los demás errores HTTP se lanzan sin reintentar.
+    Con destino, el cuerpo de una respuesta 200 se descarga entero en ese archivo dentro
+    del mismo intento, así que un corte a mitad del cuerpo también se reintenta.
+    Retorna la respuesta (abierta, o ya leída si se indicó destino). Los errores nombran
+    la petición por la etiqueta (por defecto, la fuente), nunca por la URL.
+    """
+    etiqueta = etiqueta or fuente
+    url_completa = requests.Request('GET', url, params=parametros).prepare().url
+    circuito = obtener_circuito(fuente)
+    inicio = time.monotonic()
+    
+    for intento in range(REINTENTOS_MAXIMOS + 1):
+        if not circuito.permitir():
+            raise CircuitoAbierto(f"circuito abierto para '{fuente}' tras {circuito.fallos} fallos seguidos")
+        if limitador:
+            limitador.esperar(url)
+        
+        espera_servidor = 0.0
+        try:
+            respuesta = sesion.get(url, params=parametros, headers=cabeceras,
+                                   timeout=(TIMEOUT_CONEXION, TIMEOUT_LECTURA), stream=True)
+            if destino and respuesta.status_code == 200:
+                with respuesta, open(destino, 'wb') as f:
+                    for trozo in respuesta.iter_content(TAMAÑO_TROZO):
+                        f.write(trozo)
+        except ERRORES_REINTENTABLES as e:
+            error = error_sin_url(e, url_completa, etiqueta)
+        except requests.exceptions.RequestException as e:
+            # Redirecciones infinitas, cabeceras inválidas...: no se reintenta, pero cuenta
+            # como fallo para que una petición de prueba no deje el circuito bloqueado
+            circuito.fallo()
+            raise error_sin_url(e, url_completa, etiqueta) from None
+        else:
+            if respuesta.status_code not in CODIGOS_REINTENTABLES:
+                circuito.exito()
+                if respuesta.status_code >= 400:
+                    respuesta.close()
+                    raise requests.exceptions.HTTPError(
+                        f"{respuesta.status_code} {respuesta.reason} para {etiqueta}", response=respuesta
+                    )
+                return respuesta
+            error = requests.exceptions.HTTPError(f"{respuesta.status_code} {respuesta.reason} para {etiqueta}",
+                                                  response=respuesta)
+            if respuesta.headers.get('Retry-After', '').isdigit():
+                espera_servidor = float(respuesta.headers['Retry-After'])
+            respuesta.close()
+        
+        circuito.fallo()
+        espera = max(espera_servidor,
+                     random.uniform(0, min(ESPERA_MAXIMA_REINTENTO, ESPERA_BASE_REINTENTO * 2 ** intento)))
+        if intento == REINTENTOS_MAXIMOS or time.monotonic() - inicio + espera > PLAZO_REINTENTOS:
+            raise error
+        registrar_cache(fuente, 'reintentos')
+        print(f"  ⚠️  {fuente}: {error}; reintento {intento + 1} en {espera:.1f} s")
+        time.sleep(espera)
+
+
+# URLs con una revalidación en segundo plano en curso
+_revalidando = set()
+_candado_revalidacion = threading.Lock()
+
+
+def revalidar_en_segundo_plano(url, fuente, parametros=None, etiqueta=None):
+    """
+    Refresca en un hilo la copia en caché de una URL (stale-while-revalidate), con su
+    propia sesión. Solo hay una revalidación por URL a la vez; si falla se conserva la
+    copia anterior. Retorna el hilo, o None si ya había una en curso.
+    """
+    clave = requests.Request('GET', url, params=parametros).prepare().url
+    with _candado_revalidacion:
+        if clave in _revalidando:
+            return None
+        _revalidando.add(clave)
+    
+    def revalidar():
+        try:
+            with crear_sesion_http(1) as sesion:
+                for _ in iterar_con_cache(sesion, url, fuente, parametros, etiqueta=etiqueta, obsoleto=False):
+                    pass
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f"  ⚠️  No se pudo refrescar {etiqueta or url} en segundo plano: {e}")
+        finally:
+            with _candado_revalidacion:
+                _revalidando.discard(clave)
+    
+    hilo = threading.Thread(target=revalidar, name=f"revalidar-{fuente}")
+    hilo.start()
+    return hilo
+
+
+def esperar_revalidaciones(timeout=None):
+    """
+    Espera a que terminen las revalidaciones en segundo plano (p. ej. antes de medir o salir).
+    """
+    for hilo in threading.enumerate():
+        if hilo.name.startswith('revalidar-'):
+            hilo.join(timeout)
+
+
+def iterar_con_cache(sesion, url, fuente, parametros=None, limitador=None, etiqueta=None, obsoleto=True):
+    """
+    Descarga una URL usando una caché en disco con GET condicional y entrega el cuerpo
+    en trozos de bytes, sin cargarlo completo en memoria.
+    Dentro del TTL de la fuente se usa el cuerpo guardado sin red; después se envía
+    If-None-Match / If-Modified-Since y un 304 se sirve desde disco. La primera
+    descarga se guarda en disco a medida que se entrega.
+    La red se consulta con pedir_con_reintentos. Si hay una copia guardada de menos de
+    EDAD_MAXIMA_OBSOLETO, la respuesta nueva se descarga entera antes de entregarla y,
+    si falla (también a mitad del cuerpo), se entrega esa copia en lugar del error;
+    con SERVIR_OBSOLETO, una copia vencida se entrega sin esperar a la red y se
+    refresca en segundo plano. obsoleto=False desactiva ambas cosas.
+    Bytes y tiempos se registran con registrar_peticion bajo la etiqueta indicada
+    (por defecto, la ruta de la URL). Con lectura streaming, el tiempo total incluye
+    el que tarda quien consume los trozos.
+    """
+    etiqueta = etiqueta or urlparse(url).path
+    inicio = time.perf_counter()
+    url_completa = requests.Request('GET', url, params=parametros).prepare().url
+    ruta_cuerpo, ruta_meta = rutas_cache(url_completa)
+    
+    meta = None
+    if os.path.exists(ruta_cuerpo) and os.path.exists(ruta_meta):
+        try:
+            with open(ruta_meta, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            meta = None
+    
+    edad = time.time() - meta['guardado'] if meta else None
+    if meta and edad < TTL_CACHE.get(fuente, 0):
+        registrar_cache(fuente, 'aciertos')
+        recibidos = yield from entregar_desde_cache(ruta_cuerpo)
+        registrar_peticion(fuente, etiqueta, 'cache', recibidos, 0.0, time.perf_counter() - inicio)
+        return
+    
+    hay_respaldo = obsoleto and meta is not None and edad < EDAD_MAXIMA_OBSOLETO
+    if hay_respaldo and SERVIR_OBSOLETO:
+        revalidar_en_segundo_plano(url, fuente, parametros, etiqueta)
+        registrar_cache(fuente, 'obsoletos')
+        recibidos = yield from entregar_desde_cache(ruta_cuerpo)
+        registrar_peticion(fuente, etiqueta, 'obsoleto', recibidos, 0.0, time.perf_counter() - inicio)
+        return
+    
+    cabeceras = {}
+    if meta and meta.get('etag'):
+        cabeceras['If-None-Match'] = meta['etag']
+    if meta and meta.get('last_modified'):
+        cabeceras['If-Modified-Since'] = meta['last_modified']
+    
+    os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=DIRECTORIO_CACHE, prefix='.tmp_')
+    os.close(descriptor)
+    try:
+        try:
+            # Con copia de respaldo, el cuerpo se descarga entero antes de entregarlo: si la
+            # conexión se corta a medias se reintenta y, si no hay manera, se usa la copia
+            respuesta = pedir_con_reintentos(sesion, url, fuente, parametros, cabeceras, limitador,
+                                             destino=temporal if hay_respaldo else None, etiqueta=etiqueta)
+        except requests.exceptions.RequestException as e:
+            if not hay_respaldo:
+                raise
+            # Mejor la última copia buena que los datos de ejemplo
+            print(f"  ⚠️  {etiqueta}: {e}; se usa la copia guardada hace {edad / 60:.0f} min")
+            registrar_cache(fuente, 'obsoletos')
+            recibidos = yield from entregar_desde_cache(ruta_cuerpo)
+            registrar_peticion(fuente, etiqueta, 'obsoleto', recibidos, 0.0, time.perf_counter() - inicio)
+            return
+        
+        with respuesta:
+            primer_byte = time.perf_counter() - inicio
+            if respuesta.status_code == 304 and meta:
+                meta['guardado'] = time.time()
+                escribir_atomico(ruta_meta, json.dumps(meta))
+                registrar_cache(fuente, 'revalidados')
+                recibidos = yield from entregar_desde_cache(ruta_cuerpo)
+                registrar_peticion(fuente, etiqueta, 'revalidado', recibidos, primer_byte,
+                                   time.perf_counter() - inicio)
+                return
+            
+            if hay_respaldo:
+                os.replace(temporal, ruta_cuerpo)
+                recibidos = yield from entregar_desde_cache(ruta_cuerpo)
+            else:
+                # Primera descarga: los trozos se entregan a medida que llegan
+                recibidos = 0
+                try:
+                    with open(temporal, 'wb') as f:
+                        for trozo in respuesta.iter_content(TAMAÑO_TROZO):
+                            f.write(trozo)
+                            recibidos += len(trozo)
+                            yield trozo
+                except requests.exceptions.RequestException:
+                    obtener_circuito(fuente).fallo()
+                    raise
+                os.replace(temporal, ruta_cuerpo)
+    finally:
+        if os.path.exists(temporal):
+            os.unlink(temporal)
+    
+    # Sin la URL: incluye la clave de la API (appid en clima, la ruta en FIRMS)
+    escribir_atomico(ruta_meta, json.dumps({
+        'etag': respuesta.headers.get('ETag'),
+        'last_modified': respuesta.headers.get('Last-Modified'),
+        'guardado': time.time()
+    }))
+    registrar_cache(fuente, 'descargas')
+    registrar_peticion(fuente, etiqueta, 'descarga', recibidos, primer_byte, time.perf_counter() - inicio)
+
+
+def entregar_desde_cache(ruta):
+    """
+    Entrega los trozos de un cuerpo guardado y retorna (con yield from) los bytes leídos.
+    """
+    recibidos = 0
+    for trozo in leer_trozos(ruta):
+        recibidos += len(trozo)
+        yield trozo
+    return recibidos
+
+
+def obtener_con_cache(sesion, url, fuente, parametros=None, limitador=None, etiqueta=None):
+    """
+    Igual que iterar_con_cache, pero retorna el cuerpo completo en bytes.
+    """
+    return b''.join(iterar_con_cache(sesion, url, fuente, parametros, limitador, etiqueta))
+
+
+def resumen_cache():
+    """
+    Texto con los aciertos y fallos de la caché HTTP de esta ejecución.
+    """
+    partes = []
+    for fuente, c in sorted(ESTADISTICAS_CACHE.items()):
+        texto = f"{fuente}: {c['aciertos']} aciertos, {c['revalidados']} revalidados (304), {c['descargas']} descargas"
+        if c['obsoletos']:
+            texto += f", {c['obsoletos']} copias obsoletas"
+        if c['reintentos']:
+            texto += f", {c['reintentos']} reintentos"
+        partes.append(texto)
+    return '; '.join(partes)
+
+
+class LimitadorPorHost:
+    """
+    Espacia las peticiones a un mismo host para no superar N peticiones por segundo.
+    Es seguro para usar desde varios hilos.
+    """
+    
+    def __init__(self, peticiones_por_segundo):
+        self.intervalo = 1.0 / peticiones_por_segundo if peticiones_por_segundo else 0.0
+        self.proximo_turno = {}
+        self.candado = threading.Lock()
+    
+    def esperar(self, url):
+        if not self.intervalo:
+            return
+        host = urlparse(url).netloc
+        with self.candado:
+            ahora = time.monotonic()
+            turno = max(ahora, self.proximo_turno.get(host, ahora))
+            self.proximo_turno[host] = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def crear_sesion_http(conexiones=CONCURRENCIA_MAXIMA):
+    """
+    Crea una sesión de requests con un pool de conexiones keep-alive compartido.
+    """
+    sesion = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_connections=conexiones, pool_maxsize=conexiones)
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
+
+
+def obtener_clima_ciudad(sesion, limitador, ciudad, lat, lon):
+    """
+    Obtiene el clima actual de una ciudad. Retorna un dict con los datos procesados.
+    """
+    parametros = {'lat': lat, 'lon': lon, 'appid': API_KEY_OPENWEATHER, 'units': 'metric', 'lang': 'es'}
+    datos = json.loads(obtener_con_cache(sesion, URL_OPENWEATHER, "clima", parametros, limitador, etiqueta=ciudad))
+    
+    return {
+        'ciudad': ciudad,
+        'temperatura': datos['main']['temp'],
+        'humedad': datos['main']['humidity'],
+        'viento': datos['wind']['speed'],
+        'descripcion': datos['weather'][0]['description'],
+        'lat': lat,
+        'lon': lon,
+        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M'),
+        'tipo': 'Clima'
+    }
+
+
+def obtener_clima_concurrente(ciudades, concurrencia=None, peticiones_por_segundo=None):
+    """
+    Obtiene el clima de muchas ciudades en paralelo usando una sesión compartida.
+    Las ciudades que fallan se omiten; retorna la lista de resultados en el orden original.
+    """
+    concurrencia = concurrencia or CONCURRENCIA_MAXIMA
+    if peticiones_por_segundo is None:
+        peticiones_por_segundo = PETICIONES_POR_SEGUNDO_HOST
+    limitador = LimitadorPorHost(peticiones_por_segundo)
+    resultados = [None] * len(ciudades)
+    
+    with crear_sesion_http(concurrencia) as sesion, ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        futuros = {
+            ejecutor.submit(obtener_clima_ciudad, sesion, limitador, ciudad, lat, lon): (i, ciudad)
+            for i, (ciudad, lat, lon) in enumerate(ciudades)
+        }
+        for futuro in as_completed(futuros):
+            i, ciudad = futuros[futuro]
+            try:
+                resultados[i] = futuro.result()
+                print(f"  ✓ Datos obtenidos para {ciudad}")
+            except (requests.exceptions.RequestException, KeyError, IndexError, ValueError) as e:
+                print(f"  ✗ Error al obtener datos para {ciudad}: {e}")
+    
+    return [r for r in resultados if r is not None]
+
+
+def usar_datos_ejemplo():
+    """
+    Carga datos de ejemplo desde archivo JSON cuando la API falla.
+    """
+    try:
+        # Crear datos de ejemplo si no existe el archivo o está vacío
+        if not os.path.exists(ARCHIVO_JSON_FALLBACK) or os.path.getsize(ARCHIVO_JSON_FALLBACK) == 0:
+            crear_datos_ejemplo()
+        
+        with open(ARCHIVO_JSON_FALLBACK, 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+        
+        df = pd.DataFrame(datos)
+        print(f"✓ {len(df)} registros cargados desde archivo de ejemplo")
+        return df
+        
+    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+        print(f"✗ Error al cargar datos de ejemplo: {e}")
+        # Datos de emergencia
+        datos_emergencia = [
+            {
+                'lugar': 'Santiago Centro',
+                'magnitud': 4.2,
+                'lat': -33.4489,
+                'lon': -70.6693,
+                'fecha': datetime.now().strftime('%Y-%m-%d %H:%M'),
+                'tipo': 'Terremoto',
+                'profundidad': 10
+            }
+        ]
+        df = pd.DataFrame(datos_emergencia)
+        print("✓ Datos de emergencia creados")
+        return df
+
+
+def crear_datos_ejemplo():
+    """
+    Crea un archivo JSON con datos de ejemplo.
+    """
+    datos_ejemplo = [
+        {
+            "lugar": "30km al norte de Santiago",
+            "magnitud": 4.2,
+            "lat": -33.1,
+            "lon": -70.5,
+            "profundidad": 15,
+            "fecha": datetime.now().strftime('%Y-%m-%d %H:%M'),
+            "tipo": "Terremoto"
+        },
+        {
+            "lugar": "Valparaíso",
+            "magnitud": 3.8,
+            "lat": -33.0458,
+            "lon": -71.6197,
+            "profundidad": 25,
+            "fecha": (datetime.now() - timedelta(hours=2)).strftime('%Y-%m-%d %H:%M'),
+            "tipo": "Terremoto"
+        },
+        {
+            "lugar": "Concepción",
+            "magnitud": 5.1,
+            "lat": -36.8269,
+            "lon": -73.0497,
+            "profundidad": 30,
+            "fecha": (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M'),
+            "tipo": "Terremoto"
+        },
+        {
+            "lugar": "Antofagasta",
+            "magnitud": 4.5,
+            "lat": -23.6500,
+            "lon": -70.4000,
+            "profundidad": 40,
+            "fecha": (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d %H:%M'),
+            "tipo": "Terremoto"
+        }
+    ]
+    
+    with open(ARCHIVO_JSON_FALLBACK, 'w', encoding='utf-8') as f:
+        json.dump(datos_ejemplo, f, indent=2, ensure_ascii=False)
+    
+    print(f"✓ Archivo de ejemplo creado: {ARCHIVO_JSON_FALLBACK}")
+
+
+def asignar_color_marcador(dato, tipo_dato):
+    """
+    Asigna color al marcador según el tipo de dato y su valor.
+    """
+    if tipo_dato == "terremotos":
+        if dato >= 5.0:
+            return 'red'
+        elif dato >= 4.0:
+            return 'orange'
+        elif dato >= 3.0:
+            return 'lightgreen'
+        else:
+            return 'green'
+    
+    elif tipo_dato == "clima":
+        if dato >= 30:
+            return 'red'
+        elif dato >= 20:
+            return 'orange'
+        elif dato >= 10:
+            return 'lightblue'
+        else:
+            return 'blue'
+    
+    return 'blue'  # Color por defecto
+
+
+def asignar_icono(tipo):
+    """
+    Asigna un ícono según el tipo de dato.
+    """
+    if tipo == "Terremoto":
+        return "info-sign"
+    elif tipo == "Clima":
+        return "cloud"
+    else:
+        return "info-sign"
+
+
+# Umbrales de color por tipo de dato: (umbrales descendentes, colores, color por defecto)
+UMBRALES_COLOR = {
+    "terremotos": ([5.0, 4.0, 3.0], ['red', 'orange', 'lightgreen'], 'green'),
+    "clima": ([30, 20, 10], ['red', 'orange', 'lightblue'], 'blue'),
+    "incendios": ([100, 30, 10], ['darkred', 'red', 'orange'], 'gold')
+}
+
+# Campo usado para el color y regla de tamaño de los marcadores por tipo de dato
+ESTILO_MARCADOR = {
+    "terremotos": {"campo": "magnitud", "factor": 5, "minimo": 10, "maximo": 30},
+    "clima": {"campo": "temperatura", "radio": 15},
+    "incendios": {"campo": "frp", "radio": 8},
+    "otro": {"campo": None, "radio": 12}
+}
+
+# Plantillas de tooltip y popup; {campo|defecto} se rellena con la columna del DataFrame
+PLANTILLAS_TOOLTIP = {
+    "terremotos": "{lugar|Lugar desconocido} - M{magnitud}",
+    "clima": "{ciudad|Ciudad desconocida} - {temperatura}°C",
+    "incendios": "Foco de incendio - {frp} MW",
+    "otro": "{lugar|Ubicación}"
+}
+
+PLANTILLAS_POPUP = {
+    "terremotos": """
+                <div style="width: 200px;">
+                    <h4 style="color: {color}; margin: 5px 0;">Terremoto</h4>
+                    <hr>
+                    <p><strong>Lugar:</strong> {lugar}</p>
+                    <p><strong>Magnitud:</strong> {magnitud}</p>
+                    <p><strong>Profundidad:</strong> {profundidad} km</p>
+                    <p><strong>Fecha:</strong> {fecha}</p>
+                </div>
+                """,
+    "clima": """
+                <div style="width: 200px;">
+                    <h4 style="color: {color}; margin: 5px 0;">Condiciones Climáticas</h4>
+                    <hr>
+                    <p><strong>Ciudad:</strong> {ciudad}</p>
+                    <p><strong>Temperatura:</strong> {temperatura}°C</p>
+                    <p><strong>Humedad:</strong> {humedad}%</p>
+                    <p><strong>Viento:</strong> {viento} km/h</p>
+                    <p><strong>Descripción:</strong> {descripcion}</p>
+                    <p><strong>Actualizado:</strong> {fecha}</p>
+                </div>
+                """,
+    "incendios": """
+                <div style="width: 200px;">
+                    <h4 style="color: {color}; margin: 5px 0;">Foco de Incendio</h4>
+                    <hr>
+                    <p><strong>Potencia radiativa:</strong> {frp} MW</p>
+                    <p><strong>Brillo:</strong> {brillo} K</p>
+                    <p><strong>Confianza:</strong> {confianza}</p>
+                    <p><strong>Satélite:</strong> {satelite}</p>
+                    <p><strong>Detectado:</strong> {fecha} UTC</p>
+                </div>
+                """,
+    "otro": """
+                <div style="width: 200px;">
+                    <h4>Información</h4>
+                    <hr>
+                    <p><strong>Lugar:</strong> {lugar}</p>
+                    <p><strong>Tipo:</strong> {tipo}</p>
+                    <p><strong>Fecha:</strong> {fecha}</p>
+                </div>
+                """
+}
+
+# Función JavaScript que crea cada CircleMarker a partir de una fila
+# [lat, lon, radio, color, tooltip, popup] en el navegador
+CALLBACK_MARCADOR_JS = """function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: row[2], color: row[3], fill: true, fillColor: row[3],
+        fillOpacity: 0.7, weight: 2
+    });
+    marker.bindPopup(row[5], {maxWidth: 300});
+    marker.bindTooltip(row[4], {sticky: true});
+    return marker;
+}"""
+
+PATRON_CAMPO_PLANTILLA = re.compile(r"\{(\w+)(?:\|([^}]*))?\}")
+
+
+def asignar_colores_vectorizado(valores, tipo_dato):
+    """
+    Versión vectorizada de asignar_color_marcador para una columna completa.
+    """
+    valores = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float)
+    
+    if tipo_dato not in UMBRALES_COLOR:
+        return np.full(len(valores), 'blue', dtype=object)
+    
+    umbrales, colores, color_defecto = UMBRALES_COLOR[tipo_dato]
+    condiciones = [valores >= umbral for umbral in umbrales]
+    return np.select(condiciones, colores, default=color_defecto).astype(object)
+
+
+def rellenar_plantilla(df, plantilla, extras=None):
+    """
+    Rellena una plantilla {campo|defecto} para todas las filas a la vez.
+    Retorna una Series de strings alineada con el índice del DataFrame.
+    """
+    extras = extras or {}
+    resultado = pd.Series('', index=df.index, dtype=object)
+    posicion = 0
+    
+    for coincidencia in PATRON_CAMPO_PLANTILLA.finditer(plantilla):
+        resultado += plantilla[posicion:coincidencia.start()]
+        campo, defecto = coincidencia.group(1), coincidencia.group(2) or 'N/A'
+        
+        if campo in extras:
+            resultado += pd.Series(extras[campo], index=df.index).astype(str)
+        elif campo in df.columns:
+            resultado += columna_como_texto(df[campo])
+        else:
+            resultado += defecto
+        posicion = coincidencia.end()
+    
+    resultado += plantilla[posicion:]
+    return resultado
+
+
+def validar_coordenadas(df):
+    """
+    Valida las coordenadas de todas las filas a la vez.
+    Retorna (df, lat, lon) conservando solo las filas con coordenadas válidas.
+    """
+    lat = pd.to_numeric(df.get('lat', 0), errors='coerce')
+    lon = pd.to_numeric(df.get('lon', 0), errors='coerce')
+    # float32 → float64 arrastra ruido (-33.4489 → -33.44889831...); 5 decimales (~1 m)
+    # es lo que float32 puede representar en longitudes de hasta 180°
+    decimales = 5 if getattr(lat, 'dtype', None) == np.float32 else None
+    lat = pd.Series(lat, index=df.index, dtype=float)
+    lon = pd.Series(lon, index=df.index, dtype=float)
+    if decimales:
+        lat, lon = lat.round(decimales), lon.round(decimales)
+    validos = lat.between(-90, 90) & lon.between(-180, 180)
+    
+    for lugar in df.loc[~validos].get('lugar', pd.Series('desconocido', index=df.index[~validos])):
+        print(f"⚠️  Coordenadas inválidas para {lugar}")
+    
+    return df.loc[validos], lat[validos], lon[validos]
+
+
+def calcular_estilo_marcadores(df, tipo_dato):
+    """
+    Calcula el color y el radio de todos los marcadores según ESTILO_MARCADOR.
+    Retorna dos arrays (colores, radios) alineados con el DataFrame.
+    """
+    estilo = ESTILO_MARCADOR[tipo_dato]
+    campo = estilo['campo']
+    valores = df[campo] if campo in df.columns else pd.Series(0, index=df.index)
+    valores = pd.to_numeric(valores, errors='coerce').astype(float)
+    colores = asignar_colores_vectorizado(valores, tipo_dato)
+    
+    if 'factor' in estilo:
+        # Tamaño del marcador proporcional al valor
+        radios = (valores * estilo['factor']).fillna(estilo['minimo']).to_numpy()
+        radios = np.clip(radios, estilo['minimo'], estilo['maximo'])
+    else:
+        radios = np.full(len(df), estilo['radio'])
+    
+    return colores, radios
+
+
+def construir_datos_marcadores(df, tipo_dato):
+    """
+    Calcula coordenadas, colores, radios, tooltips y popups para todo el
+    DataFrame sin recorrerlo fila por fila.
+    Retorna un DataFrame con columnas lat, lon, radio, color, tooltip, popup.
+    """
+    columnas = ['lat', 'lon', 'radio', 'color', 'tooltip', 'popup']
+    if df is None or df.empty:
+        return pd.DataFrame(columns=columnas)
+    
+    df, lat, lon = validar_coordenadas(df)
+    
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    colores, radios = calcular_estilo_marcadores(df, tipo_dato)
+    
+    return pd.DataFrame({
+        'lat': lat,
+        'lon': lon,
+        'radio': radios,
+        'color': colores,
+        'tooltip': rellenar_plantilla(df, PLANTILLAS_TOOLTIP[tipo_dato]),
+        'popup': rellenar_plantilla(df, PLANTILLAS_POPUP[tipo_dato], {'color': colores})
+    }, columns=columnas)
+
+
+# Funciones JavaScript que aplican en el navegador los mismos colores, radios y
+# plantillas que construir_datos_marcadores, a partir de las propiedades de cada punto
+FUNCIONES_CLIENTE_JS = """
+    function formatearValor(config, props, campo, defecto) {
+        if (!(campo in props)) { return defecto; }
+        var valor = props[campo];
+        if (config.flotantes.indexOf(campo) >= 0) {
+            if (valor === null) { return 'nan'; }
+            return Number.isInteger(valor) ? valor.toFixed(1) : String(valor);
+        }
+        return valor === null ? 'None' : String(valor);
+    }
+    function rellenarPlantilla(config, plantilla, props, extras) {
+        return plantilla.replace(/\\{(\\w+)(?:\\|([^}]*))?\\}/g, function (_, campo, defecto) {
+            if (extras && campo in extras) { return extras[campo]; }
+            return formatearValor(config, props, campo, defecto === undefined ? 'N/A' : defecto);
+        });
+    }
+    function estiloMarcador(config, props) {
+        var valor = config.estilo.campo ? props[config.estilo.campo] : null;
+        var numero = (valor === null || valor === undefined) ? NaN : Number(valor);
+        var color = config.color_defecto;
+        for (var i = 0; i < config.umbrales.length; i++) {
+            if (numero >= config.umbrales[i]) { color = config.colores[i]; break; }
+        }
+        var radio = config.estilo.radio;
+        if (config.estilo.factor !== undefined) {
+            radio = isNaN(numero) ? config.estilo.minimo : numero * config.estilo.factor;
+            radio = Math.min(config.estilo.maximo, Math.max(config.estilo.minimo, radio));
+        }
+        return {color: color, radio: radio};
+    }
+    function crearMarcador(config, props, latlng, obtenerDetalle) {
+        var estilo = estiloMarcador(config, props);
+        var marcador = L.circleMarker(latlng, {
+            radius: estilo.radio, color: estilo.color, fill: true,
+            fillColor: estilo.color, fillOpacity: 0.7, weight: 2
+        });
+        // Con obtenerDetalle, los campos de las plantillas llegan aparte (null hasta cargarse)
+        function texto(plantilla, extras) {
+            return function () {
+                var detalle = obtenerDetalle ? obtenerDetalle(marcador) : props;
+                return detalle ? rellenarPlantilla(config, plantilla, detalle, extras) : 'Cargando…';
+            };
+        }
+        marcador.bindTooltip(texto(config.tooltip), {sticky: true});
+        marcador.bindPopup(texto(config.popup, {color: estilo.color}), {maxWidth: 300});
+        return marcador;
+    }
+"""
+
+# Script que añade los puntos de un FeatureCollection a la capa padre (MarkerCluster)
+PLANTILLA_CAPA_GEOJSON = """
+{% macro script(this, kwargs) %}
+    (function () {
+        {{ this.funciones }}
+        var config = {{ this.config_json }};
+        var capa = {{ this._parent.get_name() }};
+        var obtenerDetalle = null;
+        {% if this.url_detalles %}
+        // Tooltips y popups: se descargan al abrir el primero y se buscan por clave
+        var detalles = null, cargando = null;
+        obtenerDetalle = function (marcador) {
+            if (detalles) { return detalles[marcador.clave] || {}; }
+            cargando = cargando || fetch({{ this.url_detalles }}).then(function (r) { return r.json(); })
+                .then(function (d) { detalles = d; });
+            cargando.then(function () {
+                if (marcador.isPopupOpen()) { marcador.getPopup().update(); }
+                if (marcador.isTooltipOpen()) { marcador.getTooltip().update(); }
+            });
+            return null;
+        };
+        {% endif %}
+        function agregar(datos) {
+            var marcadores = datos.features.map(function (f) {
+                var c = f.geometry.coordinates;
+                var marcador = crearMarcador(config, f.properties, L.latLng(c[1], c[0]), obtenerDetalle);
+                marcador.clave = f.id;
+                return marcador;
+            });
+            capa.addLayers(marcadores);
+        }
+        {% if this.url_json and this.diferido %}
+        // Los puntos se descargan la primera vez que la capa entra al mapa
+        function cargar() {
+            fetch({{ this.url_json }}).then(function (r) { return r.json(); }).then(agregar);
+        }
+        if (capa._map) { cargar(); } else { capa.once('add', cargar); }
+        {% elif this.url_json %}
+        fetch({{ this.url_json }}).then(function (r) { return r.json(); }).then(agregar);
+        {% elif this.datos_json %}
+        agregar({{ this.datos_json }});
+        {% else %}
+        // Sin datos propios: cada fragmento llama a agregarPuntos con los suyos
+        capa.agregarPuntos = agregar;
+        {% endif %}
+    })();
+{% endmacro %}
+"""
+
+
+def a_json_compacto(datos):
+    """
+    Serializa a JSON sin espacios y seguro para incrustar dentro de <script>.
+    """
+    texto = json.dumps(datos, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    return texto.replace('</', '<\\/')
+
+
+@functools.cache
+def clase_elemento_js():
+    """
+    Crea la clase ElementoJS al primer uso, para no importar branca al cargar el módulo.
+    """
+    from branca.element import Element, MacroElement
+    from jinja2 import Template
+    
+    # Escribe un texto ya generado sin volver a interpretarlo como plantilla
+    plantilla_texto = Template("{{ this.texto }}")
+    
+    class ElementoJS(MacroElement):
+        """
+        MacroElement cuyo script se copia a la página tal cual. MacroElement lo envuelve en
+        un Element que vuelve a compilar el texto como plantilla Jinja, y con los datos
+        incrustados (varios MB) eso cuesta más que generarlos.
+        """
+        def render(self, **kwargs):
+            figura = self.get_root()
+            cabecera = self._template.module.__dict__.get("header")
+            if cabecera is not None:
+                figura.header.add_child(Element(cabecera(self, kwargs)), name=self.get_name())
+            
+            script = self._template.module.__dict__.get("script")
+            if script is not None:
+                texto = Element()
+                texto._template = plantilla_texto
+                # Jinja quita el salto de línea final al compilar; se mantiene el mismo HTML
+                texto.texto = script(self, kwargs).removesuffix('\n')
+                figura.script.add_child(texto, name=self.get_name())
+            
+            for hijo in self._children.values():
+                hijo.render(**kwargs)
+    
+    return ElementoJS
+
+
+def crear_elemento_js(plantilla, **atributos):
+    """
+    Crea un elemento de Folium a partir de una plantilla Jinja con macro script.
+    """
+    from jinja2 import Template
+    
+    elemento = clase_elemento_js()()
+    elemento._template = Template(plantilla)
+    for nombre, valor in atributos.items():
+        setattr(elemento, nombre, valor)
+    return elemento
+
+
+def campos_plantilla(tipo_dato):
+    """
+    Retorna los campos del DataFrame que usan las plantillas y el estilo de un tipo de dato.
+    """
+    campos = []
+    plantillas = PLANTILLAS_TOOLTIP[tipo_dato] + PLANTILLAS_POPUP[tipo_dato]
+    for campo, _ in PATRON_CAMPO_PLANTILLA.findall(plantillas):
+        if campo != 'color' and campo not in campos:
+            campos.append(campo)
+    
+    campo_estilo = ESTILO_MARCADOR[tipo_dato]['campo']
+    if campo_estilo and campo_estilo not in campos:
+        campos.append(campo_estilo)
+    return campos
+
+
+def configuracion_cliente(df, tipo_dato):
+    """
+    Configuración de estilo y plantillas que usa FUNCIONES_CLIENTE_JS en el navegador.
+    """
+    umbrales, colores, color_defecto = UMBRALES_COLOR.get(tipo_dato, ([], [], 'blue'))
+    campos = [c for c in campos_plantilla(tipo_dato) if c in df.columns]
+    
+    return {
+        'umbrales': umbrales,
+        'colores': colores,
+        'color_defecto': color_defecto,
+        'estilo': ESTILO_MARCADOR[tipo_dato],
+        'tooltip': PLANTILLAS_TOOLTIP[tipo_dato],
+        'popup': PLANTILLAS_POPUP[tipo_dato],
+        'flotantes': [c for c in campos if pd.api.types.is_float_dtype(df[c])]
+    }
+
+
+def construir_geojson_compacto(df, tipo_dato, decimales=5, con_claves=False):
+    """
+    Construye un FeatureCollection con solo los campos que necesitan las plantillas
+    y coordenadas redondeadas. El estilo y los popups se generan en el navegador.
+    Con con_claves=True cada punto lleva como 'id' su clave_evento.
+    """
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    
+    df, lat, lon = validar_coordenadas(df)
+    campos = [c for c in campos_plantilla(tipo_dato) if c in df.columns]
+    
+    coordenadas = np.column_stack([lon.round(decimales), lat.round(decimales)]).tolist()
+    valores = df[campos].copy()
+    for campo in campos:
+        if valores[campo].dtype == np.float32:
+            # Pasar por texto evita el ruido de float32 → float64 (2.43 → 2.4300000667...)
+            valores[campo] = valores[campo].astype(str).astype(float)
+        elif pd.api.types.is_datetime64_any_dtype(valores[campo]):
+            valores[campo] = columna_como_texto(valores[campo])
+    propiedades = valores.astype(object).where(valores.notna(), None).to_dict('records')
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': c}, 'properties': p}
+        for c, p in zip(coordenadas, propiedades)
+    ]
+    
+    if con_claves:
+        for feature, clave in zip(features, clave_evento(df)):
+            feature['id'] = clave
+    
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def clave_evento(df):
+    """
+    Clave estable de cada fila para comparar versiones de los datos: el id de USGS si
+    existe; si no, el nombre (ciudad o lugar) junto con las coordenadas.
+    """
+    if 'id' in df.columns:
+        return df['id'].astype(str)
+    
+    nombre = df['ciudad'] if 'ciudad' in df.columns else df.get('lugar', pd.Series('', index=df.index))
+    return nombre.astype(str).fillna('') + '@' + df['lat'].astype(str) + ',' + df['lon'].astype(str)
+
+
+def separar_detalles(geojson, tipo_dato):
+    """
+    Deja en cada punto solo el campo que define su estilo y mueve el resto de campos
+    de las plantillas a un dict {clave: propiedades}. Requiere puntos con 'id'.
+    """
+    campo_estilo = ESTILO_MARCADOR[tipo_dato]['campo']
+    detalles = {}
+    for feature in geojson['features']:
+        propiedades = feature['properties']
+        detalles[feature['id']] = propiedades
+        feature['properties'] = {campo_estilo: propiedades[campo_estilo]} if campo_estilo in propiedades else {}
+    return detalles
+
+
+def agregar_capa_geojson(mapa, df, tipo_dato, archivo_externo=None, mostrar=True, archivo_detalles=None,
+                         nombre="Marcadores", diferido=False):
+    """
+    Añade los puntos como un único FeatureCollection compacto dentro de un MarkerCluster.
+    Si se indica archivo_externo, los puntos se escriben en ese archivo y el navegador lo descarga
+    (con diferido=True, solo cuando la capa se muestra por primera vez).
+    Si se indica archivo_detalles, los campos de tooltips y popups se escriben en ese archivo
+    (por clave_evento) y el navegador lo descarga al abrir el primero.
+    """
+    from folium.plugins import MarkerCluster
+    
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    
+    geojson = construir_geojson_compacto(df, tipo_dato, con_claves=bool(archivo_detalles))
+    capa = MarkerCluster(name=nombre, overlay=True, control=True, show=mostrar).add_to(mapa)
+    elemento = crear_elemento_js(
+        PLANTILLA_CAPA_GEOJSON,
+        funciones=FUNCIONES_CLIENTE_JS,
+        config_json=a_json_compacto(configuracion_cliente(df, tipo_dato)),
+        datos_json=None,
+        url_json=None,
+        url_detalles=None,
+        diferido=diferido
+    )
+    
+    if archivo_detalles:
+        escribir_atomico(archivo_detalles, a_json_compacto(separar_detalles(geojson, tipo_dato)))
+        elemento.url_detalles = json.dumps(os.path.basename(archivo_detalles))
+        print(f"✓ Detalles de popups guardados como: {archivo_detalles}")
+    
+    if archivo_externo:
+        escribir_atomico(archivo_externo, a_json_compacto(geojson))
+        elemento.url_json = json.dumps(os.path.basename(archivo_externo))
+        print(f"✓ Puntos guardados como: {archivo_externo}")
+    else:
+        elemento.datos_json = a_json_compacto(geojson)
+    
+    capa.add_child(elemento)
+    return capa
+
+
+def agregar_en_grilla(lat, lon, valores, zoom, celdas_por_tesela=None):
+    """
+    Agrupa puntos en una grilla regular de lat/lon cuyo tamaño depende del zoom
+    (como un geohash). Retorna un dict de columnas con el centroide, el número de
+    puntos y el valor máximo y medio de cada celda ocupada.
+    """
+    celdas_por_tesela = celdas_por_tesela or CELDAS_POR_TESELA
+    tamaño = 360.0 / (2 ** zoom * celdas_por_tesela)
+    columnas_grilla = int(np.ceil(360.0 / tamaño))
+    
+    ix = np.floor((lon + 180.0) / tamaño).astype(np.int64)
+    iy = np.floor((lat + 90.0) / tamaño).astype(np.int64)
+    celdas = iy * columnas_grilla + ix
+    
+    # Ordenar por celda para reducir cada grupo contiguo de una vez
+    orden = np.argsort(celdas, kind='stable')
+    celdas = celdas[orden]
+    inicios = np.flatnonzero(np.r_[True, celdas[1:] != celdas[:-1]])
+    cantidad = np.diff(np.r_[inicios, len(celdas)])
+    
+    resultado = {
+        'lat': np.round(np.add.reduceat(lat[orden], inicios) / cantidad, 4),
+        'lon': np.round(np.add.reduceat(lon[orden], inicios) / cantidad, 4),
+        'n': cantidad
+    }
+    if valores is not None:
+        valores = valores[orden]
+        validos = ~np.isnan(valores)
+        suma = np.add.reduceat(np.where(validos, valores, 0.0), inicios)
+        n_validos = np.add.reduceat(validos.astype(np.int64), inicios)
+        maximo = np.maximum.reduceat(np.where(validos, valores, -np.inf), inicios)
+        resultado['max'] = np.round(np.where(n_validos > 0, maximo, np.nan), 2)
+        resultado['media'] = np.round(np.where(n_validos > 0, suma / np.maximum(n_validos, 1), np.nan), 2)
+    
+    return resultado
+
+
+def construir_niveles_agregacion(df, tipo_dato, zoom_umbral=None):
+    """
+    Calcula las celdas agregadas para cada nivel de zoom por debajo del umbral.
+    Retorna {zoom: {columna: lista}} listo para serializar.
+    """
+    zoom_umbral = ZOOM_UMBRAL_MARCADORES if zoom_umbral is None else zoom_umbral
+    df, lat, lon = validar_coordenadas(df)
+    lat, lon = lat.to_numpy(dtype=float), lon.to_numpy(dtype=float)
+    
+    campo = ESTILO_MARCADOR.get(tipo_dato, ESTILO_MARCADOR['otro'])['campo']
+    valores = None
+    if campo in df.columns:
+        valores = pd.to_numeric(df[campo], errors='coerce').to_numpy(dtype=float)
+    
+    niveles = {}
+    for zoom in range(zoom_umbral):
+        celdas = agregar_en_grilla(lat, lon, valores, zoom)
+        niveles[zoom] = {
+            columna: [None if np.isnan(v) else v for v in arreglo.tolist()] if arreglo.dtype.kind == 'f'
+            else arreglo.tolist()
+            for columna, arreglo in celdas.items()
+        }
+    return niveles
+
+
+# Script que muestra las celdas del nivel correspondiente al zoom actual y, desde el
+# zoom umbral, la capa de puntos individuales
+PLANTILLA_CAPA_AGREGADA = """
+{% macro script(this, kwargs) %}
+    (function () {
+        var mapa = {{ this._parent.get_name() }};
+        var puntos = {{ this.capa_puntos.get_name() }};
+        var config = {{ this.config_json }};
+        var celdas = L.layerGroup();
+        // Cada nivel se descarga la primera vez que se necesita y se reutiliza después
+        var niveles = {};
+        function cargarNivel(z) {
+            niveles[z] = niveles[z] || fetch({{ this.url_niveles }}.replace('{zoom}', z))
+                .then(function (r) { return r.json(); });
+            return niveles[z];
+        }
+        function nivelActual() {
+            var zoom = mapa.getZoom();
+            return zoom >= config.umbral ? null : Math.max(0, Math.min(Math.round(zoom), config.umbral - 1));
+        }
+        function colorCelda(valor) {
+            if (valor === null || valor === undefined) { return config.color_defecto; }
+            for (var i = 0; i < config.umbrales.length; i++) {
+                if (valor >= config.umbrales[i]) { return config.colores[i]; }
+            }
+            return config.color_defecto;
+        }
+        function dibujar() {
+            var z = nivelActual();
+            if (z === null) {
+                celdas.clearLayers();
+                mapa.removeLayer(celdas);
+                if (!mapa.hasLayer(puntos)) { mapa.addLayer(puntos); }
+                return;
+            }
+            if (mapa.hasLayer(puntos)) { mapa.removeLayer(puntos); }
+            cargarNivel(z).then(function (nivel) {
+                // El zoom pudo cambiar mientras se descargaba el nivel
+                if (nivelActual() === z) { pintar(nivel); }
+            });
+        }
+        function pintar(nivel) {
+            celdas.clearLayers();
+            for (var i = 0; i < nivel.n.length; i++) {
+                var color = colorCelda(nivel.max ? nivel.max[i] : null);
+                var texto = nivel.n[i] + ' eventos';
+                if (nivel.max && nivel.max[i] !== null) {
+                    texto += ' · máx ' + nivel.max[i] + ' · media ' + nivel.media[i];
+                }
+                L.circleMarker([nivel.lat[i], nivel.lon[i]], {
+                    radius: Math.min(30, 6 + 4 * Math.log(nivel.n[i])),
+                    color: color, fillColor: color, fillOpacity: 0.6, weight: 1
+                }).bindTooltip(texto).addTo(celdas);
+            }
+            celdas.addTo(mapa);
+        }
+        mapa.on('zoomend', dibujar);
+        dibujar();
+    })();
+{% endmacro %}
+"""
+
+
+def agregar_capa_agregada(mapa, df, tipo_dato, capa_puntos, archivo_niveles=None):
+    """
+    Añade las celdas agregadas por zoom. Por debajo de ZOOM_UMBRAL_MARCADORES se
+    muestran las celdas del nivel actual y se oculta la capa de puntos.
+    Cada nivel se escribe en archivo_niveles (con {zoom} en el nombre) y el navegador
+    lo descarga al llegar a ese zoom.
+    """
+    archivo_niveles = archivo_niveles or ARCHIVO_NIVELES
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    
+    umbrales, colores, color_defecto = UMBRALES_COLOR.get(tipo_dato, ([], [], 'blue'))
+    config = {'umbrales': umbrales, 'colores': colores, 'color_defecto': color_defecto,
+              'umbral': ZOOM_UMBRAL_MARCADORES}
+    elemento = crear_elemento_js(
+        PLANTILLA_CAPA_AGREGADA,
+        capa_puntos=capa_puntos,
+        url_niveles=json.dumps(os.path.basename(archivo_niveles)),
+        config_json=a_json_compacto(config)
+    )
+    
+    niveles = construir_niveles_agregacion(df, tipo_dato)
+    for zoom, celdas in niveles.items():
+        escribir_atomico(archivo_niveles.format(zoom=zoom), a_json_compacto(celdas))
+    print(f"✓ {len(niveles)} niveles de agregación guardados como: {archivo_niveles}")
+    mapa.add_child(elemento)
+    return elemento
+
+
+def pesos_heatmap(df, tipo_dato):
+    """
+    Peso de cada punto en el heatmap: magnitud / 5 en terremotos (0.1 si no es positiva)
+    y 1 para el resto de tipos.
+    """
+    if tipo_dato == "terremotos" and 'magnitud' in df.columns:
+        magnitud = pd.to_numeric(df['magnitud'], errors='coerce').to_numpy(dtype=float)
+        return np.where(magnitud > 0, magnitud / 5.0, 0.1)
+    return np.ones(len(df))
+
+
+def agrupar_pesos_en_celdas(lat, lon, pesos, tamaño_celda, grupos=None):
+    """
+    Ajusta los puntos al centro de su celda y suma los pesos por celda (y por grupo,
+    si se indica). Retorna (grupo, lat, lon, peso) de las celdas ocupadas.
+    """
+    grupos = np.zeros(len(lat), dtype=np.int64) if grupos is None else grupos
+    iy = np.floor((lat + 90.0) / tamaño_celda).astype(np.int64)
+    ix = np.floor((lon + 180.0) / tamaño_celda).astype(np.int64)
+    filas = int(np.ceil(180.0 / tamaño_celda)) + 1
+    columnas = int(np.ceil(360.0 / tamaño_celda)) + 1
+    
+    claves = (grupos * filas + iy) * columnas + ix
+    unicas, inversa = np.unique(claves, return_inverse=True)
+    suma = np.bincount(inversa, weights=pesos)
+    
+    grupo, resto = np.divmod(unicas, filas * columnas)
+    iy, ix = np.divmod(resto, columnas)
+    return grupo, (iy + 0.5) * tamaño_celda - 90.0, (ix + 0.5) * tamaño_celda - 180.0, suma
+
+
+def construir_datos_heatmap(df, tipo_dato, tamaño_celda=None):
+    """
+    Construye los puntos [lat, lon, peso] del heatmap de forma vectorizada.
+    Con tamaño de celda, emite una entrada por celda ocupada con la suma de sus pesos,
+    normalizada para que la celda más intensa valga 1.
+    """
+    tamaño_celda = TAMAÑO_CELDA_HEATMAP if tamaño_celda is None else tamaño_celda
+    df, lat, lon = validar_coordenadas(df)
+    lat, lon = lat.to_numpy(dtype=float), lon.to_numpy(dtype=float)
+    pesos = pesos_heatmap(df, tipo_dato)
+    
+    if tamaño_celda:
+        _, lat, lon, pesos = agrupar_pesos_en_celdas(lat, lon, pesos, tamaño_celda)
+        if len(pesos):
+            pesos = pesos / pesos.max()
+    
+    return np.column_stack([np.round(lat, 4), np.round(lon, 4), np.round(pesos, 3)]).tolist()
+
+
+def construir_heatmap_por_tiempo(df, tipo_dato, periodo=None, tamaño_celda=None):
+    """
+    Construye los cuadros de HeatMapWithTime agrupando por periodo de 'fecha' y por celda
+    en una sola pasada. Retorna (cuadros, etiquetas).
+    """
+    periodo = periodo or PERIODO_HEATMAP
+    tamaño_celda = TAMAÑO_CELDA_HEATMAP if tamaño_celda is None else tamaño_celda
+    df, lat, lon = validar_coordenadas(df)
+    fechas = pd.to_datetime(df['fecha'], errors='coerce')
+    con_fecha = fechas.notna().to_numpy()
+    
+    periodos = fechas[con_fecha].dt.floor(periodo)
+    codigos, etiquetas = pd.factorize(periodos, sort=True)
+    if len(etiquetas) == 0:
+        return [], []
+    lat = lat.to_numpy(dtype=float)[con_fecha]
+    lon = lon.to_numpy(dtype=float)[con_fecha]
+    pesos = pesos_heatmap(df, tipo_dato)[con_fecha]
+    
+    if tamaño_celda:
+        codigos, lat, lon, pesos = agrupar_pesos_en_celdas(lat, lon, pesos, tamaño_celda, codigos)
+        if len(pesos):
+            pesos = pesos / pesos.max()
+    
+    puntos = np.column_stack([np.round(lat, 4), np.round(lon, 4), np.round(pesos, 3)])
+    orden = np.argsort(codigos, kind='stable')
+    cortes = np.searchsorted(codigos[orden], np.arange(1, len(etiquetas)))
+    cuadros = [bloque.tolist() for bloque in np.split(puntos[orden], cortes)]
+    
+    formato = '%Y-%m-%d %H:%M' if periodo.lower() in ('h', 'min') else '%Y-%m-%d'
+    return cuadros, [e.strftime(formato) for e in etiquetas]
+
+
+def construir_cuadros(fechas, periodo=None):
+    """
+    Reparte los eventos en cuadros consecutivos de 'periodo' en una sola pasada, sin
+    copiar puntos: los eventos del cuadro k son indices[inicios[k]:inicios[k + 1]]
+    (posiciones en fechas). Los cuadros sin eventos también existen, para que el tiempo
+    avance a ritmo constante; los eventos sin fecha no entran en ninguno.
+    Retorna (indices, inicios, etiquetas).
+    """
+    periodo = periodo or PERIODO_REPRODUCCION
+    fechas = pd.Series(pd.to_datetime(fechas, errors='coerce'))
+    validos = np.flatnonzero(fechas.notna().to_numpy())
+    if len(validos) == 0:
+        return np.array([], dtype=np.int64), np.zeros(1, dtype=np.int64), []
+    
+    pisos = fechas.iloc[validos].dt.floor(periodo)
+    # 'h' o 'D' solos equivalen a '1h' o '1D'
+    paso = pd.Timedelta(periodo if periodo[0].isdigit() else '1' + periodo)
+    inicio = pisos.min()
+    codigos = ((pisos - inicio) // paso).to_numpy(dtype=np.int64)
+    total = int(codigos.max()) + 1
+    
+    indices = validos[np.argsort(codigos, kind='stable')]
+    inicios = np.concatenate([[0], np.cumsum(np.bincount(codigos, minlength=total))])
+    formato = '%Y-%m-%d %H:%M' if paso < pd.Timedelta('1D') else '%Y-%m-%d'
+    etiquetas = pd.date_range(inicio, periods=total, freq=paso).strftime(formato).tolist()
+    return indices, inicios, etiquetas
+
+
+# Capa de reproducción: los puntos se escriben una vez y cada cuadro es un tramo de
+# 'indices'. Con una ventana de varios cuadros el tramo sigue siendo contiguo
+PLANTILLA_CAPA_REPRODUCCION = """
+{% macro header(this, kwargs) %}
+<style>
+    .control-reproduccion { background: white; padding: 6px 10px; border-radius: 5px;
+        box-shadow: 0 0 10px rgba(0,0,0,0.2); font-size: 12px; }
+    .control-reproduccion input { width: 220px; vertical-align: middle; }
+    .control-reproduccion button { width: 28px; cursor: pointer; }
+</style>
+{% endmacro %}
+{% macro script(this, kwargs) %}
+    (function () {
+        {{ this.funciones }}
+        var config = {{ this.config_json }};
+        var mapa = {{ this.nombre_mapa }};
+        var capa = {{ this._parent.get_name() }};
+        var datos = {{ this.datos_json }};
+        var indices = {{ this.indices_json }}, inicios = {{ this.inicios_json }};
+        var etiquetas = {{ this.etiquetas_json }}, ventana = {{ this.ventana }};
+        // Cada marcador se crea la primera vez que aparece y se reutiliza en los demás cuadros
+        var marcadores = new Array(datos.features.length);
+        function marcador(i) {
+            if (!marcadores[i]) {
+                var f = datos.features[i], c = f.geometry.coordinates;
+                marcadores[i] = crearMarcador(config, f.properties, L.latLng(c[1], c[0]));
+            }
+            return marcadores[i];
+        }
+        
+        var control = L.control({position: 'bottomleft'});
+        var boton, deslizador, texto, temporizador = null, actual = 0;
+        control.onAdd = function () {
+            var div = L.DomUtil.create('div', 'control-reproduccion');
+            boton = L.DomUtil.create('button', '', div);
+            deslizador = L.DomUtil.create('input', '', div);
+            texto = L.DomUtil.create('span', '', div);
+            boton.innerHTML = '▶';
+            deslizador.type = 'range';
+            deslizador.min = 0;
+            deslizador.max = etiquetas.length - 1;
+            deslizador.value = actual;
+            L.DomEvent.disableClickPropagation(div);
+            L.DomEvent.on(boton, 'click', function () { temporizador ? pausar() : reproducir(); });
+            L.DomEvent.on(deslizador, 'input', function () { pausar(); mostrar(Number(deslizador.value)); });
+            return div;
+        };
+        
+        function mostrar(k) {
+            capa.clearLayers();
+            var desde = inicios[Math.max(0, k - ventana + 1)], hasta = inicios[k + 1];
+            for (var j = desde; j < hasta; j++) { capa.addLayer(marcador(indices[j])); }
+            actual = k;
+            deslizador.value = k;
+            texto.innerHTML = ' ' + etiquetas[k] + ' · ' + (hasta - desde) + ' eventos';
+        }
+        function reproducir() {
+            boton.innerHTML = '❚❚';
+            temporizador = setInterval(function () {
+                mostrar((actual + 1) % etiquetas.length);
+            }, {{ this.intervalo }});
+        }
+        function pausar() {
+            clearInterval(temporizador);
+            temporizador = null;
+            boton.innerHTML = '▶';
+        }
+        
+        // El deslizador solo se muestra mientras la capa está activa
+        mapa.on('overlayadd', function (e) { if (e.layer === capa) { control.addTo(mapa); mostrar(actual); } });
+        mapa.on('overlayremove', function (e) { if (e.layer === capa) { pausar(); control.remove(); } });
+        if (mapa.hasLayer(capa)) {
+            control.addTo(mapa);
+            mostrar(actual);
+        }
+    })();
+{% endmacro %}
+"""
+
+
+def agregar_capa_reproduccion(mapa, df, tipo_dato, periodo=None, ventana=None, mostrar=True):
+    """
+    Añade una capa que reproduce los eventos en el tiempo con un deslizador. Cada punto
+    se incluye una sola vez y cada cuadro es un tramo de índices (construir_cuadros), así
+    que el tamaño crece con el número de eventos y no con eventos × cuadros.
+    """
+    import folium
+    
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    ventana = CUADROS_VISIBLES if ventana is None else ventana
+    
+    # Los índices de los cuadros apuntan a las filas con coordenadas válidas
+    df, _, _ = validar_coordenadas(df)
+    indices, inicios, etiquetas = construir_cuadros(df['fecha'], periodo)
+    if not etiquetas:
+        return None
+    
+    capa = folium.FeatureGroup(name="Reproducción temporal", show=mostrar).add_to(mapa)
+    capa.add_child(crear_elemento_js(
+        PLANTILLA_CAPA_REPRODUCCION,
+        funciones=FUNCIONES_CLIENTE_JS,
+        config_json=a_json_compacto(configuracion_cliente(df, tipo_dato)),
+        nombre_mapa=mapa.get_name(),
+        datos_json=a_json_compacto(construir_geojson_compacto(df, tipo_dato)),
+        indices_json=a_json_compacto(indices.tolist()),
+        inicios_json=a_json_compacto(inicios.tolist()),
+        etiquetas_json=a_json_compacto(etiquetas),
+        ventana=max(1, int(ventana)),
+        intervalo=int(INTERVALO_REPRODUCCION_MS)
+    ))
+    print(f"✓ Reproducción temporal: {len(etiquetas)} cuadros de {periodo or PERIODO_REPRODUCCION}")
+    return capa
+
+
+# Script que mantiene los puntos sincronizados con el servidor mediante Server-Sent Events:
+# "inicial" trae todos los puntos y "delta" solo los cambiados (cambios) y eliminados (bajas)
+PLANTILLA_CAPA_EN_VIVO = """
+{% macro script(this, kwargs) %}
+    (function () {
+        {{ this.funciones }}
+        var config = {{ this.config_json }};
+        var capa = {{ this._parent.get_name() }};
+        var marcadores = {};
+        function quitar(clave) {
+            if (marcadores[clave]) { capa.removeLayer(marcadores[clave]); delete marcadores[clave]; }
+        }
+        function poner(features) {
+            var nuevos = features.map(function (f) {
+                quitar(f.id);
+                var c = f.geometry.coordinates;
+                marcadores[f.id] = crearMarcador(config, f.properties, L.latLng(c[1], c[0]));
+                return marcadores[f.id];
+            });
+            capa.addLayers(nuevos);
+        }
+        var fuente = new EventSource({{ this.url_json }});
+        fuente.addEventListener('inicial', function (e) {
+            capa.clearLayers();
+            marcadores = {};
+            poner(JSON.parse(e.data).cambios);
+        });
+        fuente.addEventListener('delta', function (e) {
+            var delta = JSON.parse(e.data);
+            delta.bajas.forEach(quitar);
+            poner(delta.cambios);
+        });
+    })();
+{% endmacro %}
+"""
+
+
+def agregar_capa_en_vivo(mapa, df, tipo_dato, url_eventos='/eventos'):
+    """
+    Añade una capa vacía que recibe los puntos y sus cambios desde el servidor.
+    """
+    from folium.plugins import MarkerCluster
+    
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    
+    capa = MarkerCluster(name="Marcadores", overlay=True, control=True).add_to(mapa)
+    capa.add_child(crear_elemento_js(
+        PLANTILLA_CAPA_EN_VIVO,
+        funciones=FUNCIONES_CLIENTE_JS,
+        config_json=a_json_compacto(configuracion_cliente(df, tipo_dato)),
+        url_json=json.dumps(url_eventos)
+    ))
+    return capa
+
+
+def agregar_capa_marcadores(mapa, df, tipo_dato, nombre="Marcadores"):
+    """
+    Añade los puntos como una sola capa FastMarkerCluster con estilo y popups precalculados.
+    """
+    from folium.plugins import FastMarkerCluster
+    
+    datos_marcadores = construir_datos_marcadores(df, tipo_dato)
+    capa_marcadores = FastMarkerCluster(
+        [],
+        callback=CALLBACK_MARCADOR_JS,
+        name=nombre,
+        overlay=True,
+        control=True
+    )
+    # Las coordenadas ya fueron validadas de forma vectorizada
+    capa_marcadores.data = datos_marcadores.values.tolist()
+    capa_marcadores.add_to(mapa)
+    return capa_marcadores
+
+
+# Define una sola vez en la capa padre (MarkerCluster) la función que crea los
+# marcadores de un fragmento
+PLANTILLA_FUNCIONES_MARCADORES = """
+{% macro script(this, kwargs) %}
+    (function () {
+        var capa = {{ this._parent.get_name() }};
+        var callback = {{ this.callback }};
+        capa.agregarPuntos = function (datos) { capa.addLayers(datos.map(callback)); };
+    })();
+{% endmacro %}
+"""
+
+# Añade a la capa padre los puntos precalculados de un fragmento
+PLANTILLA_FRAGMENTO_PUNTOS = """
+{% macro script(this, kwargs) %}
+    {{ this._parent.get_name() }}.agregarPuntos({{ this.datos_json }});
+{% endmacro %}
+"""
+
+
+def dividir_en_fragmentos(df, partes, criterio=None):
+    """
+    Reparte las filas en fragmentos de tamaño parecido: por franjas de longitud
+    ("region") o por intervalos de fecha ("tiempo"). Retorna una lista de DataFrames.
+    """
+    criterio = criterio or DIVISION_FRAGMENTOS
+    if criterio == "tiempo" and 'fecha' in df.columns:
+        orden = pd.to_datetime(df['fecha'], errors='coerce').to_numpy().argsort(kind='stable')
+    else:
+        orden = pd.to_numeric(df['lon'], errors='coerce').to_numpy().argsort(kind='stable')
+    
+    return [df.iloc[posiciones] for posiciones in np.array_split(orden, partes) if len(posiciones)]
+
+
+def describir_fragmento(df, criterio=None):
+    """
+    Texto con el rango que cubre un fragmento (longitudes o fechas).
+    """
+    criterio = criterio or DIVISION_FRAGMENTOS
+    if criterio == "tiempo" and 'fecha' in df.columns:
+        fechas = pd.to_datetime(df['fecha'], errors='coerce')
+        return f"{fechas.min():%Y-%m-%d %H:%M} → {fechas.max():%Y-%m-%d %H:%M}"
+    lon = pd.to_numeric(df['lon'], errors='coerce')
+    return f"longitud {lon.min():.2f}° → {lon.max():.2f}°"
+
+
+def construir_fragmento(df, tipo_dato, modo_salida, tamaño_celda):
+    """
+    Trabajo de un proceso: serializa los puntos del fragmento y agrupa sus pesos de
+    heatmap por celda (sin normalizar, para poder sumar celdas de otros fragmentos).
+    Retorna un dict con 'puntos' (JSON), 'heatmap' (lat, lon, peso) y 'filas'.
+    """
+    if modo_salida == "geojson":
+        puntos = a_json_compacto(construir_geojson_compacto(df, tipo_dato))
+    else:
+        puntos = a_json_compacto(construir_datos_marcadores(df, tipo_dato).values.tolist())
+    
+    df_valido, lat, lon = validar_coordenadas(df)
+    lat, lon = lat.to_numpy(dtype=float), lon.to_numpy(dtype=float)
+    pesos = pesos_heatmap(df_valido, tipo_dato)
+    if tamaño_celda:
+        _, lat, lon, pesos = agrupar_pesos_en_celdas(lat, lon, pesos, tamaño_celda)
+    
+    return {'puntos': puntos, 'heatmap': (lat, lon, pesos), 'filas': len(df)}
+
+
+def valor_transferible(valor):
+    """
+    True si el valor está hecho solo de tipos simples (también dentro de listas, tuplas y
+    dicts), de modo que se puede enviar a otro proceso aunque se inicie con spawn.
+    """
+    if isinstance(valor, (str, int, float, bool, type(None))):
+        return True
+    if isinstance(valor, (list, tuple)):
+        return all(valor_transferible(v) for v in valor)
+    if isinstance(valor, dict):
+        return all(valor_transferible(k) and valor_transferible(v) for k, v in valor.items())
+    return False
+
+
+def configuracion_actual():
+    """
+    Copia de la configuración del módulo (constantes en mayúsculas) para los procesos
+    hijos, que pueden no heredar los cambios hechos en tiempo de ejecución. Se omiten
+    las que guardan funciones u objetos (FORMATOS_DISPONIBLES, CIRCUITOS…): cada proceso
+    ya tiene las suyas al importar el módulo.
+    """
+    return {nombre: valor for nombre, valor in globals().items()
+            if nombre.isupper() and valor_transferible(valor)}
+
+
+def aplicar_configuracion(configuracion):
+    """
+    Inicializador de los procesos hijos: aplica la configuración del proceso principal.
+    Dentro de un proceso no se vuelve a fragmentar.
+    """
+    globals().update(configuracion)
+    globals()['PROCESOS_RENDER'] = 1
+
+
+@contextmanager
+def configuracion_temporal(**ajustes):
+    """
+    Cambia variables de configuración del módulo durante el bloque y luego las restaura.
+    """
+    anteriores = {nombre: globals()[nombre] for nombre in ajustes}
+    globals().update(ajustes)
+    try:
+        yield
+    finally:
+        globals().update(anteriores)
+
+
+def ejecutar_en_procesos(funcion, tareas, procesos):
+    """
+    Ejecuta funcion(*tarea) para cada tarea en un ProcessPoolExecutor y retorna los
+    resultados en el orden de las tareas.
+    """
+    with ProcessPoolExecutor(max_workers=procesos, initializer=aplicar_configuracion,
+                             initargs=(configuracion_actual(),)) as ejecutor:
+        futuros = [ejecutor.submit(funcion, *tarea) for tarea in tareas]
+        return [futuro.result() for futuro in futuros]
+
+
+def construir_fragmentos_en_paralelo(df, tipo_dato, procesos=None):
+    """
+    Divide el DataFrame y construye la capa de cada fragmento en un proceso distinto.
+    """
+    procesos = procesos or PROCESOS_RENDER
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    
+    fragmentos = dividir_en_fragmentos(df, procesos)
+    tareas = [(fragmento, tipo_dato, MODO_SALIDA, TAMAÑO_CELDA_HEATMAP) for fragmento in fragmentos]
+    resultados = ejecutar_en_procesos(construir_fragmento, tareas, procesos)
+    print(f"✓ {len(resultados)} fragmentos construidos en {procesos} procesos")
+    return resultados
+
+
+def agregar_capa_fragmentada(mapa, fragmentos, df, tipo_dato, mostrar=True):
+    """
+    Une los puntos ya serializados de cada fragmento en un único MarkerCluster.
+    Las funciones y la configuración del navegador se escriben una sola vez por capa;
+    cada fragmento solo añade sus datos.
+    """
+    from folium.plugins import MarkerCluster
+    
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    
+    capa = MarkerCluster(name="Marcadores", overlay=True, control=True, show=mostrar).add_to(mapa)
+    if MODO_SALIDA == "geojson":
+        funciones = crear_elemento_js(
+            PLANTILLA_CAPA_GEOJSON,
+            funciones=FUNCIONES_CLIENTE_JS,
+            config_json=a_json_compacto(configuracion_cliente(df, tipo_dato)),
+            datos_json=None,
+            url_json=None,
+            url_detalles=None
+        )
+    else:
+        funciones = crear_elemento_js(PLANTILLA_FUNCIONES_MARCADORES, callback=CALLBACK_MARCADOR_JS)
+    capa.add_child(funciones)
+    
+    for fragmento in fragmentos:
+        capa.add_child(crear_elemento_js(PLANTILLA_FRAGMENTO_PUNTOS, datos_json=fragmento['puntos']))
+    return capa
+
+
+def combinar_heatmap_fragmentos(fragmentos, tamaño_celda=None):
+    """
+    Une las celdas de heatmap de los fragmentos: suma las que coinciden y normaliza
+    igual que construir_datos_heatmap.
+    """
+    tamaño_celda = TAMAÑO_CELDA_HEATMAP if tamaño_celda is None else tamaño_celda
+    lat, lon, pesos = (np.concatenate(partes) for partes in zip(*(f['heatmap'] for f in fragmentos)))
+    
+    if tamaño_celda:
+        _, lat, lon, pesos = agrupar_pesos_en_celdas(lat, lon, pesos, tamaño_celda)
+        if len(pesos):
+            pesos = pesos / pesos.max()
     
+    return np.column_stack([np.round(lat, 4), np.round(lon, 4), np.round(pesos, 3)]).tolist()
+
+
+# Cambiar si cambia el formato de los fragmentos, para no reutilizar los anteriores
+VERSION_CACHE_CAPAS = 1
+
+
+def dividir_en_cubetas(df):
+    """
+    Reparte las filas en cubetas estables para la caché de capas: un día de 'fecha' por
+    cubeta o, sin fechas, franjas de ANCHO_FRANJA_CACHE grados de longitud. Una cubeta
+    cuyas filas no cambian produce siempre el mismo fragmento.
+    Retorna una lista de arreglos de posiciones, en el orden original dentro de cada una.
+    """
+    if 'fecha' in df.columns:
+        fechas = pd.to_datetime(df['fecha'], errors='coerce')
+        # NaT queda como el entero mínimo: todas las filas sin fecha van a la misma cubeta
+        cubetas = fechas.dt.floor('D').to_numpy(dtype='datetime64[ns]').view(np.int64)
     else:
-        print("Opción no válida, usando datos de ejemplo...")
-        return usar_datos_ejemplo()
+        lon = pd.to_numeric(df['lon'], errors='coerce').to_numpy(dtype=float)
+        cubetas = np.floor(np.nan_to_num(lon, nan=-1000.0) / ANCHO_FRANJA_CACHE)
+    
+    codigos, _ = pd.factorize(cubetas, sort=True)
+    orden = np.argsort(codigos, kind='stable')
+    cortes = np.flatnonzero(np.diff(codigos[orden])) + 1
+    return np.split(orden, cortes)
 
 
-def usar_datos_ejemplo():
+def huella_configuracion_capas(tipo_dato):
     """
-    Carga datos de ejemplo desde archivo JSON cuando la API falla.
+    Texto con todo lo que, además de los datos, cambia el contenido de un fragmento.
+    """
+    return json.dumps([
+        VERSION_CACHE_CAPAS, tipo_dato, MODO_SALIDA, TAMAÑO_CELDA_HEATMAP, FORMATO_FECHA,
+        UMBRALES_COLOR.get(tipo_dato), ESTILO_MARCADOR.get(tipo_dato),
+        PLANTILLAS_TOOLTIP.get(tipo_dato), PLANTILLAS_POPUP.get(tipo_dato)
+    ], default=str, ensure_ascii=False)
+
+
+def leer_fragmento_cache(directorio, clave):
     """
+    Retorna el fragmento guardado con esa clave, o None si no está. Al leerlo se
+    actualiza su fecha de uso para el desalojo LRU.
+    """
+    ruta_puntos = os.path.join(directorio, f"{clave}.json")
+    ruta_heatmap = os.path.join(directorio, f"{clave}.npy")
     try:
-        # Crear datos de ejemplo si no existe el archivo
-        if not os.path.exists(ARCHIVO_JSON_FALLBACK):
-            crear_datos_ejemplo()
-        
-        with open(ARCHIVO_JSON_FALLBACK, 'r', encoding='utf-8') as f:
-            datos = json.load(f)
-        
-        df = pd.DataFrame(datos)
-        print(f"✓ {len(df)} registros cargados desde archivo de ejemplo")
-        return df
-        
-    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-        print(f"✗ Error al cargar datos de ejemplo: {e}")
-        # Datos de emergencia
-        datos_emergencia = [
-            {
-                'lugar': 'Santiago Centro',
-                'magnitud': 4.2,
-                'lat': -33.4489,
-                'lon': -70.6693,
-                'fecha': datetime.now().strftime('%Y-%m-%d %H:%M'),
-                'tipo': 'Terremoto',
-                'profundidad': 10
-            }
-        ]
-        df = pd.DataFrame(datos_emergencia)
-        print("✓ Datos de emergencia creados")
-        return df
+        with open(ruta_puntos, encoding='utf-8') as f:
+            puntos = f.read()
+        lat, lon, pesos = np.load(ruta_heatmap)
+        os.utime(ruta_puntos)
+    except (OSError, ValueError):
+        return None
+    return {'puntos': puntos, 'heatmap': (lat, lon, pesos)}
 
 
-def crear_datos_ejemplo():
+def guardar_fragmento_cache(directorio, clave, fragmento):
     """
-    Crea un archivo JSON con datos de ejemplo.
+    Guarda los puntos serializados (JSON) y las celdas de heatmap (.npy) de un fragmento.
     """
-    datos_ejemplo = [
-        {
-            "lugar": "30km al norte de Santiago",
-            "magnitud": 4.2,
-            "lat": -33.1,
-            "lon": -70.5,
-            "profundidad": 15,
-            "fecha": datetime.now().strftime('%Y-%m-%d %H:%M'),
-            "tipo": "Terremoto"
-        },
-        {
-            "lugar": "Valparaíso",
-            "magnitud": 3.8,
-            "lat": -33.0458,
-            "lon": -71.6197,
-            "profundidad": 25,
-            "fecha": (datetime.now() - timedelta(hours=2)).strftime('%Y-%m-%d %H:%M'),
-            "tipo": "Terremoto"
-        },
-        {
-            "lugar": "Concepción",
-            "magnitud": 5.1,
-            "lat": -36.8269,
-            "lon": -73.0497,
-            "profundidad": 30,
-            "fecha": (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M'),
-            "tipo": "Terremoto"
-        },
-        {
-            "lugar": "Antofagasta",
-            "magnitud": 4.5,
-            "lat": -23.6500,
-            "lon": -70.4000,
-            "profundidad": 40,
-            "fecha": (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d %H:%M'),
-            "tipo": "Terremoto"
-        }
-    ]
-    
-    with open(ARCHIVO_JSON_FALLBACK, 'w', encoding='utf-8') as f:
-        json.dump(datos_ejemplo, f, indent=2, ensure_ascii=False)
-    
-    print(f"✓ Archivo de ejemplo creado: {ARCHIVO_JSON_FALLBACK}")
+    buffer = io.BytesIO()
+    np.save(buffer, np.vstack(fragmento['heatmap']).astype(float))
+    escribir_atomico(os.path.join(directorio, f"{clave}.npy"), buffer.getvalue())
+    escribir_atomico(os.path.join(directorio, f"{clave}.json"), fragmento['puntos'])
 
 
-def asignar_color_marcador(dato, tipo_dato):
+def podar_cache_capas(directorio, maximo_bytes):
     """
-    Asigna color al marcador según el tipo de dato y su valor.
+    Borra los fragmentos usados hace más tiempo hasta que la caché ocupe maximo_bytes o menos.
+    Retorna el número de fragmentos borrados.
     """
-    if tipo_dato == "terremotos":
-        if dato >= 5.0:
-            return 'red'
-        elif dato >= 4.0:
-            return 'orange'
-        elif dato >= 3.0:
-            return 'lightgreen'
-        else:
-            return 'green'
-    
-    elif tipo_dato == "clima":
-        if dato >= 30:
-            return 'red'
-        elif dato >= 20:
-            return 'orange'
-        elif dato >= 10:
-            return 'lightblue'
-        else:
-            return 'blue'
+    entradas = []
+    for ruta in glob.glob(os.path.join(directorio, '*.json')):
+        base = ruta[:-len('.json')]
+        try:
+            tamaño = os.path.getsize(ruta) + os.path.getsize(base + '.npy')
+            entradas.append((os.path.getmtime(ruta), tamaño, base))
+        except OSError:
+            continue
     
-    return 'blue'  # Color por defecto
+    total = sum(tamaño for _, tamaño, _ in entradas)
+    borrados = 0
+    for _, tamaño, base in sorted(entradas):
+        if total <= maximo_bytes:
+            break
+        for extension in ('.json', '.npy'):
+            try:
+                os.remove(base + extension)
+            except FileNotFoundError:
+                pass
+        total -= tamaño
+        borrados += 1
+    return borrados
 
 
-def asignar_icono(tipo):
+def construir_fragmentos_con_cache(df, tipo_dato, directorio=None):
     """
-    Asigna un ícono según el tipo de dato.
+    Construye la capa por cubetas (dividir_en_cubetas) y reutiliza desde disco las que
+    no cambiaron. Cada fragmento se guarda por una huella de sus filas y de la
+    configuración de estilo, así que en cada actualización solo se serializan las
+    cubetas nuevas o modificadas. Los que faltan se construyen en PROCESOS_RENDER
+    procesos si son suficientes filas. Retorna la lista de fragmentos.
     """
-    if tipo == "Terremoto":
-        return "info-sign"
-    elif tipo == "Clima":
-        return "cloud"
+    directorio = directorio or DIRECTORIO_CACHE_CAPAS
+    if tipo_dato not in ESTILO_MARCADOR:
+        tipo_dato = "otro"
+    
+    # Huella de cada fila una sola vez; la de una cubeta es la de sus filas en orden
+    base = hashlib.sha256(huella_configuracion_capas(tipo_dato).encode('utf-8'))
+    base.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode('utf-8'))
+    huellas_filas = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    
+    cubetas = dividir_en_cubetas(df)
+    fragmentos, faltantes = [None] * len(cubetas), []
+    for k, posiciones in enumerate(cubetas):
+        huella = base.copy()
+        huella.update(huellas_filas[posiciones].tobytes())
+        clave = huella.hexdigest()
+        fragmento = leer_fragmento_cache(directorio, clave)
+        if fragmento is None:
+            faltantes.append((k, clave))
+        else:
+            fragmento['filas'] = len(posiciones)
+            fragmentos[k] = fragmento
+    
+    tareas = [(df.iloc[cubetas[k]], tipo_dato, MODO_SALIDA, TAMAÑO_CELDA_HEATMAP) for k, _ in faltantes]
+    filas_faltantes = sum(len(cubetas[k]) for k, _ in faltantes)
+    if PROCESOS_RENDER > 1 and filas_faltantes >= FILAS_MINIMAS_FRAGMENTOS:
+        nuevos = ejecutar_en_procesos(construir_fragmento, tareas, PROCESOS_RENDER)
     else:
-        return "info-sign"
+        nuevos = [construir_fragmento(*tarea) for tarea in tareas]
+    
+    for (k, clave), fragmento in zip(faltantes, nuevos):
+        try:
+            guardar_fragmento_cache(directorio, clave, fragmento)
+        except OSError as e:
+            print(f"⚠️  No se pudo guardar un fragmento en la caché de capas: {e}")
+        fragmentos[k] = fragmento
+    
+    if faltantes:
+        podar_cache_capas(directorio, TAMAÑO_MAXIMO_CACHE_CAPAS_MB * 1024 * 1024)
+    print(f"✓ Caché de capas: {len(cubetas) - len(faltantes)} de {len(cubetas)} fragmentos reutilizados "
+          f"({filas_faltantes} filas serializadas)")
+    return fragmentos
 
 
-def crear_mapa_interactivo(df):
+def crear_mapa_base():
     """
-    Crea un mapa interactivo con Folium usando los datos del DataFrame.
+    Mapa base centrado en CENTER_COORDS con capa de terreno, pantalla completa y minimapa.
     """
-    print("Creando mapa interactivo...")
+    import folium
+    from folium.plugins import Fullscreen, MiniMap
     
-    # Crear mapa base
     mapa = folium.Map(
         location=CENTER_COORDS,
         zoom_start=ZOOM_INICIAL,
@@ -282,114 +2705,118 @@ def crear_mapa_interactivo(df):
     
     # Añadir minimapa
     MiniMap(toggle_display=True).add_to(mapa)
+    return mapa
+
+
+def agregar_titulo(mapa, titulo, detalle):
+    """
+    Añade el recuadro de título con la hora de actualización y un detalle de los datos.
+    """
+    import folium
     
-    # Crear clusters para marcadores
-    marker_cluster = MarkerCluster(
-        name="Marcadores",
-        overlay=True,
-        control=True,
-        icon_create_function=None
-    ).add_to(mapa)
+    titulo_html = f'''
+    <div style="
+        position: fixed; 
+        top: 10px; 
+        left: 50%; 
+        transform: translateX(-50%);
+        z-index: 9999; 
+        font-size: 16px; 
+        font-weight: bold;
+        background-color: white; 
+        padding: 10px 20px;
+        border-radius: 5px;
+        box-shadow: 0 0 10px rgba(0,0,0,0.2);
+        border: 2px solid #0078A8;
+        text-align: center;
+    ">
+        {titulo}<br>
+        <span style="font-size: 12px; font-weight: normal;">
+            Actualizado: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Datos: {detalle}
+        </span>
+    </div>
+    '''
+    mapa.get_root().html.add_child(folium.Element(titulo_html))
+
+
+def crear_mapa_interactivo(df, en_vivo=False, fragmentos=None, titulo=None):
+    """
+    Crea un mapa interactivo con Folium usando los datos del DataFrame.
+    Con en_vivo=True el mapa no incluye los puntos: los recibe del servidor (modo servir).
+    Se pueden pasar los fragmentos de capa ya construidos (modo lote) y otro título.
+    """
+    import folium
+    from folium.plugins import HeatMap, HeatMapWithTime
     
-    # Procesar cada fila del DataFrame
-    for idx, row in df.iterrows():
-        try:
-            # Validar coordenadas
-            lat = float(row.get('lat', 0))
-            lon = float(row.get('lon', 0))
-            
-            if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
-                print(f"⚠️  Coordenadas inválidas para {row.get('lugar', 'desconocido')}")
-                continue
-            
-            # Determinar color según el tipo de datos
-            if API_ELEGIDA == "terremotos":
-                color = asignar_color_marcador(row.get('magnitud', 0), "terremotos")
-                tooltip_text = f"{row.get('lugar', 'Lugar desconocido')} - M{row.get('magnitud', 'N/A')}"
-                
-                # Tamaño del marcador según magnitud
-                tamaño = min(30, max(10, row.get('magnitud', 1) * 5))
-                
-                # Popup con información detallada
-                popup_html = f"""
-                <div style="width: 200px;">
-                    <h4 style="color: {color}; margin: 5px 0;">Terremoto</h4>
-                    <hr>
-                    <p><strong>Lugar:</strong> {row.get('lugar', 'N/A')}</p>
-                    <p><strong>Magnitud:</strong> {row.get('magnitud', 'N/A')}</p>
-                    <p><strong>Profundidad:</strong> {row.get('profundidad', 'N/A')} km</p>
-                    <p><strong>Fecha:</strong> {row.get('fecha', 'N/A')}</p>
-                </div>
-                """
-                
-            elif API_ELEGIDA == "clima":
-                color = asignar_color_marcador(row.get('temperatura', 0), "clima")
-                tooltip_text = f"{row.get('ciudad', 'Ciudad desconocida')} - {row.get('temperatura', 'N/A')}°C"
-                tamaño = 15
-                
-                popup_html = f"""
-                <div style="width: 200px;">
-                    <h4 style="color: {color}; margin: 5px 0;">Condiciones Climáticas</h4>
-                    <hr>
-                    <p><strong>Ciudad:</strong> {row.get('ciudad', 'N/A')}</p>
-                    <p><strong>Temperatura:</strong> {row.get('temperatura', 'N/A')}°C</p>
-                    <p><strong>Humedad:</strong> {row.get('humedad', 'N/A')}%</p>
-                    <p><strong>Viento:</strong> {row.get('viento', 'N/A')} km/h</p>
-                    <p><strong>Descripción:</strong> {row.get('descripcion', 'N/A')}</p>
-                    <p><strong>Actualizado:</strong> {row.get('fecha', 'N/A')}</p>
-                </div>
-                """
-            
-            else:
-                color = 'blue'
-                tooltip_text = row.get('lugar', 'Ubicación')
-                tamaño = 12
-                
-                popup_html = f"""
-                <div style="width: 200px;">
-                    <h4>Información</h4>
-                    <hr>
-                    <p><strong>Lugar:</strong> {row.get('lugar', 'N/A')}</p>
-                    <p><strong>Tipo:</strong> {row.get('tipo', 'N/A')}</p>
-                    <p><strong>Fecha:</strong> {row.get('fecha', 'N/A')}</p>
-                </div>
-                """
-            
-            # Crear marcador
-            folium.CircleMarker(
-                location=[lat, lon],
-                radius=tamaño,
-                popup=folium.Popup(popup_html, max_width=300),
-                tooltip=tooltip_text,
-                color=color,
-                fill=True,
-                fill_color=color,
-                fill_opacity=0.7,
-                weight=2
-            ).add_to(marker_cluster)
-            
-        except (KeyError, ValueError, TypeError) as e:
-            print(f"✗ Error al procesar fila {idx}: {e}")
-            continue
+    print("Creando mapa interactivo...")
     
-    # Crear heatmap si hay suficientes datos
-    if len(df) >= 5:
-        print("Añadiendo capa de heatmap...")
-        datos_heatmap = []
-        
-        # Ponderar por magnitud si es terremoto
-        if API_ELEGIDA == "terremotos" and 'magnitud' in df.columns:
-            for _, row in df.iterrows():
-                try:
-                    peso = float(row['magnitud']) / 5.0 if row['magnitud'] > 0 else 0.1
-                    datos_heatmap.append([row['lat'], row['lon'], peso])
-                except (ValueError, KeyError):
-                    continue
+    # Crear mapa base
+    mapa = crear_mapa_base()
+    
+    # Con agregación, la página solo lleva las celdas; los puntos y cada nivel se descargan aparte
+    agregacion = AGREGACION_ESPACIAL and not en_vivo
+    if agregacion:
+        fragmentos = None
+    
+    # Con la caché de capas solo se serializan las cubetas que cambiaron; con varios
+    # procesos, cada fragmento de los datos se serializa en paralelo
+    externos = MODO_SALIDA == "geojson" and (GEOJSON_EXTERNO or DETALLES_EXTERNOS)
+    construir = fragmentos is None and not en_vivo and not externos and not agregacion
+    if construir and CACHE_CAPAS and not df.empty:
+        with medir_etapa('fragmentos'):
+            fragmentos = construir_fragmentos_con_cache(df, API_ELEGIDA)
+    elif construir and PROCESOS_RENDER > 1 and len(df) >= FILAS_MINIMAS_FRAGMENTOS:
+        with medir_etapa('fragmentos'):
+            fragmentos = construir_fragmentos_en_paralelo(df, API_ELEGIDA)
+    
+    # Con reproducción, la capa de todos los puntos empieza oculta para no tapar los cuadros
+    reproduccion = REPRODUCCION_TEMPORAL and not en_vivo and 'fecha' in df.columns
+    
+    # Construir todos los marcadores de una vez y escribirlos como una sola capa
+    with medir_etapa('marcadores'):
+        if en_vivo:
+            capa_puntos = agregar_capa_en_vivo(mapa, df, API_ELEGIDA)
+        elif agregacion:
+            # Los puntos se descargan y agrupan solo al pasar ZOOM_UMBRAL_MARCADORES
+            archivo_detalles = ARCHIVO_DETALLES if DETALLES_EXTERNOS else None
+            capa_puntos = agregar_capa_geojson(mapa, df, API_ELEGIDA, ARCHIVO_GEOJSON, mostrar=False,
+                                               archivo_detalles=archivo_detalles, diferido=True)
+        elif fragmentos:
+            capa_puntos = agregar_capa_fragmentada(mapa, fragmentos, df, API_ELEGIDA, mostrar=not reproduccion)
+        elif MODO_SALIDA == "geojson":
+            archivo_externo = ARCHIVO_GEOJSON if GEOJSON_EXTERNO else None
+            archivo_detalles = ARCHIVO_DETALLES if DETALLES_EXTERNOS else None
+            capa_puntos = agregar_capa_geojson(mapa, df, API_ELEGIDA, archivo_externo,
+                                               mostrar=not reproduccion, archivo_detalles=archivo_detalles)
         else:
-            datos_heatmap = df[['lat', 'lon']].values.tolist()
+            capa_puntos = agregar_capa_marcadores(mapa, df, API_ELEGIDA)
+    
+    # Celdas agregadas por nivel de zoom; los puntos solo desde ZOOM_UMBRAL_MARCADORES
+    if agregacion:
+        with medir_etapa('agregacion'):
+            agregar_capa_agregada(mapa, df, API_ELEGIDA, capa_puntos)
+    
+    # Eventos por cuadros de tiempo con deslizador
+    if reproduccion:
+        with medir_etapa('reproduccion'):
+            agregar_capa_reproduccion(mapa, df, API_ELEGIDA)
+    
+    # Crear heatmap si hay suficientes datos (en vivo quedaría desactualizado)
+    if len(df) >= 5 and not en_vivo:
+        print("Añadiendo capa de heatmap...")
         
-        if datos_heatmap:
-            HeatMap(datos_heatmap, name="Mapa de calor", radius=15).add_to(mapa)
+        with medir_etapa('heatmap'):
+            if HEATMAP_CON_TIEMPO and 'fecha' in df.columns:
+                datos_heatmap, etiquetas = construir_heatmap_por_tiempo(df, API_ELEGIDA)
+                if datos_heatmap:
+                    HeatMapWithTime(datos_heatmap, index=etiquetas, name="Mapa de calor", radius=15).add_to(mapa)
+            else:
+                if fragmentos:
+                    datos_heatmap = combinar_heatmap_fragmentos(fragmentos)
+                else:
+                    datos_heatmap = construir_datos_heatmap(df, API_ELEGIDA)
+                if datos_heatmap:
+                    HeatMap(datos_heatmap, name="Mapa de calor", radius=15).add_to(mapa)
     
     # Añadir leyenda
     if API_ELEGIDA == "terremotos":
@@ -439,6 +2866,29 @@ def crear_mapa_interactivo(df):
             <p><span style="color: blue;">●</span> < 10°C (Frío)</p>
         </div>
         '''
+    elif API_ELEGIDA == "incendios":
+        leyenda_html = '''
+        <div style="
+            position: fixed; 
+            bottom: 50px; 
+            left: 50px; 
+            width: 180px; 
+            height: auto;
+            background-color: white; 
+            border: 2px solid grey; 
+            z-index: 9999; 
+            font-size: 12px;
+            padding: 10px;
+            border-radius: 5px;
+            box-shadow: 0 0 10px rgba(0,0,0,0.2);
+        ">
+            <h4 style="margin-top: 0;">Leyenda - Incendios</h4>
+            <p><span style="color: darkred;">●</span> FRP ≥ 100 MW (Muy intenso)</p>
+            <p><span style="color: red;">●</span> FRP 30-99 MW (Intenso)</p>
+            <p><span style="color: orange;">●</span> FRP 10-29 MW (Moderado)</p>
+            <p><span style="color: gold;">●</span> FRP < 10 MW (Débil)</p>
+        </div>
+        '''
     else:
         leyenda_html = '''
         <div style="
@@ -460,55 +2910,248 @@ def crear_mapa_interactivo(df):
         </div>
         '''
     
-    mapa.get_root().html.add_child(folium.Element(leyenda_html))
+    mapa.get_root().html.add_child(folium.Element(leyenda_html))
+    
+    # Añadir control de capas
+    folium.LayerControl(collapsed=False).add_to(mapa)
+    
+    # Añadir título al mapa
+    titulo = titulo or f"Mapa Interactivo - Datos de {API_ELEGIDA.capitalize()} en tiempo real"
+    agregar_titulo(mapa, titulo, f"{len(df)} registros")
+    
+    print("✓ Mapa creado exitosamente")
+    return mapa
+
+
+# Nombre de la capa y rótulo de la leyenda de cada fuente en el mapa de varias fuentes
+NOMBRES_CAPA = {"terremotos": "Terremotos", "clima": "Clima", "incendios": "Incendios"}
+ETIQUETAS_LEYENDA = {"terremotos": "Magnitud", "clima": "°C", "incendios": "FRP (MW)"}
+
+
+def leyenda_multicapa(fuentes):
+    """
+    Leyenda con los umbrales de color de cada fuente presente en el mapa.
+    """
+    secciones = []
+    for fuente in fuentes:
+        umbrales, colores, color_defecto = UMBRALES_COLOR.get(fuente, ([], [], 'blue'))
+        etiqueta = ETIQUETAS_LEYENDA.get(fuente, '')
+        lineas = [f'<p><span style="color: {color};">●</span> {etiqueta} ≥ {umbral}</p>'
+                  for umbral, color in zip(umbrales, colores)]
+        menor = f"{etiqueta} < {umbrales[-1]}" if umbrales else "Puntos de datos"
+        lineas.append(f'<p><span style="color: {color_defecto};">●</span> {menor}</p>')
+        secciones.append(f'<h4 style="margin: 5px 0;">{NOMBRES_CAPA.get(fuente, fuente)}</h4>' + ''.join(lineas))
+    
+    return f'''
+        <div style="
+            position: fixed; 
+            bottom: 50px; 
+            left: 50px; 
+            width: 180px; 
+            height: auto;
+            background-color: white; 
+            border: 2px solid grey; 
+            z-index: 9999; 
+            font-size: 12px;
+            padding: 10px;
+            border-radius: 5px;
+            box-shadow: 0 0 10px rgba(0,0,0,0.2);
+        ">
+            {''.join(secciones)}
+        </div>
+        '''
+
+
+def crear_mapa_multicapa(datos):
+    """
+    Crea un mapa con una capa de puntos y una de calor por fuente ({fuente: DataFrame}),
+    que se activan por separado desde el control de capas. Cada capa se construye por
+    su cuenta: si una falla, se omite y el resto se añade igual.
+    """
+    import folium
+    from folium.plugins import HeatMap
+    
+    print("Creando mapa interactivo de varias fuentes...")
+    mapa = crear_mapa_base()
+    
+    presentes = []
+    for fuente, df in datos.items():
+        nombre = NOMBRES_CAPA.get(fuente, fuente.capitalize())
+        try:
+            with medir_etapa('marcadores'):
+                if MODO_SALIDA == "geojson":
+                    agregar_capa_geojson(mapa, df, fuente, nombre=nombre)
+                else:
+                    agregar_capa_marcadores(mapa, df, fuente, nombre=nombre)
+            # Los heatmaps empiezan ocultos para no tapar los puntos de las otras capas
+            if len(df) >= 5:
+                with medir_etapa('heatmap'):
+                    datos_heatmap = construir_datos_heatmap(df, fuente)
+                    if datos_heatmap:
+                        HeatMap(datos_heatmap, name=f"Mapa de calor - {nombre}", radius=15, show=False).add_to(mapa)
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"✗ No se pudo construir la capa de {fuente}: {e}")
+            continue
+        presentes.append(fuente)
+        print(f"✓ Capa {nombre}: {len(df)} registros")
     
-    # Añadir control de capas
+    mapa.get_root().html.add_child(folium.Element(leyenda_multicapa(presentes)))
     folium.LayerControl(collapsed=False).add_to(mapa)
     
-    # Añadir título al mapa
-    titulo = f"Mapa Interactivo - Datos de {API_ELEGIDA.capitalize()} en tiempo real"
-    titulo_html = f'''
-    <div style="
-        position: fixed; 
-        top: 10px; 
-        left: 50%; 
-        transform: translateX(-50%);
-        z-index: 9999; 
-        font-size: 16px; 
-        font-weight: bold;
-        background-color: white; 
-        padding: 10px 20px;
-        border-radius: 5px;
-        box-shadow: 0 0 10px rgba(0,0,0,0.2);
-        border: 2px solid #0078A8;
-        text-align: center;
-    ">
-        {titulo}<br>
-        <span style="font-size: 12px; font-weight: normal;">
-            Actualizado: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Datos: {len(df)} registros
-        </span>
-    </div>
-    '''
-    mapa.get_root().html.add_child(folium.Element(titulo_html))
+    titulo = "Mapa Interactivo - " + ", ".join(NOMBRES_CAPA.get(f, f) for f in presentes)
+    detalle = ", ".join(f"{len(datos[f])} {NOMBRES_CAPA.get(f, f).lower()}" for f in presentes)
+    agregar_titulo(mapa, titulo, detalle)
     
     print("✓ Mapa creado exitosamente")
     return mapa
 
 
+def preparar_exportacion(df, binario):
+    """
+    Ajusta los tipos antes de exportar. En formatos binarios 'fecha' pasa a datetime64 y
+    los textos repetidos a categorías; en CSV se redondean las coordenadas (5 decimales,
+    ~1 m) para no escribir toda la precisión de float64 como texto.
+    """
+    df = df.copy()
+    redondeo = {'lat': 5, 'lon': 5, 'profundidad': 3}
+    for columna, decimales in redondeo.items():
+        if columna in df.columns and pd.api.types.is_float_dtype(df[columna]):
+            df[columna] = df[columna].astype(float).round(decimales)
+    
+    if binario:
+        if 'fecha' in df.columns:
+            df['fecha'] = pd.to_datetime(df['fecha'], errors='coerce')
+        for columna in ('tipo', 'descripcion', 'ciudad'):
+            if columna in df.columns:
+                df[columna] = df[columna].astype('category')
+    return df
+
+
+def _escribir_csv(df, ruta, compresion=None):
+    fechas_como_texto(df).to_csv(ruta, index=False, encoding='utf-8', compression=compresion)
+
+
+def _escribir_parquet(df, ruta):
+    df.to_parquet(ruta, index=False)
+
+
+def _escribir_feather(df, ruta):
+    df.reset_index(drop=True).to_feather(ruta)
+
+
+def _leer_csv(ruta):
+    return pd.read_csv(ruta, encoding='utf-8')
+
+
+# Formato → (extensión, módulo opcional requerido, escritura, lectura, binario)
+FORMATOS_DISPONIBLES = {
+    "csv": ("csv", None, _escribir_csv, _leer_csv, False),
+    "csv.gz": ("csv.gz", None, functools.partial(_escribir_csv, compresion='gzip'), _leer_csv, False),
+    "csv.zst": ("csv.zst", "zstandard", functools.partial(_escribir_csv, compresion='zstd'), _leer_csv, False),
+    "parquet": ("parquet", "pyarrow", _escribir_parquet, pd.read_parquet, True),
+    "feather": ("feather", "pyarrow", _escribir_feather, pd.read_feather, True)
+}
+
+
+def clave_exportacion(df):
+    """
+    Clave de cada fila en el archivo histórico: id y versión ('actualizado') si existen;
+    si no, la clave del evento junto con su fecha (cada lectura de clima es una fila nueva).
+    """
+    if 'id' in df.columns:
+        version = df['actualizado'].astype(str) if 'actualizado' in df.columns else ''
+        return df['id'].astype(str) + '|' + version
+    return clave_evento(df) + '|' + df.get('fecha', pd.Series('', index=df.index)).astype(str)
+
+
+def exportar_incremental(df, formato, directorio=None):
+    """
+    Añade al archivo histórico del formato solo las filas no exportadas antes, en una
+    parte nueva por cada fecha: <directorio>/<formato>/fecha=AAAA-MM-DD/parte-<ms>.<ext>.
+    Retorna el número de filas escritas.
+    """
+    if formato not in FORMATOS_DISPONIBLES:
+        print(f"✗ Formato de exportación no válido: {formato}")
+        return 0
+    extension, modulo, escribir, _, binario = FORMATOS_DISPONIBLES[formato]
+    if modulo and importlib.util.find_spec(modulo) is None:
+        print(f"✗ El formato {formato} requiere el paquete '{modulo}' (pip install {modulo})")
+        return 0
+    
+    base = os.path.join(directorio or DIRECTORIO_EXPORTACION, formato)
+    os.makedirs(base, exist_ok=True)
+    ruta_claves = os.path.join(base, 'claves.npy')
+    exportadas = np.load(ruta_claves) if os.path.exists(ruta_claves) else np.empty(0, dtype=np.uint64)
+    
+    claves = pd.util.hash_pandas_object(clave_exportacion(df), index=False).to_numpy()
+    nuevas = ~np.isin(claves, exportadas)
+    if not nuevas.any():
+        print(f"✓ Exportación {formato}: sin filas nuevas")
+        return 0
+    
+    df_nuevo = preparar_exportacion(df.loc[nuevas], binario)
+    fechas = pd.to_datetime(df_nuevo.get('fecha', pd.Series(pd.NaT, index=df_nuevo.index)), errors='coerce')
+    particiones = fechas.dt.strftime('%Y-%m-%d').fillna('sin_fecha')
+    sello = int(time.time() * 1000)
+    
+    for particion, grupo in df_nuevo.groupby(particiones, sort=True):
+        carpeta = os.path.join(base, f"fecha={particion}")
+        os.makedirs(carpeta, exist_ok=True)
+        ruta = os.path.join(carpeta, f"parte-{sello}.{extension}")
+        temporal = os.path.join(carpeta, f".tmp_parte-{sello}.{extension}")
+        escribir(grupo, temporal)
+        os.replace(temporal, ruta)
+    
+    # Las claves se registran después de escribir las partes
+    with open(ruta_claves + '.tmp', 'wb') as f:
+        np.save(f, np.concatenate([exportadas, claves[nuevas]]))
+    os.replace(ruta_claves + '.tmp', ruta_claves)
+    
+    print(f"✓ Exportación {formato}: {int(nuevas.sum())} filas nuevas en {particiones.nunique()} particiones")
+    return int(nuevas.sum())
+
+
+def leer_exportacion(formato, directorio=None):
+    """
+    Lee todas las partes del archivo histórico de un formato en un solo DataFrame.
+    """
+    extension, _, _, leer, _ = FORMATOS_DISPONIBLES[formato]
+    base = os.path.join(directorio or DIRECTORIO_EXPORTACION, formato)
+    rutas = sorted(glob.glob(os.path.join(base, 'fecha=*', f"parte-*.{extension}")))
+    if not rutas:
+        return pd.DataFrame()
+    return pd.concat([leer(ruta) for ruta in rutas], ignore_index=True)
+
+
+def exportar_datos(df):
+    """
+    Exporta los datos como CSV y añade las filas nuevas al archivo histórico.
+    """
+    if df is None or df.empty:
+        return
+    
+    archivo_csv = "datos_exportados.csv"
+    fechas_como_texto(df).to_csv(archivo_csv, index=False, encoding='utf-8')
+    print(f"✓ Datos exportados como: {archivo_csv}")
+    
+    # Archivo histórico: solo se añaden las filas nuevas
+    for formato in FORMATOS_EXPORTACION:
+        exportar_incremental(df, formato)
+
+
 def guardar_y_abrir_mapa(mapa, df):
     """
     Guarda el mapa como archivo HTML y lo abre en el navegador.
+    Sin mapa (páginas por fragmento ya escritas) solo se exporta y se abre el índice.
     """
     try:
         # Guardar mapa
-        mapa.save(ARCHIVO_SALIDA)
-        print(f"✓ Mapa guardado como: {ARCHIVO_SALIDA}")
+        if mapa is not None:
+            guardar_mapa_atomico(mapa, ARCHIVO_SALIDA)
+            print(f"✓ Mapa guardado como: {ARCHIVO_SALIDA}")
         
-        # Exportar datos como CSV
-        if df is not None and not df.empty:
-            archivo_csv = "datos_exportados.csv"
-            df.to_csv(archivo_csv, index=False, encoding='utf-8')
-            print(f"✓ Datos exportados como: {archivo_csv}")
+        with medir_etapa('exportacion'):
+            exportar_datos(df)
         
         # Abrir en navegador
         ruta_completa = os.path.abspath(ARCHIVO_SALIDA)
@@ -529,19 +3172,28 @@ def main():
     print("=" * 60)
     print("       MAPA INTERACTIVO DE DATOS REALES")
     print("=" * 60)
-    print(f"Fuente de datos: {API_ELEGIDA.upper()}")
+    print(f"Fuente de datos: {', '.join(FUENTES_MAPA).upper() if FUENTES_MAPA else API_ELEGIDA.upper()}")
     print(f"Centro del mapa: Santiago, Chile")
     print(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("-" * 60)
     
+    # Varias fuentes: se obtienen a la vez y cada una va en su propia capa
+    if FUENTES_MAPA:
+        generar_mapa_multicapa(FUENTES_MAPA)
+        return
+    
     # Obtener datos
-    df = obtener_datos_api()
+    df = obtener_datos()
     
     # Validar que tenemos datos
     if df.empty:
         print("✗ No se pudieron obtener datos. Saliendo...")
         return
     
+    if FILTRO_RADIO_KM:
+        df = filtrar_por_radio(df, CENTER_COORDS, FILTRO_RADIO_KM)
+        print(f"✓ {len(df)} registros a menos de {FILTRO_RADIO_KM} km del centro del mapa")
+    
     # Mostrar estadísticas básicas
     print(f"\n📊 Estadísticas de datos:")
     print(f"   - Total de registros: {len(df)}")
@@ -551,8 +3203,15 @@ def main():
         print(f"   - Magnitud mínima: {df['magnitud'].min():.1f}")
         print(f"   - Magnitud promedio: {df['magnitud'].mean():.1f}")
     
-    # Crear mapa
-    mapa = crear_mapa_interactivo(df)
+    if ESTADISTICAS_CACHE:
+        print(f"   - Caché HTTP: {resumen_cache()}")
+    
+    # Crear mapa (o una página por fragmento más un índice)
+    if PAGINAS_POR_FRAGMENTO:
+        generar_paginas_fragmentadas(df)
+        mapa = None
+    else:
+        mapa = crear_mapa_interactivo(df)
     
     # Guardar y abrir
     if guardar_y_abrir_mapa(mapa, df):
@@ -565,25 +3224,714 @@ def main():
         print("\n✗ Error al generar el mapa")
 
 
-# Función para refrescar datos (opcional, comentada)
-def refrescar_datos(minutos=5):
+def combinar_fuentes(datos):
     """
-    Función para refrescar datos automáticamente cada X minutos.
-    Descomentar y adaptar para uso en tiempo real.
+    Une los DataFrames de varias fuentes ({fuente: DataFrame}) con una columna 'fuente'.
     """
-    # import time
-    # while True:
-    #     print(f"\n🔄 Refrescando datos... ({datetime.now().strftime('%H:%M:%S')})")
-    #     df = obtener_datos_api()
-    #     mapa = crear_mapa_interactivo(df)
-    #     mapa.save(ARCHIVO_SALIDA)
-    #     print(f"✓ Datos actualizados. Próxima actualización en {minutos} minutos.")
-    #     time.sleep(minutos * 60)
+    # Enteros con nulos (Int64) para que no pasen a float en las filas de otras fuentes
+    enteras = {c for df in datos.values() for c in df.columns if pd.api.types.is_integer_dtype(df[c])}
+    return pd.concat([df.astype({c: 'Int64' for c in enteras if c in df.columns}).assign(fuente=fuente)
+                      for fuente, df in datos.items()], ignore_index=True)
 
 
-if __name__ == "__main__":
-    # Ejecutar programa principal
-    main()
+def actualizar_datos(exportar=False):
+    """
+    Obtiene los datos sin crear el mapa ni importar folium: actualiza la caché HTTP y,
+    con MODO_INCREMENTAL, el almacén de terremotos. Con exportar=True escribe también el
+    CSV y el archivo histórico. Pensado para tareas programadas (cron).
+    """
+    print(f"Actualizando datos: {', '.join(FUENTES_MAPA) if FUENTES_MAPA else API_ELEGIDA}")
+    if FUENTES_MAPA:
+        datos = obtener_fuentes_concurrente(FUENTES_MAPA)
+        df = combinar_fuentes(datos) if datos else pd.DataFrame()
+    else:
+        df = obtener_datos()
+    
+    if FILTRO_RADIO_KM and not df.empty:
+        df = filtrar_por_radio(df, CENTER_COORDS, FILTRO_RADIO_KM)
+    if df.empty:
+        print("✗ No se pudieron obtener datos")
+        return None
+    
+    print(f"✓ {len(df)} registros actualizados")
+    if ESTADISTICAS_CACHE:
+        print(f"   - Caché HTTP: {resumen_cache()}")
+    if exportar:
+        with medir_etapa('exportacion'):
+            exportar_datos(df)
+    return df
+
+
+def generar_mapa_multicapa(fuentes):
+    """
+    Obtiene las fuentes en paralelo, crea una capa por fuente, guarda el mapa y exporta
+    todos los registros juntos (con una columna 'fuente').
+    """
+    datos = obtener_fuentes_concurrente(fuentes)
+    if FILTRO_RADIO_KM:
+        datos = {f: filtrar_por_radio(df, CENTER_COORDS, FILTRO_RADIO_KM) for f, df in datos.items()}
+    datos = {f: df for f, df in datos.items() if not df.empty}
+    if not datos:
+        print("✗ No se pudieron obtener datos de ninguna fuente. Saliendo...")
+        return
+    
+    print(f"\n📊 Estadísticas de datos:")
+    for fuente, df in datos.items():
+        print(f"   - {NOMBRES_CAPA.get(fuente, fuente)}: {len(df)} registros")
+    if ESTADISTICAS_CACHE:
+        print(f"   - Caché HTTP: {resumen_cache()}")
+    
+    mapa = crear_mapa_multicapa(datos)
+    df = combinar_fuentes(datos)
+    
+    if guardar_y_abrir_mapa(mapa, df):
+        print("\n" + "=" * 60)
+        print("✅ ¡Mapa generado exitosamente!")
+        print(f"📁 Archivo: {ARCHIVO_SALIDA}")
+        print("=" * 60)
+    else:
+        print("\n✗ Error al generar el mapa")
+
+
+def guardar_mapa_atomico(mapa, ruta):
+    """
+    Renderiza el mapa y lo escribe de forma atómica (temporal + renombrado), para que
+    quien esté viendo el archivo nunca lea un HTML a medio escribir.
+    """
+    with medir_etapa('render'):
+        html = mapa.get_root().render()
+    with medir_etapa('escritura'):
+        escribir_atomico(ruta, html)
+
+
+def archivos_auxiliares(ruta_html):
+    """
+    Nombres de los archivos que acompañan a una página (puntos, detalles y niveles de
+    agregación), junto a ella y con su mismo nombre base, para que no se pisen entre páginas.
+    """
+    base = os.path.splitext(ruta_html)[0]
+    return {
+        'ARCHIVO_GEOJSON': f"{base}.geojson",
+        'ARCHIVO_DETALLES': f"{base}_detalles.json",
+        'ARCHIVO_NIVELES': f"{base}_nivel_{{zoom}}.json"
+    }
+
+
+def generar_pagina_fragmento(df, ruta):
+    """
+    Trabajo de un proceso: crea y guarda el mapa completo de un fragmento.
+    """
+    with configuracion_temporal(**archivos_auxiliares(ruta)):
+        guardar_mapa_atomico(crear_mapa_interactivo(df), ruta)
+    return ruta
+
+
+def generar_paginas_fragmentadas(df, procesos=None, archivo_indice=None):
+    """
+    Genera en paralelo una página HTML por fragmento (<salida>_parte_N.html) y escribe
+    en archivo_indice una página con enlaces a cada una. Retorna las rutas de las páginas.
+    """
+    procesos = max(1, procesos or PROCESOS_RENDER)
+    archivo_indice = archivo_indice or ARCHIVO_SALIDA
+    base, extension = os.path.splitext(archivo_indice)
+    
+    fragmentos = dividir_en_fragmentos(df, procesos)
+    rutas = [f"{base}_parte_{numero}{extension}" for numero in range(1, len(fragmentos) + 1)]
+    print(f"Creando {len(fragmentos)} páginas en {procesos} procesos...")
+    ejecutar_en_procesos(generar_pagina_fragmento, list(zip(fragmentos, rutas)), procesos)
+    
+    filas = "".join(
+        f'<li><a href="{os.path.basename(ruta)}">Parte {numero}</a> — '
+        f'{describir_fragmento(fragmento)} ({len(fragmento)} registros)</li>'
+        for numero, (fragmento, ruta) in enumerate(zip(fragmentos, rutas), start=1)
+    )
+    indice_html = f"""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>Mapa Interactivo - {API_ELEGIDA.capitalize()}</title></head>
+<body style="font-family: sans-serif; margin: 40px;">
+    <h2>Mapa Interactivo - Datos de {API_ELEGIDA.capitalize()}</h2>
+    <p>Actualizado: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Datos: {len(df)} registros
+       en {len(fragmentos)} páginas</p>
+    <ul>{filas}</ul>
+</body>
+</html>
+"""
+    escribir_atomico(archivo_indice, indice_html)
+    print(f"✓ Índice de páginas guardado como: {archivo_indice}")
+    return rutas
+
+
+def cargar_vistas(ruta=None):
+    """
+    Lee el archivo de vistas del modo lote (JSON con "fuente" y una lista "vistas") y
+    completa cada vista con los valores por defecto. Retorna (fuente, vistas).
+    Lanza ValueError si el archivo no define vistas válidas.
+    """
+    ruta = ruta or ARCHIVO_VISTAS
+    with open(ruta, 'r', encoding='utf-8') as f:
+        configuracion = json.load(f)
+    
+    fuente = configuracion.get('fuente', API_ELEGIDA)
+    if fuente not in FUENTES_DATOS:
+        raise ValueError(f"{ruta}: fuente desconocida '{fuente}'")
+    vistas = []
+    for numero, vista in enumerate(configuracion.get('vistas', []), start=1):
+        nombre = vista.get('nombre', f"vista_{numero}")
+        bbox = vista.get('bbox')
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError(f"{ruta}: el bbox de '{nombre}' debe ser [lat_min, lat_max, lon_min, lon_max]")
+        vistas.append({
+            'nombre': nombre,
+            'titulo': vista.get('titulo', f"Mapa Interactivo - {nombre}"),
+            'centro': vista.get('centro', CENTER_COORDS),
+            'zoom': vista.get('zoom', ZOOM_INICIAL),
+            'bbox': bbox,
+            'magnitud_minima': vista.get('magnitud_minima'),
+            'magnitud_maxima': vista.get('magnitud_maxima'),
+            'salida': vista.get('salida', f"mapa_{nombre}.html")
+        })
+    
+    if not vistas:
+        raise ValueError(f"{ruta}: no hay vistas definidas")
+    salidas = [vista['salida'] for vista in vistas]
+    if len(set(salidas)) != len(salidas):
+        raise ValueError(f"{ruta}: dos vistas escriben en el mismo archivo")
+    return fuente, vistas
+
+
+def preparar_lote(df, tipo_dato):
+    """
+    Trabajo común a todas las vistas del lote, hecho una sola vez: valida coordenadas,
+    serializa cada punto con su estilo según MODO_SALIDA, calcula los pesos del heatmap
+    y construye el IndiceEspacial. Cada vista solo elige posiciones y une textos.
+    """
+    estilo = tipo_dato if tipo_dato in ESTILO_MARCADOR else "otro"
+    df, lat, lon = validar_coordenadas(df)
+    df = df.reset_index(drop=True)
+    
+    if MODO_SALIDA == "geojson":
+        elementos = construir_geojson_compacto(df, estilo)['features']
+    else:
+        elementos = construir_datos_marcadores(df, estilo).values.tolist()
+    lat, lon = lat.to_numpy(dtype=float), lon.to_numpy(dtype=float)
     
-    # Para usar la función de refresco automático, descomentar:
-    # refrescar_datos(minutos=10)
+    return {
+        'df': df,
+        'puntos': [a_json_compacto(elemento) for elemento in elementos],
+        'lat': lat,
+        'lon': lon,
+        'pesos': pesos_heatmap(df, tipo_dato),
+        'magnitud': pd.to_numeric(df['magnitud'], errors='coerce').to_numpy(dtype=float)
+                    if 'magnitud' in df.columns else None,
+        'indice': IndiceEspacial(lat, lon)
+    }
+
+
+def posiciones_vista(preparado, vista):
+    """
+    Posiciones (en orden) de los puntos de una vista: bbox con el índice espacial y
+    magnitud en [magnitud_minima, magnitud_maxima).
+    """
+    if vista['bbox']:
+        posiciones = preparado['indice'].consultar_bbox(*vista['bbox'])
+    else:
+        posiciones = np.arange(len(preparado['df']))
+    
+    magnitud = preparado['magnitud']
+    if magnitud is not None and vista['magnitud_minima'] is not None:
+        posiciones = posiciones[magnitud[posiciones] >= vista['magnitud_minima']]
+    if magnitud is not None and vista['magnitud_maxima'] is not None:
+        posiciones = posiciones[magnitud[posiciones] < vista['magnitud_maxima']]
+    return posiciones
+
+
+def fragmento_vista(preparado, posiciones):
+    """
+    Fragmento de capa (como construir_fragmento) de las posiciones indicadas, uniendo
+    los puntos ya serializados en lugar de volver a construirlos.
+    """
+    puntos = ','.join([preparado['puntos'][i] for i in posiciones])
+    if MODO_SALIDA == "geojson":
+        puntos = '{"type":"FeatureCollection","features":[' + puntos + ']}'
+    else:
+        puntos = '[' + puntos + ']'
+    heatmap = (preparado['lat'][posiciones], preparado['lon'][posiciones], preparado['pesos'][posiciones])
+    return {'puntos': puntos, 'heatmap': heatmap, 'filas': len(posiciones)}
+
+
+# Datos preparados del lote en cada proceso hijo (los recibe una vez, al iniciarse)
+LOTE_PREPARADO = {}
+
+
+def iniciar_proceso_lote(configuracion, preparado):
+    """
+    Inicializador de los procesos del lote: configuración y datos preparados.
+    """
+    aplicar_configuracion(configuracion)
+    LOTE_PREPARADO.update(preparado)
+
+
+def generar_vista(vista, preparado=None):
+    """
+    Crea y guarda el mapa de una vista del lote con su centro, zoom y título.
+    Retorna (nombre, salida, registros, segundos).
+    """
+    preparado = preparado or LOTE_PREPARADO
+    inicio = time.perf_counter()
+    
+    posiciones = posiciones_vista(preparado, vista)
+    df = preparado['df'].iloc[posiciones]
+    # Con agregación la página no lleva los puntos: van a los archivos auxiliares de la vista
+    fragmentos = None
+    if len(posiciones) and not AGREGACION_ESPACIAL:
+        fragmentos = [fragmento_vista(preparado, posiciones)]
+    
+    directorio = os.path.dirname(vista['salida'])
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with configuracion_temporal(CENTER_COORDS=vista['centro'], ZOOM_INICIAL=vista['zoom'],
+                                **archivos_auxiliares(vista['salida'])):
+        mapa = crear_mapa_interactivo(df, fragmentos=fragmentos, titulo=vista['titulo'])
+    guardar_mapa_atomico(mapa, vista['salida'])
+    return vista['nombre'], vista['salida'], len(df), time.perf_counter() - inicio
+
+
+def generar_lote(ruta_vistas=None, procesos=None):
+    """
+    Modo lote: obtiene los datos una sola vez y genera un mapa por cada vista del
+    archivo de vistas, en PROCESOS_LOTE procesos. Informa del rendimiento en mapas
+    por minuto. Retorna la lista de (nombre, salida, registros, segundos) generados.
+    """
+    global API_ELEGIDA
+    procesos = max(1, procesos or PROCESOS_LOTE)
+    try:
+        fuente, vistas = cargar_vistas(ruta_vistas)
+    except (OSError, ValueError) as e:
+        print(f"✗ Error al leer las vistas: {e}")
+        return []
+    API_ELEGIDA = fuente
+    print(f"Modo lote: {len(vistas)} vistas de {fuente} en {procesos} procesos")
+    
+    inicio = time.perf_counter()
+    df = obtener_datos(fuente)
+    if df.empty:
+        print("✗ No se pudieron obtener datos. Saliendo...")
+        return []
+    with medir_etapa('preparacion'):
+        preparado = preparar_lote(df, fuente)
+    print(f"✓ {len(preparado['df'])} registros preparados en {time.perf_counter() - inicio:.1f} s")
+    
+    resultados = []
+    if procesos > 1 and len(vistas) > 1:
+        with ProcessPoolExecutor(max_workers=min(procesos, len(vistas)), initializer=iniciar_proceso_lote,
+                                 initargs=(configuracion_actual(), preparado)) as ejecutor:
+            # Además de los errores de cada vista, el pool puede fallar al arrancar un proceso
+            # (pickling con spawn) o romperse si uno muere (BrokenProcessPool): se informan
+            # por vista y el resto del lote sigue
+            futuros = []
+            for vista in vistas:
+                try:
+                    futuros.append((vista, ejecutor.submit(generar_vista, vista)))
+                except Exception as e:
+                    print(f"  ✗ Error al generar la vista {vista['nombre']}: {e}")
+            for vista, futuro in futuros:
+                try:
+                    resultados.append(futuro.result())
+                except Exception as e:
+                    print(f"  ✗ Error al generar la vista {vista['nombre']}: {e}")
+    else:
+        for vista in vistas:
+            try:
+                resultados.append(generar_vista(vista, preparado))
+            except (OSError, ValueError) as e:
+                print(f"  ✗ Error al generar la vista {vista['nombre']}: {e}")
+    
+    total = time.perf_counter() - inicio
+    for nombre, salida, registros, segundos in resultados:
+        print(f"  ✓ {nombre}: {registros} registros → {salida} ({segundos:.2f} s)")
+    print(f"✓ {len(resultados)} de {len(vistas)} mapas en {total:.1f} s "
+          f"({len(resultados) / total * 60:.0f} mapas por minuto)")
+    return resultados
+
+
+def huella_datos(df, tipo_dato=None):
+    """
+    Calcula una huella del contenido del DataFrame para detectar si cambió.
+    En clima se ignora 'fecha', que es la hora de la consulta y cambia siempre.
+    """
+    tipo_dato = tipo_dato or API_ELEGIDA
+    if tipo_dato == "clima":
+        df = df.drop(columns=['fecha'], errors='ignore')
+    
+    huella = hashlib.sha256(','.join(map(str, df.columns)).encode('utf-8'))
+    huella.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return huella.hexdigest()
+
+
+def refrescar_datos(minutos=5, ciclos=None):
+    """
+    Refresca los datos automáticamente cada X minutos.
+    Solo vuelve a generar el mapa cuando los datos cambian y muestra el tiempo de
+    cada etapa (descarga, procesado, render, escritura) en cada ciclo.
+    """
+    intervalo = minutos * 60
+    huella_anterior = None
+    proximo = time.monotonic()
+    ciclo = 0
+    
+    try:
+        while ciclos is None or ciclo < ciclos:
+            ciclo += 1
+            reiniciar_metricas()
+            print(f"\n🔄 Refrescando datos... ({datetime.now().strftime('%H:%M:%S')})")
+            
+            # obtener_fuente no recurre a los datos de ejemplo: un fallo no debe pisar el mapa
+            df = obtener_fuente(API_ELEGIDA)
+            huella = None if df is None else huella_datos(df)
+            
+            if df is None:
+                print("✗ No se obtuvieron datos; se conserva el mapa anterior")
+            elif huella == huella_anterior:
+                print("✓ Sin cambios en los datos; no se regenera el mapa")
+            else:
+                try:
+                    with medir_etapa('render'):
+                        mapa = crear_mapa_interactivo(df)
+                    guardar_mapa_atomico(mapa, ARCHIVO_SALIDA)
+                    huella_anterior = huella
+                    print(f"✓ Mapa actualizado: {ARCHIVO_SALIDA} ({len(df)} registros)")
+                except (IOError, OSError) as e:
+                    print(f"✗ Error al guardar el mapa: {e}")
+            
+            tiempos = ', '.join(f"{etapa} {METRICAS_ETAPAS.get(etapa, 0.0):.2f}s"
+                                for etapa in ('descarga', 'procesado', 'render', 'escritura'))
+            print(f"⏱️  Ciclo {ciclo}: {tiempos}")
+            if ESTADISTICAS_CACHE:
+                print(f"   Caché HTTP: {resumen_cache()}")
+            
+            if ciclos is not None and ciclo >= ciclos:
+                break
+            
+            # El temporizador es fijo: el tiempo del ciclo se descuenta de la espera
+            proximo += intervalo
+            espera = proximo - time.monotonic()
+            if espera < 0:
+                proximo = time.monotonic()
+                espera = 0
+            print(f"Próxima actualización en {espera / 60:.1f} minutos.")
+            time.sleep(espera)
+    
+    except KeyboardInterrupt:
+        print("\n✓ Refresco detenido por el usuario")
+
+
+class EstadoEnVivo:
+    """
+    Último conjunto de puntos publicado y clientes conectados al modo servir.
+    Cada actualización se compara con la anterior y solo se envían los cambios.
+    """
+    
+    def __init__(self, tipo_dato):
+        self.tipo_dato = tipo_dato
+        self.features = {}
+        self.clientes = []
+        self.candado = threading.Lock()
+    
+    def actualizar(self, df):
+        """
+        Reemplaza los puntos publicados. Retorna el delta {'cambios': [...], 'bajas': [...]}.
+        """
+        geojson = construir_geojson_compacto(df, self.tipo_dato, con_claves=True)
+        nuevos = {f['id']: f for f in geojson['features']}
+        
+        with self.candado:
+            cambios = [f for clave, f in nuevos.items()
+                       if clave not in self.features or self.comparable(self.features[clave]) != self.comparable(f)]
+            bajas = [clave for clave in self.features if clave not in nuevos]
+            self.features = nuevos
+            delta = {'cambios': cambios, 'bajas': bajas}
+            if cambios or bajas:
+                self.publicar('delta', delta)
+        
+        return delta
+    
+    def comparable(self, feature):
+        """
+        Feature sin los campos que cambian en cada consulta: en clima, 'fecha' es la hora
+        de la consulta (como en huella_datos) y marcaría todas las estaciones como cambiadas.
+        """
+        if self.tipo_dato != "clima":
+            return feature
+        propiedades = {k: v for k, v in feature['properties'].items() if k != 'fecha'}
+        return dict(feature, properties=propiedades)
+    
+    def suscribir(self):
+        """
+        Registra un cliente. Su cola empieza con el evento 'inicial' (todos los puntos).
+        """
+        cola = queue.Queue()
+        with self.candado:
+            cola.put(('inicial', {'cambios': list(self.features.values()), 'bajas': []}))
+            self.clientes.append(cola)
+        return cola
+    
+    def desuscribir(self, cola):
+        with self.candado:
+            if cola in self.clientes:
+                self.clientes.remove(cola)
+    
+    def publicar(self, evento, datos):
+        # Se serializa una sola vez para todos los clientes
+        mensaje = f"event: {evento}\ndata: {a_json_compacto(datos)}\n\n".encode('utf-8')
+        for cola in self.clientes:
+            cola.put(mensaje)
+
+
+class ManejadorMapaEnVivo(BaseHTTPRequestHandler):
+    """
+    Sirve el mapa base en / y el flujo de cambios (Server-Sent Events) en /eventos.
+    """
+    html = b''
+    estado = None
+    
+    def do_GET(self):
+        if self.path in ('/', '/index.html'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(self.html)))
+            self.end_headers()
+            self.wfile.write(self.html)
+        elif self.path == '/eventos':
+            self.enviar_eventos()
+        else:
+            self.send_error(404)
+    
+    def enviar_eventos(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        
+        cola = self.estado.suscribir()
+        try:
+            while True:
+                try:
+                    mensaje = cola.get(timeout=15)
+                except queue.Empty:
+                    # Comentario SSE para mantener viva la conexión y detectar desconexiones
+                    mensaje = b': ping\n\n'
+                if isinstance(mensaje, tuple):
+                    evento, datos = mensaje
+                    mensaje = f"event: {evento}\ndata: {a_json_compacto(datos)}\n\n".encode('utf-8')
+                self.wfile.write(mensaje)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.estado.desuscribir(cola)
+    
+    def log_message(self, formato, *args):
+        pass
+
+
+def servir_mapa(puerto=8000, minutos=1, host='127.0.0.1'):
+    """
+    Sirve el mapa en un servidor HTTP local y envía a los navegadores conectados
+    solo los puntos nuevos, modificados o eliminados en cada actualización.
+    """
+    df = obtener_datos()
+    estado = EstadoEnVivo(API_ELEGIDA)
+    estado.actualizar(df)
+    
+    mapa = crear_mapa_interactivo(df, en_vivo=True)
+    ManejadorMapaEnVivo.html = mapa.get_root().render().encode('utf-8')
+    ManejadorMapaEnVivo.estado = estado
+    
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorMapaEnVivo)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    print(f"🌐 Mapa en vivo disponible en http://{host}:{servidor.server_port}/")
+    
+    try:
+        while True:
+            time.sleep(minutos * 60)
+            print(f"\n🔄 Refrescando datos... ({datetime.now().strftime('%H:%M:%S')})")
+            # Sin datos de ejemplo: borrarían de los navegadores todos los puntos reales
+            df = obtener_fuente(API_ELEGIDA)
+            if df is None:
+                print("✗ No se obtuvieron datos; se conservan los puntos anteriores")
+                continue
+            delta = estado.actualizar(df)
+            print(f"✓ {len(delta['cambios'])} puntos nuevos o modificados, {len(delta['bajas'])} eliminados, "
+                  f"{len(estado.clientes)} clientes conectados")
+    except KeyboardInterrupt:
+        print("\n✓ Servidor detenido por el usuario")
+    finally:
+        servidor.shutdown()
+
+
+def resumir_peticiones(peticiones):
+    """
+    Agrupa las peticiones por fuente: cantidad, bytes, origen y latencias (p50, p95, máx).
+    """
+    resumen = {}
+    for fuente in sorted({p['fuente'] for p in peticiones}):
+        grupo = [p for p in peticiones if p['fuente'] == fuente]
+        totales = np.array([p['total_s'] for p in grupo])
+        resumen[fuente] = {
+            'peticiones': len(grupo),
+            'bytes': sum(p['bytes'] for p in grupo),
+            'por_origen': {origen: sum(p['origen'] == origen for p in grupo)
+                           for origen in sorted({p['origen'] for p in grupo})},
+            'p50_s': round(float(np.percentile(totales, 50)), 6),
+            'p95_s': round(float(np.percentile(totales, 95)), 6),
+            'max_s': round(float(totales.max()), 6)
+        }
+    return resumen
+
+
+def resumir_cprofile(perfilador, limite=25):
+    """
+    Las funciones con más tiempo acumulado según cProfile.
+    """
+    estadisticas = pstats.Stats(perfilador).stats
+    filas = sorted(estadisticas.items(), key=lambda item: item[1][3], reverse=True)[:limite]
+    return [
+        {
+            'funcion': f"{os.path.basename(archivo)}:{linea}({nombre})",
+            'llamadas': llamadas,
+            'tiempo_propio_s': round(propio, 6),
+            'tiempo_acumulado_s': round(acumulado, 6)
+        }
+        for (archivo, linea, nombre), (_, llamadas, propio, acumulado, _) in filas
+    ]
+
+
+def ejecutar_con_perfil(funcion, archivo, con_cprofile=False, con_tracemalloc=False):
+    """
+    Ejecuta funcion() y escribe en archivo un informe JSON con el tiempo por etapa, las
+    peticiones HTTP (bytes y latencia; por ciudad en clima) y la caché. Con tracemalloc se
+    añade la memoria por etapa; con cProfile, las funciones más costosas (el perfil
+    completo queda en <archivo>.prof para pstats o snakeviz).
+    """
+    reiniciar_metricas()
+    MEMORIA_PICO['bytes'] = 0
+    perfilador = cProfile.Profile() if con_cprofile else None
+    if con_tracemalloc:
+        tracemalloc.start()
+    if perfilador:
+        perfilador.enable()
+    
+    inicio = time.perf_counter()
+    try:
+        funcion()
+    finally:
+        total = time.perf_counter() - inicio
+        if perfilador:
+            perfilador.disable()
+        
+        informe = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'fuente': API_ELEGIDA,
+            'modo_salida': MODO_SALIDA,
+            'total_s': round(total, 6),
+            'etapas': {nombre: {clave: round(valor, 6) if isinstance(valor, float) else valor
+                                for clave, valor in detalle.items()}
+                       for nombre, detalle in DETALLE_ETAPAS.items()},
+            'peticiones': resumir_peticiones(METRICAS_PETICIONES),
+            'detalle_peticiones': list(METRICAS_PETICIONES),
+            'cache': ESTADISTICAS_CACHE
+        }
+        if con_tracemalloc:
+            MEMORIA_PICO['bytes'] = max(MEMORIA_PICO['bytes'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            informe['memoria_pico_bytes'] = MEMORIA_PICO['bytes']
+        if perfilador:
+            perfilador.dump_stats(archivo + '.prof')
+            informe['cprofile'] = resumir_cprofile(perfilador)
+        
+        escribir_atomico(archivo, json.dumps(informe, indent=2, ensure_ascii=False))
+        print(f"✓ Informe de perfil guardado como: {archivo}")
+
+
+def parsear_argumentos(argv=None):
+    """
+    Interpreta la línea de comandos.
+    Sin subcomando se genera el mapa una vez y se abre en el navegador.
+    """
+    parser = argparse.ArgumentParser(description="Mapa interactivo de datos reales")
+    parser.add_argument('--profile', action='store_true',
+                        help="Escribir un informe JSON de tiempos, peticiones y memoria")
+    parser.add_argument('--profile-salida', default='perfil_mapa.json', metavar='ARCHIVO',
+                        help="Archivo del informe de --profile (por defecto perfil_mapa.json)")
+    parser.add_argument('--cprofile', action='store_true', help="Con --profile, ejecutar también cProfile")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Con --profile, medir la memoria por etapa con tracemalloc")
+    parser.add_argument('--fuentes', nargs='+', choices=sorted(FUENTES_DATOS), metavar='FUENTE',
+                        help="Combinar varias fuentes en un mapa, una capa por fuente "
+                             f"({', '.join(sorted(FUENTES_DATOS))})")
+    subcomandos = parser.add_subparsers(dest='comando')
+    
+    refrescar = subcomandos.add_parser('refrescar', help="Regenerar el mapa periódicamente")
+    refrescar.add_argument('--minutos', type=float, default=5, help="Intervalo entre ciclos")
+    refrescar.add_argument('--ciclos', type=int, default=None,
+                           help="Número de ciclos a ejecutar (por defecto, sin límite)")
+    
+    subcomandos.add_parser('actualizar', aliases=['fetch'],
+                           help="Solo obtener los datos (caché HTTP y almacén), sin crear el mapa")
+    subcomandos.add_parser('exportar', aliases=['export'],
+                           help="Obtener los datos y exportarlos (CSV e histórico), sin crear el mapa")
+    
+    lote = subcomandos.add_parser('lote', aliases=['batch'],
+                                  help="Generar un mapa por vista de un archivo de vistas, con una sola descarga")
+    lote.add_argument('vistas', nargs='?', default=None,
+                      help=f"Archivo JSON de vistas (por defecto {ARCHIVO_VISTAS})")
+    lote.add_argument('--procesos', type=int, default=None,
+                      help=f"Vistas generadas a la vez (por defecto {PROCESOS_LOTE})")
+    
+    servir = subcomandos.add_parser('servir', help="Servir el mapa y enviar los cambios en vivo")
+    servir.add_argument('--puerto', type=int, default=8000)
+    servir.add_argument('--host', default='127.0.0.1')
+    servir.add_argument('--minutos', type=float, default=1, help="Intervalo entre actualizaciones")
+    
+    args = parser.parse_args(argv)
+    # Estos modos trabajan con una sola fuente (API_ELEGIDA, o la del archivo de vistas)
+    if args.fuentes and args.comando in ('refrescar', 'servir', 'lote', 'batch'):
+        parser.error(f"--fuentes no se puede usar con '{args.comando}', que genera el mapa de una sola fuente")
+    return args
+
+
+def ejecutar_comando(argv=None):
+    """
+    Ejecuta el subcomando indicado en la línea de comandos (con --profile, dentro del perfil).
+    Las advertencias de las librerías se silencian solo durante la ejecución.
+    """
+    global FUENTES_MAPA
+    args = parsear_argumentos(argv)
+    if args.fuentes:
+        FUENTES_MAPA = args.fuentes
+    
+    if args.comando == 'refrescar':
+        ejecutar = lambda: refrescar_datos(minutos=args.minutos, ciclos=args.ciclos)
+    elif args.comando == 'servir':
+        ejecutar = lambda: servir_mapa(puerto=args.puerto, minutos=args.minutos, host=args.host)
+    elif args.comando in ('actualizar', 'fetch'):
+        ejecutar = actualizar_datos
+    elif args.comando in ('exportar', 'export'):
+        ejecutar = lambda: actualizar_datos(exportar=True)
+    elif args.comando in ('lote', 'batch'):
+        ejecutar = lambda: generar_lote(args.vistas, args.procesos)
+    else:
+        # Ejecutar programa principal
+        ejecutar = main
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if args.profile:
+            ejecutar_con_perfil(ejecutar, args.profile_salida, args.cprofile, args.tracemalloc)
+        else:
+            ejecutar()
+
+
+if __name__ == "__main__":
+    ejecutar_comando()